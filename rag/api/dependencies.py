@@ -0,0 +1,25 @@
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+
+from rag.api.services.components import resolve_collection
+
+_COLLECTION_DESCRIPTION = "Collection (tenant namespace); defaults to the server's COLLECTION_NAME"
+
+
+def collection_name(collection:Optional[str]=Query(default=None, description=_COLLECTION_DESCRIPTION)) -> str:
+    """collection to write into; created on first use"""
+    try:
+        return resolve_collection(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def existing_collection(collection:Optional[str]=Query(default=None, description=_COLLECTION_DESCRIPTION)) -> str:
+    """collection to read from; 404 if it was never created"""
+    try:
+        return resolve_collection(collection, must_exist=True)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
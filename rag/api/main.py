@@ -1,9 +1,27 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from rag.api.routers import health, stats, index, upload, query, delete
+from rag.core.config import settings
+from rag.api.routers import health, stats, index, upload, query, delete, jobs, reload, reindex
+from rag.api.services.jobs import get_job_queue
+from rag.api.services.warmup import warmup
+from rag.utility.helpers import set_torch_threads
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    # open the job store now, not on the first /jobs request: that fails
+    # jobs left queued/running by a worker that died before this start
+    get_job_queue()
+    set_torch_threads(settings.TORCH_NUM_THREADS)
+    # components load in a background thread so the server starts accepting
+    # connections (/health) immediately; /ready reports when it can serve
+    if settings.WARMUP_ON_STARTUP:
+        warmup.start()
+    yield
 
 def create_app():
-    app = FastAPI(title="Medical assistant by RAG api", version="0.1.0")
+    app = FastAPI(title="Medical assistant by RAG api", version="0.1.0", lifespan=lifespan)
 
     app.add_middleware(
         CORSMiddleware,
@@ -24,6 +42,9 @@ def create_app():
     app.include_router(upload.router)
     app.include_router(query.router)
     app.include_router(delete.router)
+    app.include_router(jobs.router)
+    app.include_router(reload.router)
+    app.include_router(reindex.router)
 
     return app
 
@@ -2,22 +2,24 @@ from fastapi import APIRouter, Query, HTTPException, Depends
 from pathlib import Path
 
 from rag.api.schemas.models import DeleteResponse
-from rag.api.services.components import get_vector_store
+from rag.api.services.indexing import delete_source
+from rag.api.dependencies import existing_collection
 from rag.core.security import verify_api_key
 
 router = APIRouter(prefix="/v1")
 
 @router.delete("/delete", response_model=DeleteResponse, dependencies=[Depends(verify_api_key)])
-def delete_by_source(source:str=Query(..., description="Path to the PDF to remove")):
+def delete_by_source(
+    source:str=Query(..., description="Path to the PDF to remove"),
+    collection:str=Depends(existing_collection),
+):
     p = Path(source).resolve()
     if not p.exists():
         pass
 
-    vs = get_vector_store()
-
     try:
-        vs.delete_by_source(str(p))
-        msg = f"Deleted items where source_file == {p}"
+        delete_source(p, collection=collection)
+        msg = f"Deleted items where source_file == {p} from {collection}"
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Delete failed: {e}")
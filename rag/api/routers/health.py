@@ -1,6 +1,8 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 
 from rag.core.config import settings
+from rag.api.services.warmup import warmup
 
 router = APIRouter()
 
@@ -9,4 +11,15 @@ def health():
     return {
         "status":True,
         "collection":settings.COLLECTION_NAME,
-    }
\ No newline at end of file
+    }
+
+@router.get("/ready")
+def ready():
+    """
+    503 until the startup warm-up (model load, warm-up encode and store query)
+    has finished; use this for load-balancer / deploy health checks.
+    """
+    if not settings.WARMUP_ON_STARTUP and not warmup.ready:
+        warmup.start()
+    state = warmup.status()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
@@ -3,26 +3,32 @@ from fastapi import APIRouter, Query, HTTPException, Depends
 from pathlib import Path
 
 from rag.api.schemas.models import IndexResponse
-from rag.core.config import settings
 from rag.core.security import verify_api_key
-from rag.api.services.indexing import build_index
+from rag.api.services.indexing import submit_index_job
+from rag.api.services.components import collection_data_dir
+from rag.api.dependencies import collection_name
 
 
 router = APIRouter(prefix="/v1")
 
 @router.post("/index", response_model=IndexResponse, dependencies=[Depends(verify_api_key)])
-def index_corpus(data_dir:str | None = Query(default=None, description="Optional override for data dir")):
+def index_corpus(
+    data_dir:str | None = Query(default=None, description="Optional override for data dir"),
+    collection:str = Depends(collection_name),
+):
     """
-    (Re)-indexing PDFs undex settings.DATA_DIR (or a provided directory).
+    (Re)-indexing PDFs undex settings.DATA_DIR (or a provided directory) into a collection;
+    other collections index settings.COLLECTIONS_DATA_DIR/<collection> by default.
+    Runs as a background job; poll GET /v1/jobs/{job_id} for progress.
     """
 
-    dir_path = Path(data_dir) if data_dir else settings.DATA_DIR
+    dir_path = Path(data_dir) if data_dir else collection_data_dir(collection)
     if not dir_path.exists():
         raise HTTPException(status_code=400, detail=f"data directory not found: {dir_path}")
-    added, total = build_index(dir_path)
+    job_id = submit_index_job(dir_path, collection=collection)
     return IndexResponse(
-        added=added,
-        total_in_collection=total,
-        message="Indexing complete",
+        job_id=job_id,
+        status="queued",
+        message="Indexing job queued",
     )
 
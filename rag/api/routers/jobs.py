@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List
+
+from rag.api.schemas.models import JobResponse
+from rag.api.services.jobs import get_job_queue
+from rag.core.security import verify_api_key
+
+router = APIRouter(prefix="/v1")
+
+@router.get("/jobs", response_model=List[JobResponse], dependencies=[Depends(verify_api_key)])
+def list_jobs(limit:int=Query(default=20, ge=1, le=200)):
+    """
+    most recent indexing jobs, newest first
+    """
+    return [JobResponse(**j) for j in get_job_queue().store.list(limit=limit)]
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, dependencies=[Depends(verify_api_key)])
+def get_job(job_id:str):
+    """
+    status and progress (pages parsed, chunks embedded, vectors upserted) of an indexing job
+    """
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job not found: {job_id}")
+    return JobResponse(**job)
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobResponse, dependencies=[Depends(verify_api_key)])
+def cancel_job(job_id:str):
+    """
+    request cancellation; a running job stops at its next checkpoint,
+    keeping the batches it already upserted
+    """
+    queue = get_job_queue()
+    if queue.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"job not found: {job_id}")
+    queue.cancel(job_id)
+    return JobResponse(**queue.store.get(job_id))
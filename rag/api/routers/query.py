@@ -1,31 +1,121 @@
 from __future__ import annotations
+import json
+from typing import Any, Dict, Optional
+
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 
-from rag.api.schemas.models import QueryResponse, QueryRequest
+from rag.api.schemas.models import QueryResponse, QueryRequest, BatchQueryRequest, BatchQueryResponse, BatchQueryItem
 from rag.core.config import settings 
-from rag.api.services.retrieval import run_rag_query, citations_from_results
+from rag.api.services.retrieval import arun_rag_query, arun_rag_batch, astream_rag_query, citations_from_results
 from rag.core.security import verify_api_key
+from rag.api.dependencies import existing_collection
 
 router = APIRouter(prefix="/v1")
 
+def _check_provider(provider:str):
+    if provider == "grok" and not settings.GROK_API_KEY:
+        raise HTTPException(status_code=400, detail="GROK request, but API-key is not set")
+    if provider == "hf" and not settings.HF_TOKEN:
+        raise HTTPException(status_code=400, detail="HF Endpoint request, but HF token is not set")
+
+def _filters(req) -> Optional[Dict[str, Any]]:
+    return req.filters.model_dump(exclude_none=True) if req.filters else None
+
+def _sse(event:str, data:Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/query", response_model=QueryResponse, dependencies=[Depends(verify_api_key)])
-def query_rag(req:QueryRequest):
+async def query_rag(req:QueryRequest, collection:str=Depends(existing_collection)):
     """
     Ask any question related to Knowledge base
     returns Knowledge + LLM -> Answer and citations
     """
-    if req.provider == "grok" and not settings.GROK_API_KEY:
-        HTTPException(status_code=400, detail="GROK request, but API-key is not set")
-    if req.provider == "hf" and not settings.HF_TOKEN:
-        raise HTTPException(status_code=400, detail="HF Endpoint request, but HF token is not set")
+    _check_provider(req.provider)
     
-    answer, results, used = run_rag_query(
+    timings: Dict[str, float] = {}
+    answer, results, used = await arun_rag_query(
         question=req.question,
         provider=req.provider,
         top_k=req.top_k,
         score_threshold=req.score_threshold,
-        max_ctx_chars=req.max_ctx_chars
+        max_ctx_chars=req.max_ctx_chars,
+        mode=req.retrieval_mode,
+        rerank=req.rerank,
+        exact=req.exact_search,
+        filters=_filters(req),
+        collection=collection,
+        timings=timings,
     )
     cites = citations_from_results(results)
 
-    return QueryResponse(answer=answer, citations=cites, used_provider=used)
\ No newline at end of file
+    return QueryResponse(answer=answer, citations=cites, used_provider=used, timings=timings)
+
+@router.post("/query/stream", dependencies=[Depends(verify_api_key)])
+async def query_rag_stream(req:QueryRequest, collection:str=Depends(existing_collection)):
+    """
+    Same as /v1/query, streamed as Server-Sent Events:
+    `citations` first, then `token` events as the LLM generates, then `done`
+    (or `error` if generation fails mid-stream).
+    """
+    _check_provider(req.provider)
+
+    async def event_stream():
+        try:
+            async for event, payload in astream_rag_query(
+                question=req.question,
+                provider=req.provider,
+                top_k=req.top_k,
+                score_threshold=req.score_threshold,
+                max_ctx_chars=req.max_ctx_chars,
+                mode=req.retrieval_mode,
+                rerank=req.rerank,
+                exact=req.exact_search,
+                filters=_filters(req),
+                collection=collection,
+            ):
+                yield _sse(event, payload)
+        except Exception as e:
+            print(f"Streaming query failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse, dependencies=[Depends(verify_api_key)])
+async def query_rag_batch(req:BatchQueryRequest, collection:str=Depends(existing_collection)):
+    """
+    Ask many questions in one call (evaluation sets, multi-part questions).
+    Results come back in request order; a failing item reports `error`
+    instead of failing the whole batch.
+    """
+    _check_provider(req.provider)
+
+    items = await arun_rag_batch(
+        questions=req.questions,
+        provider=req.provider,
+        top_k=req.top_k,
+        score_threshold=req.score_threshold,
+        max_ctx_chars=req.max_ctx_chars,
+        mode=req.retrieval_mode,
+        rerank=req.rerank,
+        exact=req.exact_search,
+        filters=_filters(req),
+        collection=collection,
+    )
+    results = [
+        BatchQueryItem(
+            index=i,
+            question=q,
+            answer=item["answer"],
+            citations=citations_from_results(item["results"]),
+            used_provider=item["used_provider"],
+            error=item["error"],
+        )
+        for i, (q, item) in enumerate(zip(req.questions, items))
+    ]
+    return BatchQueryResponse(results=results, failed=sum(1 for r in results if r.error))
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Query, HTTPException, Depends
+
+from pathlib import Path
+
+from rag.api.schemas.models import IndexResponse
+from rag.core.security import verify_api_key
+from rag.api.services.components import collection_data_dir
+from rag.api.services.reindex import submit_reindex_job
+from rag.api.dependencies import collection_name
+
+
+router = APIRouter(prefix="/v1")
+
+@router.post("/reindex", response_model=IndexResponse, dependencies=[Depends(verify_api_key)])
+def reindex(
+    collection:str = Depends(collection_name),
+    data_dir:str | None = Query(default=None, description="Optional override for data dir"),
+    embedder_model:str | None = Query(default=None, description="Model to rebuild with (default: EMBEDDER_MODEL_NAME)"),
+    chunk_size:int | None = Query(default=None, ge=100, le=20000),
+    chunk_overlap:int | None = Query(default=None, ge=0, le=5000),
+):
+    """
+    Full blue/green rebuild of a collection (e.g. after changing the embedder model or chunking).
+    Builds a shadow collection in the background, validates it, then switches the
+    collection to it atomically; queries keep using the old one until then.
+    Poll GET /v1/jobs/{job_id} for progress.
+    """
+    dir_path = Path(data_dir) if data_dir else collection_data_dir(collection)
+    if not dir_path.exists():
+        raise HTTPException(status_code=400, detail=f"data directory not found: {dir_path}")
+    if chunk_size is not None and chunk_overlap is not None and chunk_overlap >= chunk_size:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+    job_id = submit_reindex_job(
+        collection=collection,
+        data_dir=dir_path,
+        embedder_model=embedder_model,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    return IndexResponse(
+        job_id=job_id,
+        status="queued",
+        message=f"Reindex of {collection} queued",
+    )
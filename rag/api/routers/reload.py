@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Query, HTTPException, Depends
+
+from rag.api.schemas.models import ReloadResponse
+from rag.core.security import verify_api_key
+from rag.api.services.components import reload_components, init_timings
+
+
+router = APIRouter(prefix="/v1")
+
+@router.post("/reload", response_model=ReloadResponse, dependencies=[Depends(verify_api_key)])
+def reload(
+    embedder:bool=Query(default=True, description="Reload the embedding model"),
+    vector_store:bool=Query(default=False, description="Reopen the vector store and lexical index"),
+):
+    """
+    Rebuild components in place (e.g. after changing the embedder model or backend)
+    without restarting the process. Fails with 409 while an indexing job is running.
+    """
+    try:
+        reloaded = reload_components(reload_embedder=embedder, reload_vector_store=vector_store)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+
+    return ReloadResponse(
+        reloaded=reloaded,
+        timings=init_timings(),
+        message=f"Reloaded: {', '.join(reloaded)}",
+    )
@@ -1,16 +1,18 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from rag.api.schemas.models import StatsResponse
-from rag.api.services.components import get_vector_store
-from rag.core.config import settings
+from rag.api.services.components import ensure_components, registry
+from rag.api.services.answer_cache import answer_cache
+from rag.api.dependencies import existing_collection
 
 router = APIRouter(prefix="/v1")
 
 @router.get("/stats", response_model=StatsResponse)
-def stats():
+def stats(collection:str=Depends(existing_collection)):
     """
-    return vector store collection name and number of stored chuns
+    return vector store collection name, number of stored chuns,
+    retrieval cache hit/miss counters and the open-collections registry
     """
-    vs = get_vector_store()
+    embedder, vs, retriever = ensure_components(collection)
     count = None
 
     try:
@@ -19,7 +21,21 @@ def stats():
     except Exception:
         count = None
     
+    cache = retriever.cache_stats()
+    if getattr(embedder, "cache", None) is not None:
+        cache["chunk_embeddings"] = embedder.cache.stats()
+    elif hasattr(embedder, "stats"):
+        # shared embedding server: its chunk cache plus micro-batching counters
+        server = embedder.stats()
+        if "chunk_embeddings" in server:
+            cache["chunk_embeddings"] = server.pop("chunk_embeddings")
+        cache["embedding_server"] = server
+    if answer_cache is not None:
+        cache["answers"] = answer_cache.stats()
+
     return StatsResponse(
-        collecion=settings.COLLECTION_NAME,
-        count=count
+        collecion=collection,
+        count=count,
+        cache=cache,
+        collections=registry.stats(),
     )
\ No newline at end of file
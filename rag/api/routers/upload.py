@@ -5,18 +5,20 @@ from typing import List
 from pathlib import Path
 
 from rag.api.schemas.models import UploadResponse
-from rag.core.config import settings
 from rag.core.security import verify_api_key
-from rag.api.services.indexing import build_index
+from rag.api.services.indexing import submit_files_job
+from rag.api.services.components import collection_data_dir
+from rag.api.dependencies import collection_name
 
 
 router = APIRouter(prefix="/v1")
 
 @router.post("/upload", response_model=UploadResponse, dependencies=[Depends(verify_api_key)])
-async def upload_and_index(files:List[UploadFile]=File(...)):
+async def upload_and_index(files:List[UploadFile]=File(...), collection:str=Depends(collection_name)):
     """
-    Upload extra knowledge bases (pdf files), save them under data/uploads folder.
-    Then, Index them.
+    Upload extra knowledge bases (pdf files), save them under data/uploads folder
+    (<COLLECTIONS_DATA_DIR>/<collection>/uploads for other collections).
+    Then, Index only the uploaded files in a background job (see GET /v1/jobs/{job_id}).
     """
     if not files:
         raise HTTPException(status_code=400, detail="No file is provided")
@@ -26,7 +28,7 @@ async def upload_and_index(files:List[UploadFile]=File(...)):
         if not f.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail=f"ONLY PDF files are allowed. You Provided {f.filename}")
     
-    upload_dir = Path(settings.DATA_DIR)/"uploads"
+    upload_dir = Path(collection_data_dir(collection))/"uploads"
     upload_dir.mkdir(parents=True, exist_ok=True)
 
     saved_paths:List[str] = []
@@ -37,11 +39,11 @@ async def upload_and_index(files:List[UploadFile]=File(...)):
             out.write(content)
         saved_paths.append(str(dest.resolve()))
     
-    added, total = build_index(upload_dir)
+    job_id = submit_files_job(saved_paths, collection=collection)
 
     return UploadResponse(
         saved_files=saved_paths,
-        added=added,
-        total_in_collection=total,
-        message="Uploaded & Indexed !!!",
+        job_id=job_id,
+        status="queued",
+        message="Uploaded, indexing job queued",
     )
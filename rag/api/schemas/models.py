@@ -1,42 +1,114 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Literal, Dict, Any
 
 from rag.core.config import settings
 
 class StatsResponse(BaseModel):
     collecion:str
     count:Optional[int]=None
+    cache:Optional[Dict[str, Dict[str, int]]]=None
+    collections:Optional[Dict[str, Any]]=None
 
 class IndexResponse(BaseModel):
-    added:int
-    total_in_collection:Optional[int] = None
+    job_id:str
+    status:str
+    message:str
+
+class ReloadResponse(BaseModel):
+    reloaded:List[str]
+    timings:Dict[str, float] = {}
     message:str
 
 class UploadResponse(BaseModel):
     saved_files:List[str]
-    added:int
-    total_in_collection: Optional[int] = None
+    job_id:str
+    status:str
     message: str
 
+class JobResponse(BaseModel):
+    job_id:str
+    kind:str
+    status:Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    params:Dict[str, Any] = {}
+    files_total:int = 0
+    files_done:int = 0
+    pages_parsed:int = 0
+    chunks_embedded:int = 0
+    vectors_upserted:int = 0
+    added:Optional[int] = None
+    total_in_collection:Optional[int] = None
+    error:Optional[str] = None
+    cancel_requested:bool = False
+    created_at:Optional[float] = None
+    started_at:Optional[float] = None
+    finished_at:Optional[float] = None
+
 class Citation(BaseModel):
     source_name: Optional[str] = None
     source_file: Optional[str] = None
     page: Optional[int] = None
     similarity: Optional[float] = None
+    rerank_score: Optional[float] = None
     id: Optional[str] = None
 
+class QueryFilters(BaseModel):
+    """restrict retrieval to matching chunks; all given filters must match"""
+    source_name:Optional[List[str]] = None
+    file_sha256:Optional[List[str]] = None
+    page_from:Optional[int] = Field(default=None, ge=0)
+    page_to:Optional[int] = Field(default=None, ge=0)
+    uploaded_after:Optional[datetime] = None
+    uploaded_before:Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def _check_ranges(self):
+        if self.page_from is not None and self.page_to is not None and self.page_from > self.page_to:
+            raise ValueError("page_from must be <= page_to")
+        if self.uploaded_after and self.uploaded_before and self.uploaded_after > self.uploaded_before:
+            raise ValueError("uploaded_after must be <= uploaded_before")
+        return self
+
 class QueryRequest(BaseModel):
     question:str=Field(..., min_length=1)
     provider:Literal["hf", "grok"] = "hf"
     top_k:int=Field(default=settings.TOP_K, ge=1, le=10)
     score_threshold:float=Field(default=settings.SCORE_THRESHOLD, ge=0.0, le=1.0)
     max_ctx_chars:int=Field(default=settings.MAX_CTX_CHARS, ge=500, le=50000)
+    retrieval_mode:Optional[Literal["vector", "hybrid"]] = None
+    rerank:Optional[bool] = None
+    exact_search:Optional[bool] = None
+    filters:Optional[QueryFilters] = None
 
 class QueryResponse(BaseModel):
     answer: str 
     citations:List[Citation] = []
     used_provider:Literal["hf", "grok"]
+    timings:Dict[str, float] = {}
+
+class BatchQueryRequest(BaseModel):
+    questions:List[str]=Field(..., min_length=1, max_length=settings.BATCH_QUERY_MAX)
+    provider:Literal["hf", "grok"] = "hf"
+    top_k:int=Field(default=settings.TOP_K, ge=1, le=10)
+    score_threshold:float=Field(default=settings.SCORE_THRESHOLD, ge=0.0, le=1.0)
+    max_ctx_chars:int=Field(default=settings.MAX_CTX_CHARS, ge=500, le=50000)
+    retrieval_mode:Optional[Literal["vector", "hybrid"]] = None
+    rerank:Optional[bool] = None
+    exact_search:Optional[bool] = None
+    filters:Optional[QueryFilters] = None
+
+class BatchQueryItem(BaseModel):
+    index:int
+    question:str
+    answer:Optional[str] = None
+    citations:List[Citation] = []
+    used_provider:Literal["hf", "grok"]
+    error:Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results:List[BatchQueryItem]
+    failed:int = 0
 
 class DeleteResponse(BaseModel):
     deleted_source:str
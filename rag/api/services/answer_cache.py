@@ -0,0 +1,142 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from rag.core.config import settings
+
+
+class _Bucket:
+    """question embeddings of one (collection, provider, generation params) namespace"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.chunk_ids: List[Optional[FrozenSet[str]]] = [None] * capacity
+        self.ctx_limits: List[Optional[int]] = [None] * capacity
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.ticks = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        # write version of the collection the answers were generated from
+        self.version: Optional[int] = None
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache for near-duplicate questions.
+    A cached answer is reused when the new question's embedding is within
+    `max_distance` cosine distance of a cached question AND retrieval returned
+    exactly the same chunk ids under the same context budget, so the LLM would
+    have seen the same context.
+    Entries live in a small numpy matrix per (collection, provider, generation
+    params) with LRU eviction; a namespace is emptied when its collection changes,
+    and at most `max_namespaces` of them are kept (least recently used dropped).
+    """
+
+    def __init__(
+            self,
+            max_entries: int = settings.ANSWER_CACHE_SIZE,
+            max_distance: float = settings.ANSWER_CACHE_MAX_DISTANCE,
+            max_namespaces: int = settings.ANSWER_CACHE_MAX_NAMESPACES,
+        ):
+        self.max_entries = max(1, int(max_entries))
+        self.max_distance = float(max_distance)
+        self.max_namespaces = max(1, int(max_namespaces))
+        self._buckets: "OrderedDict[Hashable, _Bucket]" = OrderedDict()
+        self._tick = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(q_emb) -> np.ndarray:
+        v = np.asarray(q_emb, dtype=np.float32).ravel()
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+    @staticmethod
+    def _check_version(bucket: _Bucket, version: int):
+        if bucket.version != version:
+            bucket.size = 0
+            bucket.version = version
+
+    def lookup(self, namespace: Hashable, q_emb, chunk_ids: List[str], version: int, max_ctx_chars: Optional[int] = None) -> Optional[str]:
+        q = self._unit(q_emb)
+        ids = frozenset(chunk_ids)
+        with self._lock:
+            bucket = self._buckets.get(namespace)
+            if bucket is not None:
+                self._buckets.move_to_end(namespace)
+                self._check_version(bucket, version)
+            if bucket is None or bucket.size == 0:
+                self.misses += 1
+                return None
+            sims = bucket.matrix[:bucket.size] @ q
+            for row in np.argsort(-sims):
+                if 1.0 - float(sims[row]) > self.max_distance:
+                    break
+                if bucket.chunk_ids[row] == ids and bucket.ctx_limits[row] == max_ctx_chars:
+                    self._tick += 1
+                    bucket.ticks[row] = self._tick
+                    self.hits += 1
+                    return bucket.answers[row]
+            self.misses += 1
+            return None
+
+    def store(self, namespace: Hashable, q_emb, chunk_ids: List[str], answer: str, version: int, max_ctx_chars: Optional[int] = None):
+        q = self._unit(q_emb)
+        with self._lock:
+            bucket = self._buckets.get(namespace)
+            if bucket is None:
+                while len(self._buckets) >= self.max_namespaces:
+                    self._buckets.popitem(last=False)
+                bucket = _Bucket(self.max_entries, q.shape[0])
+                self._buckets[namespace] = bucket
+            else:
+                self._buckets.move_to_end(namespace)
+            self._check_version(bucket, version)
+            if bucket.size < self.max_entries:
+                row = bucket.size
+                bucket.size += 1
+            else:
+                row = int(np.argmin(bucket.ticks))
+            self._tick += 1
+            bucket.matrix[row] = q
+            bucket.chunk_ids[row] = frozenset(chunk_ids)
+            bucket.ctx_limits[row] = max_ctx_chars
+            bucket.answers[row] = answer
+            bucket.ticks[row] = self._tick
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def drop(self, collection: str):
+        """forget the answers of one collection (e.g. when it is closed)"""
+        with self._lock:
+            for namespace in [k for k in self._buckets if isinstance(k, tuple) and k and k[0] == collection]:
+                del self._buckets[namespace]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": sum(b.size for b in self._buckets.values()),
+            "maxsize": self.max_entries,
+            "namespaces": len(self._buckets),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def generation_key(provider: str, collection: str = settings.COLLECTION_NAME) -> Tuple[Hashable, ...]:
+    """
+    answers are only shared within one collection, between requests with identical
+    generation params. Only server-side settings go in the key: request params
+    (max_ctx_chars) are matched per entry so clients cannot mint new namespaces.
+    """
+    if provider == "grok":
+        return (collection, "grok", settings.GROK_MODEL, settings.GROK_TEMPERATURE, settings.GROK_MAX_TOKENS)
+    return (collection, "hf", settings.HF_ENDPOINT_URL, settings.HF_TEMPERATURE, settings.HF_MAX_TOKENS)
+
+
+answer_cache: Optional[SemanticAnswerCache] = SemanticAnswerCache() if settings.ANSWER_CACHE_ENABLED else None
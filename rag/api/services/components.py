@@ -1,44 +1,466 @@
 from __future__ import annotations
-from typing import Optional
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from rag.core.config import settings
 from rag.pipeline.embedder import Embedder
-from rag.pipeline.vector_store import VectorStore
+from rag.pipeline.vector_store import BaseVectorStore, collection_exists, create_vector_store, stored_embedder_model
+from rag.pipeline.aliases import AliasTable
 from rag.pipeline.retriever import Retriever
+from rag.pipeline.lexical_index import BM25Index
+from rag.pipeline.embedding_server import ensure_embedding_server
 
-_EMBEDDER:Optional[Embedder] = None
-_VSTORE:Optional[VectorStore] = None
-_RETRIEVER:Optional[Retriever] = None
+Components = Tuple[Embedder, BaseVectorStore, Retriever]
 
-def ensure_components():
+# embedders by model name: every collection built with the same model shares one
+_EMBEDDERS:Dict[str, Embedder] = {}
+# single-flight: concurrent first callers wait on one in-progress build
+_INIT_LOCK = threading.Lock()
+# per-component construction time in ms, for startup profiling
+_INIT_TIMINGS:Dict[str, float] = {}
+
+_COLLECTION_NAME_RE = re.compile(settings.COLLECTION_NAME_PATTERN)
+
+# collection name (alias) -> physical collection serving it, see POST /v1/reindex
+aliases = AliasTable.for_store(settings.PERSIST_DIRECTORY_VS)
+
+
+class _Entry:
+    """one open collection: an immutable (embedder, vector store, retriever) triple, swapped as a whole"""
+    __slots__ = ("components", "pins")
+
+    def __init__(self, components:Components):
+        self.components = components
+        # writers (indexing, deletes) in progress; a pinned collection is never evicted
+        self.pins = 0
+
+
+class CollectionRegistry:
     """
-    Initializing sinletons once per process.
+    Open collections by name (alias), sharing one embedder per model.
+    A collection (vector store + lexical index + retriever) is opened on first
+    use; the least recently used idle ones are closed once more than `max_open`
+    are open or their estimated footprint exceeds `memory_budget_mb`.
+    Closed collections are simply reopened on their next request.
+    When the alias table changes (a reindex in another worker), affected
+    collections are rebuilt in the background and swapped in when ready.
     """
-    global _EMBEDDER, _VSTORE, _RETRIEVER
 
-    if _EMBEDDER is None:
-        _EMBEDDER = Embedder(
-            model_name=settings.EMBEDDER_MODEL_NAME,
+    def __init__(
+            self,
+            max_open:int=settings.COLLECTIONS_MAX_OPEN,
+            memory_budget_mb:int=settings.COLLECTIONS_MEMORY_BUDGET_MB,
+        ):
+        self.max_open = max(1, int(max_open))
+        self.memory_budget = max(0, int(memory_budget_mb)) * 1024 * 1024
+        self._entries:"OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # per-collection single-flight for opening
+        self._open_locks:Dict[str, threading.Lock] = {}
+        self.opened = 0
+        self.evicted = 0
+        self._alias_checked = 0.0
+        self._refreshing = False
+
+    def __contains__(self, name:str) -> bool:
+        return name in self._entries
+
+    def _lookup(self, name:str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+            return entry
+
+    def get(self, name:str) -> _Entry:
+        """the open entry for `name`, opening it (and evicting others) if needed"""
+        self._check_aliases()
+        entry = self._lookup(name)
+        if entry is not None:
+            return entry
+        with self._lock:
+            open_lock = self._open_locks.setdefault(name, threading.Lock())
+        with open_lock:
+            entry = self._lookup(name)
+            if entry is not None:
+                return entry
+            entry = _Entry(_build(name))
+            with self._lock:
+                self._entries[name] = entry
+                self.opened += 1
+        self.enforce(keep=name)
+        return entry
+
+    def install(self, name:str, components:Components):
+        """swap prebuilt (warmed) components in for `name`; requests already running keep the old ones"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self._entries[name] = _Entry(components)
+                self.opened += 1
+            else:
+                entry.components = components
+                self._entries.move_to_end(name)
+        self.enforce(keep=name)
+
+    def _check_aliases(self):
+        """every ALIAS_REFRESH_S, pick up alias swaps made by other processes"""
+        now = time.monotonic()
+        if now - self._alias_checked < settings.ALIAS_REFRESH_S:
+            return
+        self._alias_checked = now
+        if not aliases.reload_if_changed():
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_swapped, name="alias-refresh", daemon=True).start()
+
+    def _refresh_swapped(self):
+        try:
+            for name, entry in self.entries():
+                _, vs, _ = entry.components
+                if vs.collection_name == aliases.resolve(name):
+                    continue
+                print(f"Collection {name} now served by {aliases.resolve(name)}, reopening")
+                try:
+                    components = _build(name)
+                    warm(components)
+                    self.install(name, components)
+                except Exception as e:
+                    print(f"!! Reopening collection {name} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def pin(self, name:str) -> _Entry:
+        entry = self.get(name)
+        with self._lock:
+            entry.pins += 1
+        return entry
+
+    def unpin(self, entry:_Entry):
+        with self._lock:
+            entry.pins -= 1
+        # an indexing run may have grown the collection past the budget
+        self.enforce()
+
+    def entries(self) -> List[Tuple[str, _Entry]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def enforce(self, keep:Optional[str]=None) -> List[str]:
+        """close least recently used idle collections until within max_open and the memory budget"""
+        snapshot = self.entries()
+        sizes = {name: _footprint(entry.components) for name, entry in snapshot} if self.memory_budget else {}
+        total = sum(sizes.values())
+        victims:List[Tuple[str, _Entry]] = []
+        with self._lock:
+            n_open = len(self._entries)
+            for name, entry in list(self._entries.items()):
+                if n_open <= self.max_open and (not self.memory_budget or total <= self.memory_budget):
+                    break
+                if name == keep or entry.pins:
+                    continue
+                del self._entries[name]
+                victims.append((name, entry))
+                n_open -= 1
+                total -= sizes.get(name, 0)
+            self.evicted += len(victims)
+        for name, entry in victims:
+            _close(name, entry.components)
+        return [name for name, _ in victims]
+
+    def close_all(self) -> List[str]:
+        """close every idle collection (they reopen lazily); returns their names"""
+        with self._lock:
+            victims = [(name, e) for name, e in self._entries.items() if not e.pins]
+            for name, _ in victims:
+                del self._entries[name]
+        for name, entry in victims:
+            _close(name, entry.components)
+        return [name for name, _ in victims]
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.entries()
+        return {
+            "open": {name: describe(entry.components) for name, entry in snapshot},
+            "max_open": self.max_open,
+            "memory_budget_mb": self.memory_budget // (1024 * 1024),
+            "estimated_mb": round(sum(_footprint(e.components) for _, e in snapshot) / (1024 * 1024), 1),
+            "opened": self.opened,
+            "evicted": self.evicted,
+        }
+
+
+registry = CollectionRegistry()
+
+
+def resolve_collection(name:Optional[str]=None, must_exist:bool=False) -> str:
+    """
+    validated collection name (None -> settings.COLLECTION_NAME).
+    raises ValueError for a malformed name, and LookupError for a collection
+    that was never created when `must_exist` is set (the default collection
+    always exists).
+    """
+    if not name or name == settings.COLLECTION_NAME:
+        return settings.COLLECTION_NAME
+    # "__" is reserved for the physical collections behind an alias (<alias>__g<id>)
+    if not _COLLECTION_NAME_RE.fullmatch(name) or "__" in name:
+        raise ValueError(f"invalid collection name: {name!r}")
+    if must_exist and name not in registry and not collection_exists(aliases.resolve(name), settings.PERSIST_DIRECTORY_VS):
+        raise LookupError(f"collection not found: {name}")
+    return name
+
+
+def collection_data_dir(name:str) -> Path:
+    """where a collection's PDFs live: settings.DATA_DIR for the default collection"""
+    if name == settings.COLLECTION_NAME:
+        return settings.DATA_DIR
+    return settings.COLLECTIONS_DATA_DIR / name
+
+
+def index_config(collection:str) -> Dict[str, Any]:
+    """embedder model and chunking a collection was built with (settings for one never reindexed)"""
+    info = aliases.info(collection)
+    return {
+        "embedder_model": info.get("embedder_model") or settings.EMBEDDER_MODEL_NAME,
+        "chunk_size": int(info.get("chunk_size") or settings.CHUNK_SIZE),
+        "chunk_overlap": int(info["chunk_overlap"]) if info.get("chunk_overlap") is not None else settings.CHUNK_OVERLAP,
+    }
+
+
+def describe(components:Components) -> Dict[str, Any]:
+    """which physical collection and model serve a set of components"""
+    embedder, vs, _ = components
+    return {
+        "collection": vs.collection_name,
+        "embedder_model": embedder.model_name,
+        "model_matches_settings": embedder.model_name == settings.EMBEDDER_MODEL_NAME,
+    }
+
+
+def ensure_components(collection:Optional[str]=None) -> Components:
+    """
+    (embedder, vector store, retriever) of `collection` (default: settings.COLLECTION_NAME),
+    opened on first use. The embedder is the same instance for every collection.
+    """
+    return registry.get(collection or settings.COLLECTION_NAME).components
+
+
+@contextmanager
+def pinned_components(collection:Optional[str]=None) -> Iterator[Components]:
+    """ensure_components for writers: the collection is not evicted until the block exits"""
+    entry = registry.pin(collection or settings.COLLECTION_NAME)
+    try:
+        yield entry.components
+    finally:
+        registry.unpin(entry)
+
+
+def reload_components(
+        reload_embedder:bool=True,
+        reload_vector_store:bool=False,
+        embedder:Optional[Embedder]=None,
+    ) -> List[str]:
+    """
+    rebuild (or swap in) components without restarting the process, e.g.
+    after changing the embedder model/backend. Requests already running keep
+    the old objects; new ones get the new set once it is fully built.
+    `embedder` swaps in a prebuilt instance instead of loading one.
+    Applies to every open collection; with `reload_vector_store` they are
+    closed and reopen on their next request.
+    Refuses while an indexing run is in progress.
+    returns the names of the rebuilt components.
+    """
+    from rag.api.services.indexing import no_indexing
+    from rag.api.services.answer_cache import answer_cache
+
+    with no_indexing():
+        reloaded:List[str] = []
+        with _INIT_LOCK:
+            if embedder is not None or reload_embedder:
+                for old_embedder in _EMBEDDERS.values():
+                    if old_embedder.cache is not None:
+                        old_embedder.cache.flush()
+                # models other than the swapped-in one load again on first use
+                _EMBEDDERS.clear()
+                if embedder is not None:
+                    _EMBEDDERS[embedder.model_name] = embedder
+                reloaded.append("embedder")
+        if reload_vector_store:
+            registry.close_all()
+            reloaded.append("vector_store")
+        for name, entry in registry.entries():
+            _, vs, _ = entry.components
+            entry.components = _build(name, vector_store=vs)
+        reloaded.append("retriever")
+
+    # cached answers were produced with the old components
+    if answer_cache is not None:
+        answer_cache.clear()
+    print(f"Reloaded components: {', '.join(reloaded)}")
+    return reloaded
+
+
+def get_embedder(model_name:str=settings.EMBEDDER_MODEL_NAME) -> Embedder:
+    """the shared embedder for `model_name`, loaded on first use"""
+    embedder = _EMBEDDERS.get(model_name)
+    if embedder is not None:
+        return embedder
+
+    with _INIT_LOCK:
+        if model_name not in _EMBEDDERS:
+            _EMBEDDERS[model_name] = _load_embedder(model_name)
+        return _EMBEDDERS[model_name]
+
+
+def _load_embedder(model_name:str) -> Embedder:
+    t0 = time.perf_counter()
+    if settings.EMBEDDING_SERVER_ENABLED and model_name == settings.EMBEDDER_MODEL_NAME:
+        # the model lives in the shared sidecar; this is only a socket client
+        embedder = ensure_embedding_server()
+    else:
+        embedder = Embedder(
+            model_name=model_name,
             normalize=settings.NORMALIZE,
             batch_size=settings.BATCH_SIZE,
+            cache_dir=settings.EMBED_CACHE_DIR if settings.EMBED_CACHE_ENABLED else None,
         )
-    if _VSTORE is None:
-        _VSTORE = VectorStore(
-            collection_name=settings.COLLECTION_NAME,
+    _INIT_TIMINGS["embedder_ms"] = _ms_since(t0)
+    return embedder
+
+
+def _build(
+        collection:str,
+        vector_store:Optional[BaseVectorStore]=None,
+    ) -> Components:
+    """
+    open the physical collection behind alias `collection` unless its store is
+    passed in; the retriever (and its caches) is always new. The embedder is
+    the one for the model the collection was indexed with.
+    """
+    physical = vector_store.collection_name if vector_store is not None else aliases.resolve(collection)
+    model = _index_model(collection, physical)
+    embedder = get_embedder(model)
+    if vector_store is None:
+        t0 = time.perf_counter()
+        vector_store = create_vector_store(
+            collection_name=physical,
             persist_directory=settings.PERSIST_DIRECTORY_VS,
-            embedder_model_name=settings.EMBEDDER_MODEL_NAME
+            embedder_model_name=model
         )
-    
-    if _RETRIEVER is None:
-        _RETRIEVER = Retriever(
-            vector_store=_VSTORE,
-            embedding_manager=_EMBEDDER
+        _INIT_TIMINGS["vector_store_ms"] = _ms_since(t0)
+        t0 = time.perf_counter()
+        lexical = _open_lexical_index(vector_store)
+        _INIT_TIMINGS["lexical_index_ms"] = _ms_since(t0)
+    else:
+        lexical = _subscribed_lexical_index(vector_store)
+
+    retriever = Retriever(
+        vector_store=vector_store,
+        embedding_manager=embedder,
+        lexical_index=lexical,
+    )
+    return embedder, vector_store, retriever
+
+
+def _index_model(alias:str, physical:str) -> str:
+    """
+    embedder model `physical` was indexed with: the alias table's record, else
+    the collection's stored `embedder_model`, else settings. A collection is
+    always queried with its own model, so a changed EMBEDDER_MODEL_NAME never
+    mixes models; the mismatch is reported until the collection is reindexed.
+    """
+    recorded = aliases.info(alias).get("embedder_model")
+    stored = stored_embedder_model(physical, settings.PERSIST_DIRECTORY_VS)
+    if recorded and stored and recorded != stored:
+        raise RuntimeError(f"collection {physical} holds {stored} vectors but alias {alias} records {recorded}")
+    model = recorded or stored or settings.EMBEDDER_MODEL_NAME
+    if model != settings.EMBEDDER_MODEL_NAME:
+        print(
+            f"!! Collection {alias} ({physical}) was indexed with {model} but EMBEDDER_MODEL_NAME is "
+            f"{settings.EMBEDDER_MODEL_NAME}; serving it with {model} until it is reindexed (POST /v1/reindex)"
         )
+    return model
+
+
+def warm(components:Components):
+    """one encode + one search so the first request on these components doesn't pay for cold loads"""
+    embedder, vs, retriever = components
+    q_emb = embedder.generate_embedding("warm up")
+    if vs.collection.count() > 0:
+        # goes through the Retriever so the exact index is loaded too when it applies
+        retriever.search(q_emb.tolist(), top_k=1, score_threshold=0.0, rerank=False)
+
+
+def _close(name:str, components:Components):
+    """persist what an evicted collection holds in memory and forget its cached answers"""
+    from rag.api.services.answer_cache import answer_cache
+
+    _, vs, _ = components
+    try:
+        vs.flush()
+    except Exception as e:
+        print(f"!! Flushing collection {name} failed: {e}")
+    if answer_cache is not None:
+        answer_cache.drop(vs.collection_name)
+    print(f"Closed collection: {name}")
+
+
+def _footprint(components:Components) -> int:
+    """rough resident bytes of an open collection: vectors + per-chunk overhead + exact index copy"""
+    embedder, vs, retriever = components
+    try:
+        count = vs.collection.count()
+        dim = embedder.model.get_sentence_embedding_dimension()
+    except Exception:
+        return 0
+    size = count * (dim * 4 + settings.COLLECTION_BYTES_PER_CHUNK)
+    if retriever.exact_index is not None:
+        size += len(retriever.exact_index) * dim * 4
+    return size
+
+
+def _ms_since(t0:float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 1)
+
+
+def init_timings() -> Dict[str, float]:
+    """construction time (ms) of every component built so far in this process"""
+    return dict(_INIT_TIMINGS)
+
+
+def _open_lexical_index(vs:BaseVectorStore) -> Optional[BM25Index]:
+    """
+    open the BM25 index of `vs` (rebuilding it if it drifted from the
+    collection, e.g. after a crash) and subscribe it to the store's writes
+    """
+    if not settings.LEXICAL_INDEX_ENABLED:
+        return None
+    lexical = BM25Index.for_collection(vs.collection_name, vs.persist_directory)
+    try:
+        count = vs.collection.count()
+    except Exception:
+        count = None
+    if count is not None and count != len(lexical):
+        lexical.rebuild_from_collection(vs.collection)
+    vs.subscribe(lexical)
+    return lexical
+
 
-    return _EMBEDDER, _VSTORE, _RETRIEVER
+def _subscribed_lexical_index(vs:BaseVectorStore) -> Optional[BM25Index]:
+    """the BM25 index already listening on `vs` (kept when only the embedder reloads)"""
+    return vs.find_listener(BM25Index)
 
 
-def get_vector_store() -> VectorStore:
-    _, vstore, _ = ensure_components()
+def get_vector_store(collection:Optional[str]=None) -> BaseVectorStore:
+    _, vstore, _ = ensure_components(collection)
 
-    return vstore
\ No newline at end of file
+    return vstore
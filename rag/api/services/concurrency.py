@@ -0,0 +1,41 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+from rag.core.config import settings
+
+# CPU-bound query encoding: keep it small so embedding can't starve the box
+EMBED_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.EMBED_EXECUTOR_WORKERS,
+    thread_name_prefix="embed",
+)
+# blocking vector-store calls (Chroma/SQLite)
+SEARCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.SEARCH_EXECUTOR_WORKERS,
+    thread_name_prefix="search",
+)
+
+_PROVIDER_LIMITS: Dict[str, int] = {
+    "grok": settings.GROK_MAX_CONCURRENCY,
+    "hf": settings.HF_MAX_CONCURRENCY,
+}
+_PROVIDER_SEMAPHORES: Dict[str, asyncio.Semaphore] = {}
+
+
+def provider_semaphore(provider: str) -> asyncio.Semaphore:
+    """
+    per-provider limit on in-flight LLM calls (so we don't overload the HF endpoint)
+    """
+    sem = _PROVIDER_SEMAPHORES.get(provider)
+    if sem is None:
+        sem = asyncio.Semaphore(_PROVIDER_LIMITS.get(provider, settings.HF_MAX_CONCURRENCY))
+        _PROVIDER_SEMAPHORES[provider] = sem
+    return sem
+
+
+async def run_in(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """run a blocking call on `executor` without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
@@ -1,41 +1,314 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from rag.api.services.components import ensure_components
-from rag.pipeline.data_loader import load_data
-from rag.pipeline.chunker import chunk_document
-from rag.utility.helpers import extract_text_and_metas
+from rag.core.config import settings
+from rag.api.services.components import aliases, index_config, pinned_components
+from rag.api.services.jobs import get_job_queue
+from rag.pipeline.data_loader import iter_load_data
+from rag.pipeline.chunker import iter_chunks
+from rag.pipeline.manifest import IndexManifest
+from rag.pipeline.vector_store import BackgroundUpserter
+from rag.utility.helpers import extract_text_and_metas, make_vector_id, sha256_file
 
+# one indexing run at a time per collection: the manifest is read-modify-write
+_INDEX_LOCKS: Dict[str, threading.Lock] = {}
+_INDEX_LOCKS_GUARD = threading.Lock()
 
-def build_index(data_dir:Path) ->Tuple[int, int]:
+
+@contextmanager
+def index_lock(collection:Optional[str]=None) -> Iterator[None]:
     """
-    Loads PDF files from provided dir -> embed -> upsert to VS
-    returns number of added embeddings and total 
-     
+    exclusive right to write `collection` (an alias): per collection, so tenants
+    don't wait on each other, and across worker processes through the alias
+    table's write lock, which a reindex also takes before it swaps.
     """
-    embedder, vs , _ = ensure_components()
+    name = collection or settings.COLLECTION_NAME
+    with _INDEX_LOCKS_GUARD:
+        lock = _INDEX_LOCKS.setdefault(name, threading.Lock())
+    with lock, aliases.write_lock(name):
+        yield
+
+
+@contextmanager
+def no_indexing() -> Iterator[None]:
+    """hold off every indexing run of this process; raises RuntimeError if one is running"""
+    with _INDEX_LOCKS_GUARD:
+        held: List[threading.Lock] = []
+        try:
+            for lock in _INDEX_LOCKS.values():
+                if not lock.acquire(blocking=False):
+                    raise RuntimeError("indexing in progress, retry when it finishes")
+                held.append(lock)
+            yield
+        finally:
+            for lock in held:
+                lock.release()
+
+
+def _load_manifest(vs) -> IndexManifest:
+    manifest = IndexManifest.for_collection(vs.collection_name, vs.persist_directory)
+    if not manifest.loaded_from_disk:
+        try:
+            if vs.collection.count() > 0:
+                manifest.bootstrap_from_collection(vs.collection)
+        except Exception as e:
+            print(f"!! Could not bootstrap manifest from collection: {e}")
+    return manifest
 
-    docs = load_data(data_dir=data_dir)
-    chunks = chunk_document(docs)
-    
-    texts, _ = extract_text_and_metas(chunks)
-    embeddings = embedder.generate_embeddings(texts)
 
-    before_adding = None
+def _count(vs):
     try:
-        before_adding = vs.collection.count()
+        return vs.collection.count()
     except Exception:
-        before_adding = None
-    
-    vs.add_documents(chunks, embeddings)
+        return None
+
+
+class _StreamingIndexer:
+    """
+    loader -> chunker -> embedder -> vector store as a stream:
+    files are parsed one at a time (iter_load_data), chunked page by page
+    (iter_chunks), embedded in fixed-size micro-batches of INDEX_EMBED_BATCH
+    chunks and upserted batch by batch. Peak memory is one file plus one batch,
+    whatever the corpus size.
+
+    A file is committed to the manifest once all of its chunks have been
+    upserted; completed batches are already durable in the store, so a crash
+    mid-run keeps them (the file is just re-embedded on the next run).
+    """
+
+    def __init__(self, embedder, vs, manifest:IndexManifest, progress=None,
+                 chunk_size:int=settings.CHUNK_SIZE, chunk_overlap:int=settings.CHUNK_OVERLAP):
+        self.embedder = embedder
+        self.vs = vs
+        self.manifest = manifest
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = max(1, settings.INDEX_EMBED_BATCH)
+        self.buffer: List = []
+        self.flushed = 0        # chunks upserted so far
+        self.queued = 0         # chunks handed to the buffer so far
+        self.pending: deque = deque()  # (path, end_offset, ids, sha) awaiting upsert
+        self._last_save = time.monotonic()
+        self.writer = (
+            BackgroundUpserter(vs, on_upserted=lambda n: self._report(vectors_upserted=n))
+            if settings.UPSERT_IN_BACKGROUND else None
+        )
+
+    def _report(self, **deltas):
+        if self.progress is not None:
+            self.progress.update(**deltas)
+
+    def _check_cancelled(self):
+        if self.progress is not None:
+            self.progress.check_cancelled()
+
+    def add_file(self, path:Path, pages:List):
+        ids: List[str] = []
+        for chunk in iter_chunks(pages, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap):
+            ids.append(make_vector_id(chunk.metadata))
+            self.buffer.append(chunk)
+            self.queued += 1
+            if len(self.buffer) >= self.batch_size:
+                self._flush(self.batch_size)
+        sha = next((p.metadata.get("file_sha256") for p in pages if p.metadata.get("file_sha256")), None)
+        self.pending.append((path, self.queued, ids, sha))
+        self._commit_ready()
+
+    def add_unparsed(self, path:Path):
+        """file that yielded nothing (unreadable/empty): record it so it isn't retried every run"""
+        self.pending.append((path, self.queued, [], None))
+        self._commit_ready()
+
+    def _flush(self, n:int):
+        self._check_cancelled()
+        batch, self.buffer = self.buffer[:n], self.buffer[n:]
+        texts, _ = extract_text_and_metas(batch)
+        embeddings = self.embedder.generate_embeddings(texts, show_progress_bar=False)
+        self._report(chunks_embedded=len(texts))
+        if self.writer is not None:
+            # returns once the previous batch has landed; this one is written
+            # while the caller goes on to chunk/embed the next batch
+            self.writer.submit(batch, embeddings)
+            self.flushed = self.writer.completed
+        else:
+            self.vs.add_documents(batch, embeddings)
+            self._report(vectors_upserted=len(batch))
+            self.flushed += len(batch)
+        self._commit_ready()
+
+    def _commit_ready(self):
+        committed = 0
+        while self.pending and self.pending[0][1] <= self.flushed:
+            path, _, ids, sha = self.pending.popleft()
+            self._record(path, ids, sha)
+            committed += 1
+        if committed:
+            self._report(files_done=committed)
+            if time.monotonic() - self._last_save >= settings.MANIFEST_SAVE_INTERVAL_S:
+                self.manifest.save()
+                self._last_save = time.monotonic()
+
+    def _record(self, path:Path, fresh:List[str], sha):
+        """update the manifest entry for `path`, purging ids its new version no longer has"""
+        key = str(path)
+        old = self.manifest.get(key)
+        if old:
+            stale = set(old.get("ids") or []) - set(fresh)
+            self.vs.delete_ids(sorted(stale))
+        st = path.stat()
+        if sha is None:
+            sha = sha256_file(path)
+        self.manifest.set(key, sha, st.st_mtime, st.st_size, fresh)
+
+    def finish(self):
+        if self.buffer:
+            self._flush(len(self.buffer))
+        if self.writer is not None:
+            self.writer.wait()
+            self.flushed = self.writer.completed
+        self._commit_ready()
+        self.manifest.save()
+        self.vs.flush()
+        if getattr(self.embedder, "cache", None) is not None:
+            self.embedder.cache.flush()
+        elif hasattr(self.embedder, "flush"):
+            # RemoteEmbedder: the embedding server owns the cache
+            self.embedder.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _index_files(
+        embedder,
+        vs,
+        manifest:IndexManifest,
+        files:List[Path],
+        removed:List[str],
+        progress=None,
+        chunk_size:int=settings.CHUNK_SIZE,
+        chunk_overlap:int=settings.CHUNK_OVERLAP,
+    ) -> Tuple[int, int]:
+    """
+    core of build_index / build_index_for_files: purge `removed`, then stream
+    whichever of `files` the manifest reports as new or modified through the
+    indexing pipeline. `progress` (see rag.api.services.jobs.JobProgress) is optional.
+    """
+    to_index, unchanged = manifest.plan(files)
+    print(f"Index plan: {len(to_index)} new/modified, {len(unchanged)} unchanged, {len(removed)} removed")
+    if progress is not None:
+        progress.set(files_total=len(to_index))
 
-    after_adding = 0
+    before_adding = _count(vs)
+
+    for path in removed:
+        vs.delete_ids(manifest.remove(path))
+    if removed:
+        manifest.save()
+
+    indexer = _StreamingIndexer(embedder, vs, manifest, progress=progress,
+                                chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    parsed = set()
     try:
-        after_adding = vs.collection.count()
-    except Exception:
-        pass
+        for path, pages in iter_load_data(files=to_index):
+            if progress is not None:
+                progress.check_cancelled()
+                progress.update(pages_parsed=len(pages))
+            parsed.add(path)
+            indexer.add_file(path, pages)
+        for path in to_index:
+            if path not in parsed:
+                indexer.add_unparsed(path)
+        indexer.finish()
+    finally:
+        indexer.close()
+        # keep whatever was committed, even on cancellation/failure
+        manifest.save()
 
-    added = max(0, (after_adding or 0) - (before_adding or 0) if before_adding is not None else len(chunks))
+    after_adding = _count(vs) or 0
+    added = max(0, (after_adding or 0) - (before_adding or 0) if before_adding is not None else indexer.flushed)
 
     return added , after_adding
 
+
+def _scan_pdfs(data_dir:Path) -> List[Path]:
+    """
+    PDFs under data_dir, minus the folders of other collections when they are
+    nested in it (data/collections/<name> under the default data/)
+    """
+    files = sorted(Path(data_dir).glob("**/*.pdf"))
+    collections_dir = settings.COLLECTIONS_DATA_DIR.resolve()
+    root = Path(data_dir).resolve()
+    if root not in collections_dir.parents:
+        return files
+    return [f for f in files if collections_dir not in f.resolve().parents]
+
+
+def build_index(data_dir:Path, progress=None, collection:Optional[str]=None) ->Tuple[int, int]:
+    """
+    Incrementally (re)index PDF files under provided dir -> embed -> upsert to VS.
+    Unchanged files (per the index manifest) are skipped, new/modified files are
+    re-embedded and vectors of modified/removed files are purged.
+    `collection` defaults to settings.COLLECTION_NAME; it is chunked the way it
+    was last (re)built (see index_config).
+    returns number of added embeddings and total 
+     
+    """
+    # lock first: a reindex may swap the collection while this job waits
+    with index_lock(collection), pinned_components(collection) as (embedder, vs, _):
+        manifest = _load_manifest(vs)
+        files = _scan_pdfs(data_dir)
+        removed = manifest.missing_under(data_dir, files)
+        return _index_files(embedder, vs, manifest, files, removed, progress=progress, **_chunking(collection))
+
+
+def build_index_for_files(paths:Iterable[Union[str, Path]], progress=None, collection:Optional[str]=None) -> Tuple[int, int]:
+    """
+    Index exactly the given PDF files (e.g. the ones just uploaded), without
+    scanning their directory. Cost depends on the size of `paths` only.
+    returns number of added embeddings and total
+    """
+    with index_lock(collection), pinned_components(collection) as (embedder, vs, _):
+        manifest = _load_manifest(vs)
+        files = sorted({Path(p).resolve() for p in paths})
+        return _index_files(embedder, vs, manifest, files, removed=[], progress=progress, **_chunking(collection))
+
+
+def delete_source(source:Union[str, Path], collection:Optional[str]=None):
+    """
+    Remove one PDF from the collection and from its manifest, under the same
+    lock as indexing so a re-upload of the file is planned as new, not unchanged.
+    """
+    key = str(Path(source).resolve())
+    with index_lock(collection), pinned_components(collection) as (_, vs, _):
+        manifest = _load_manifest(vs)
+        vs.delete_by_source(key)
+        manifest.remove(key)
+        manifest.save()
+
+
+def _chunking(collection:Optional[str]) -> dict:
+    config = index_config(collection or settings.COLLECTION_NAME)
+    return {"chunk_size": config["chunk_size"], "chunk_overlap": config["chunk_overlap"]}
+
+
+def submit_index_job(data_dir:Path, collection:str=settings.COLLECTION_NAME) -> str:
+    """run build_index(data_dir) on the background job queue, return the job id"""
+    def _job(progress):
+        added, total = build_index(data_dir, progress=progress, collection=collection)
+        return {"added": added, "total_in_collection": total}
+    return get_job_queue().submit("index", {"data_dir": str(data_dir), "collection": collection}, _job)
+
+
+def submit_files_job(paths:List[str], collection:str=settings.COLLECTION_NAME) -> str:
+    """run build_index_for_files(paths) on the background job queue, return the job id"""
+    def _job(progress):
+        added, total = build_index_for_files(paths, progress=progress, collection=collection)
+        return {"added": added, "total_in_collection": total}
+    return get_job_queue().submit("upload", {"files": list(paths), "collection": collection}, _job)
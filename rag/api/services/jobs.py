@@ -0,0 +1,241 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from rag.core.config import settings
+from rag.utility.helpers import pid_alive
+
+# job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+COUNTERS = ("pages_parsed", "chunks_embedded", "vectors_upserted", "files_total", "files_done")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT,
+    pages_parsed INTEGER DEFAULT 0,
+    chunks_embedded INTEGER DEFAULT 0,
+    vectors_upserted INTEGER DEFAULT 0,
+    files_total INTEGER DEFAULT 0,
+    files_done INTEGER DEFAULT 0,
+    added INTEGER,
+    total_in_collection INTEGER,
+    error TEXT,
+    cancel_requested INTEGER DEFAULT 0,
+    owner_pid INTEGER,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+
+class JobCancelled(Exception):
+    """raised inside a job when cancellation was requested"""
+
+
+class JobStore:
+    """
+    SQLite-backed job state, so job status survives the request that started it.
+    Every uvicorn worker shares the database; each job records the pid of the
+    worker running it, and unfinished jobs are only failed once that worker is gone.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(_SCHEMA)
+            cols = {r["name"] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "owner_pid" not in cols:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+        # a job recorded under our own pid belongs to an earlier process (pid reused)
+        self._reap_orphans(startup=True)
+
+    def _reap_orphans(self, startup: bool = False):
+        """fail queued/running jobs whose worker process is gone: they can't be resumed"""
+        me = os.getpid()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+            dead = [
+                r["id"] for r in rows
+                if (startup if r["owner_pid"] == me else not pid_alive(r["owner_pid"]))
+            ]
+            if dead:
+                self._conn.executemany(
+                    "UPDATE jobs SET status=?, error=?, finished_at=? WHERE id=? AND status IN (?, ?)",
+                    [(FAILED, "interrupted: worker process exited", time.time(), job_id, QUEUED, RUNNING) for job_id in dead],
+                )
+
+    def create(self, kind: str, params: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, owner_pid, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), os.getpid(), time.time()),
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        if not fields:
+            return
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {cols} WHERE id=?", (*fields.values(), job_id))
+
+    def increment(self, job_id: str, **deltas: int):
+        deltas = {k: int(v) for k, v in deltas.items() if k in COUNTERS and v}
+        if not deltas:
+            return
+        cols = ", ".join(f"{k}={k}+?" for k in deltas)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {cols} WHERE id=?", (*deltas.values(), job_id))
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._reap_orphans()
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        self._reap_orphans()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        d = dict(row)
+        d["job_id"] = d.pop("id")
+        d["params"] = json.loads(d.get("params") or "{}")
+        d["cancel_requested"] = bool(d.get("cancel_requested"))
+        return d
+
+
+class JobProgress:
+    """
+    handed to the job function to report progress and observe cancellation.
+    A cancel sent to another worker only reaches the database, so the
+    cancel_requested flag is polled too (at most every CANCEL_POLL_S).
+    """
+
+    CANCEL_POLL_S = 1.0
+
+    def __init__(self, store: JobStore, job_id: str, cancel_event: threading.Event):
+        self.store = store
+        self.job_id = job_id
+        self._cancel_event = cancel_event
+        self._last_poll = 0.0
+
+    def update(self, **deltas: int):
+        self.store.increment(self.job_id, **deltas)
+
+    def set(self, **fields):
+        self.store.update(self.job_id, **fields)
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancel_event.is_set() and time.monotonic() - self._last_poll >= self.CANCEL_POLL_S:
+            self._last_poll = time.monotonic()
+            if self.store.cancel_requested(self.job_id):
+                self._cancel_event.set()
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+
+class JobQueue:
+    """
+    In-process job queue with a bounded worker pool.
+    Kept small (INDEX_JOB_WORKERS) and separate from the query executors so
+    indexing doesn't take capacity away from /v1/query.
+    """
+
+    def __init__(self, store: JobStore, max_workers: int = settings.INDEX_JOB_WORKERS):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="index-job")
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: Dict[str, Any], fn: Callable[[JobProgress], Dict[str, Any]]) -> str:
+        """
+        enqueue `fn(progress)`; whatever dict it returns is stored on the job
+        (e.g. {"added": .., "total_in_collection": ..}).
+        """
+        job_id = self.store.create(kind, params)
+        event = threading.Event()
+        with self._lock:
+            self._cancel_events[job_id] = event
+        self._executor.submit(self._run, job_id, fn, event)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[[JobProgress], Dict[str, Any]], event: threading.Event):
+        progress = JobProgress(self.store, job_id, event)
+        try:
+            progress.check_cancelled()
+            self.store.update(job_id, status=RUNNING, started_at=time.time())
+            result = fn(progress) or {}
+            self.store.update(job_id, status=SUCCEEDED, finished_at=time.time(), **result)
+        except JobCancelled:
+            print(f"Job {job_id} cancelled")
+            self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+        except Exception as e:
+            print(f"!! Job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        """request cancellation; running jobs stop at their next checkpoint, whichever worker runs them"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return False
+        self.store.update(job_id, cancel_requested=1)
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return True
+
+
+_JOB_QUEUE: Optional[JobQueue] = None
+_JOB_QUEUE_LOCK = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    global _JOB_QUEUE
+    if _JOB_QUEUE is None:
+        with _JOB_QUEUE_LOCK:
+            if _JOB_QUEUE is None:
+                _JOB_QUEUE = JobQueue(JobStore(settings.JOBS_DB_PATH))
+    return _JOB_QUEUE
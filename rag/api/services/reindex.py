@@ -0,0 +1,240 @@
+from __future__ import annotations
+import random
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from rag.core.config import settings
+from rag.api.services.components import (
+    aliases,
+    collection_data_dir,
+    get_embedder,
+    registry,
+    warm,
+    _open_lexical_index,
+)
+from rag.api.services.answer_cache import answer_cache
+from rag.api.services.indexing import _index_files, _scan_pdfs, index_lock
+from rag.api.services.jobs import get_job_queue
+from rag.pipeline.lexical_index import BM25Index
+from rag.pipeline.manifest import IndexManifest
+from rag.pipeline.retriever import Retriever
+from rag.pipeline.vector_store import collection_exists, create_vector_store, drop_collection
+
+
+def _shadow_name(alias:str) -> str:
+    # <alias>__g<ms timestamp>, within Chroma's 63 character limit
+    return f"{alias[:44]}__g{time.time_ns() // 1_000_000:x}"
+
+
+def drop_physical(name:str):
+    """delete a physical collection with its lexical index and manifest"""
+    persist = settings.PERSIST_DIRECTORY_VS
+    drop_collection(name, persist)
+    shutil.rmtree(BM25Index.for_collection(name, persist).dir, ignore_errors=True)
+    IndexManifest.for_collection(name, persist).path.unlink(missing_ok=True)
+    print(f"Dropped collection: {name}")
+
+
+def reindex_collection(
+        collection:Optional[str]=None,
+        data_dir:Optional[Path]=None,
+        embedder_model:Optional[str]=None,
+        chunk_size:Optional[int]=None,
+        chunk_overlap:Optional[int]=None,
+        progress=None,
+    ) -> Dict[str, Any]:
+    """
+    Blue/green full reindex of `collection` (e.g. after changing the embedder
+    model or the chunking), without ever serving a partial index:
+    1. every PDF under data_dir is indexed into a new shadow collection while
+       queries, uploads and deletes keep using the live one;
+    2. writes to the live collection are then held off (index_lock) and what
+       changed meanwhile is applied to the shadow (see _catch_up);
+    3. the shadow is validated (see _validate), otherwise dropped;
+    4. its retriever is opened and warmed, then the alias is switched
+       atomically and the new components swapped into the registry;
+    5. the old collection is retired and deleted after REINDEX_GC_GRACE_S.
+    returns the job result: {"added", "total_in_collection"}
+    """
+    alias = collection or settings.COLLECTION_NAME
+    model = embedder_model or settings.EMBEDDER_MODEL_NAME
+    chunk_size = chunk_size or settings.CHUNK_SIZE
+    chunk_overlap = settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    data_dir = Path(data_dir) if data_dir else collection_data_dir(alias)
+
+    # other workers share the store: one rebuild of an alias at a time across processes
+    with aliases.build_lock(alias):
+        shadow = _shadow_name(alias)
+        stale = aliases.begin_build(alias, shadow)
+        if stale:
+            # left behind by a reindex whose process died
+            drop_physical(stale)
+        print(f"Reindexing {alias} into {shadow} ({model}, chunks {chunk_size}/{chunk_overlap})")
+        try:
+            live_before = set(_live_manifest(alias).entries)
+            embedder = get_embedder(model)
+            vs = create_vector_store(
+                collection_name=shadow,
+                persist_directory=settings.PERSIST_DIRECTORY_VS,
+                embedder_model_name=model,
+            )
+            lexical = _open_lexical_index(vs)
+            manifest = IndexManifest.for_collection(shadow, settings.PERSIST_DIRECTORY_VS)
+            _index_files(
+                embedder, vs, manifest, _scan_pdfs(data_dir), removed=[], progress=progress,
+                chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+            )
+        except BaseException:
+            _abandon(alias, shadow)
+            raise
+
+        with index_lock(alias):
+            try:
+                _catch_up(alias, embedder, vs, manifest, data_dir, live_before, chunk_size, chunk_overlap)
+                report = _validate(alias, vs, embedder, manifest)
+                components = (embedder, vs, Retriever(vector_store=vs, embedding_manager=embedder, lexical_index=lexical))
+                warm(components)
+            except BaseException:
+                _abandon(alias, shadow)
+                raise
+            old = aliases.swap(alias, shadow, embedder_model=model, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            registry.install(alias, components)
+
+    if answer_cache is not None:
+        answer_cache.drop(old)
+    print(f"Swapped {alias}: {old} -> {shadow} ({report})")
+    schedule_gc()
+    return {"added": report["count"], "total_in_collection": report["count"]}
+
+
+def _abandon(alias:str, shadow:str):
+    aliases.end_build(alias)
+    drop_physical(shadow)
+
+
+def _live_manifest(alias:str) -> IndexManifest:
+    """manifest of the collection serving `alias` now, as last saved by any worker"""
+    return IndexManifest.for_collection(aliases.resolve(alias), settings.PERSIST_DIRECTORY_VS)
+
+
+def _catch_up(alias:str, embedder, vs, manifest:IndexManifest, data_dir:Path,
+              live_before:Set[str], chunk_size:int, chunk_overlap:int):
+    """
+    bring the shadow up to date with writes to the live collection made while
+    it was built (uploads, indexing jobs and deletes in any worker), with those
+    writes held off by index_lock: re-scan data_dir, and diff the live manifest
+    against its state when the build started for sources indexed from
+    elsewhere or deleted through the API. Only the difference is embedded.
+    """
+    live_now = set(_live_manifest(alias).entries)
+    deleted = {p for p in live_before - live_now if p in manifest.entries}
+    files = [f for f in _scan_pdfs(data_dir) if str(f.resolve()) not in deleted]
+    files += [Path(p) for p in live_now - live_before if Path(p).exists()]
+    removed = sorted(deleted | set(manifest.missing_under(data_dir, files)))
+    _index_files(
+        embedder, vs, manifest, sorted(set(files)), removed=removed,
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+    )
+
+
+def _validate(alias:str, vs, embedder, manifest:IndexManifest) -> Dict[str, Any]:
+    """
+    checks before a shadow may replace the live collection:
+    - it holds exactly the chunks the manifest recorded, and at least one;
+    - it isn't much smaller than the live collection (REINDEX_MIN_COUNT_RATIO),
+      which catches a wrong or half-mounted data dir;
+    - sampled chunks retrieve themselves from their own text (REINDEX_MIN_SELF_RECALL),
+      which catches a broken model or vectors stored against the wrong ids.
+    raises RuntimeError on failure, returns the measurements otherwise.
+    """
+    expected = {vec_id for entry in manifest.entries.values() for vec_id in (entry.get("ids") or [])}
+    count = vs.collection.count()
+    if count == 0:
+        raise RuntimeError("reindex validation failed: shadow collection is empty")
+    if count != len(expected):
+        raise RuntimeError(f"reindex validation failed: shadow holds {count} chunks, manifest expects {len(expected)}")
+
+    live = aliases.resolve(alias)
+    live_count = None
+    if collection_exists(live, settings.PERSIST_DIRECTORY_VS):
+        entry = registry.get(alias)
+        live_count = entry.components[1].collection.count()
+        if live_count and count < settings.REINDEX_MIN_COUNT_RATIO * live_count:
+            raise RuntimeError(
+                f"reindex validation failed: shadow holds {count} chunks, live collection {live_count} "
+                f"(min ratio {settings.REINDEX_MIN_COUNT_RATIO})"
+            )
+
+    sample = random.sample(sorted(expected), min(settings.REINDEX_VALIDATION_SAMPLES, len(expected)))
+    got = vs.collection.get(ids=sample, include=["documents"])
+    pairs = [(i, d) for i, d in zip(got.get("ids") or [], got.get("documents") or []) if d and d.strip()]
+    self_recall = None
+    if pairs:
+        q_embs = embedder.generate_query_embeddings([d[:1000] for _, d in pairs])
+        res = vs.collection.query(query_embeddings=q_embs, n_results=settings.TOP_K, include=["distances"])
+        hits = sum(1 for (vec_id, _), ids in zip(pairs, res.get("ids") or []) if vec_id in ids)
+        self_recall = hits / len(pairs)
+        if self_recall < settings.REINDEX_MIN_SELF_RECALL:
+            raise RuntimeError(
+                f"reindex validation failed: self-recall@{settings.TOP_K} {self_recall:.2f} "
+                f"< {settings.REINDEX_MIN_SELF_RECALL}"
+            )
+    return {"count": count, "live_count": live_count, "self_recall": self_recall, "samples": len(pairs)}
+
+
+def collect_retired(grace_s:float=settings.REINDEX_GC_GRACE_S) -> List[str]:
+    """delete collections retired by a swap more than `grace_s` ago; returns their names"""
+    aliases.reload_if_changed()
+    now = time.time()
+    serving = {entry.components[1].collection_name for _, entry in registry.entries()}
+    serving.update(info.get("collection") for info in aliases.aliases().values())
+    dropped = []
+    for retired in aliases.retired():
+        name = retired.get("collection")
+        if not name or now - float(retired.get("retired_at") or 0) < grace_s:
+            continue
+        if name in serving:
+            # still open in this process (alias refresh not done yet); retry next time
+            continue
+        drop_physical(name)
+        dropped.append(name)
+    aliases.forget_retired(dropped)
+    return dropped
+
+
+def schedule_gc(delay_s:float=settings.REINDEX_GC_GRACE_S):
+    """run collect_retired once the grace period of the latest swap is over"""
+    timer = threading.Timer(delay_s + 1.0, _gc_quietly)
+    timer.daemon = True
+    timer.start()
+
+
+def _gc_quietly():
+    try:
+        collect_retired()
+    except Exception as e:
+        print(f"!! Collecting retired collections failed: {e}")
+
+
+def submit_reindex_job(
+        collection:str=settings.COLLECTION_NAME,
+        data_dir:Optional[Path]=None,
+        embedder_model:Optional[str]=None,
+        chunk_size:Optional[int]=None,
+        chunk_overlap:Optional[int]=None,
+    ) -> str:
+    """run reindex_collection on the background job queue, return the job id"""
+    params = {
+        "collection": collection,
+        "data_dir": str(data_dir) if data_dir else None,
+        "embedder_model": embedder_model,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
+
+    def _job(progress):
+        return reindex_collection(progress=progress, **params)
+    return get_job_queue().submit("reindex", params, _job)
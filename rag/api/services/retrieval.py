@@ -1,11 +1,20 @@
 from __future__ import annotations
 
-from typing import Tuple, List, Dict, Any
+import asyncio
+import time
+from typing import AsyncIterator, Optional, Tuple, List, Dict, Any
 
 from rag.core.config import settings
 from rag.api.services.components import ensure_components
-from rag.pipeline.grok_rag_pipeline import RAG_Simple_Grok
-from rag.pipeline.hf_rag_pipeline import RAG_Simple_HF
+from rag.api.services.answer_cache import answer_cache, generation_key
+from rag.api.services.concurrency import (
+    EMBED_EXECUTOR,
+    SEARCH_EXECUTOR,
+    provider_semaphore,
+    run_in,
+)
+from rag.pipeline.grok_rag_pipeline import RAG_Simple_Grok, aRAG_Simple_Grok, astream_RAG_Grok
+from rag.pipeline.hf_rag_pipeline import RAG_Simple_HF, aRAG_Simple_HF, astream_RAG_HF
 
 def run_rag_query(
         question:str,
@@ -13,41 +22,318 @@ def run_rag_query(
         top_k:int=settings.TOP_K,
         score_threshold:float=settings.SCORE_THRESHOLD,
         max_ctx_chars:int=settings.MAX_CTX_CHARS,
+        mode:Optional[str]=None,
+        rerank:Optional[bool]=None,
+        exact:Optional[bool]=None,
+        filters:Optional[Dict[str, Any]]=None,
+        collection:Optional[str]=None,
+        timings:Optional[Dict[str, float]]=None,
     ) -> Tuple[str, List[Dict[str, Any]], str]:
     """
     return (answer, retriever_results, used_provider)
+    retrieval runs once; the same results feed the LLM and the citations.
+    `filters` (source_name, file_sha256, page_from/page_to, uploaded_after/
+    uploaded_before) restrict which chunks are searched, see Retriever.retrieve.
+    `collection` selects the tenant collection (default: settings.COLLECTION_NAME).
+    `timings`, if given, is filled with per-stage milliseconds.
     """
-    _, _, retriever = ensure_components()
-    results = retriever.retrieve(
-        question,
+    _, vs, retriever = ensure_components(collection)
+    if not question or not question.strip():
+        return settings.GUARD_SENTENCE, [], provider
+    t0 = time.perf_counter()
+    q_emb = retriever.embed_query(question)
+    _elapsed(timings, "embed_ms", t0)
+    results = retriever.search(
+        q_emb,
         top_k=top_k,
         score_threshold=score_threshold,
+        query_text=question,
+        mode=mode,
+        rerank=rerank,
+        exact=exact,
+        filters=filters,
+        timings=timings,
     )
     
     if not results:
         return settings.GUARD_SENTENCE, [], provider
+
+    cached = _cached_answer(vs, provider, max_ctx_chars, q_emb, results)
+    if cached is not None:
+        return cached, results, ("grok" if provider == "grok" else "hf")
     
+    t0 = time.perf_counter()
     if provider == "grok":
         answer = RAG_Simple_Grok(
             query=question,
-            retriever=retriever,
-            top_k=top_k,
-            score_threshold=score_threshold,
+            results=results,
             max_ctx_chars=max_ctx_chars
         )
         used="grok"
     else:
         answer = RAG_Simple_HF(
             query=question,
-            retriever=retriever,
-            top_k=top_k,
-            score_threshold=score_threshold,
+            results=results,
             max_ctx_chars=max_ctx_chars
         )
         used="hf"
-    
+    _elapsed(timings, "generate_ms", t0)
+
+    _store_answer(vs, used, max_ctx_chars, q_emb, results, answer)
     return answer, results, used
 
+def _elapsed(timings:Optional[Dict[str, float]], key:str, t0:float):
+    if timings is not None:
+        timings[key] = (time.perf_counter() - t0) * 1000.0
+
+def _cached_answer(vs, provider:str, max_ctx_chars:int, q_emb, results:List[Dict[str, Any]]):
+    if answer_cache is None:
+        return None
+    return answer_cache.lookup(
+        generation_key(provider, vs.collection_name),
+        q_emb,
+        [r.get("id") for r in results],
+        version=vs.version,
+        max_ctx_chars=max_ctx_chars,
+    )
+
+def _store_answer(vs, provider:str, max_ctx_chars:int, q_emb, results:List[Dict[str, Any]], answer:str):
+    # guarded/empty answers are cheap to regenerate and may improve with a retry
+    if answer_cache is None or not answer or answer == settings.GUARD_SENTENCE:
+        return
+    answer_cache.store(
+        generation_key(provider, vs.collection_name),
+        q_emb,
+        [r.get("id") for r in results],
+        answer,
+        version=vs.version,
+        max_ctx_chars=max_ctx_chars,
+    )
+
+async def aretrieve(
+        question:str,
+        top_k:int=settings.TOP_K,
+        score_threshold:float=settings.SCORE_THRESHOLD,
+        mode:Optional[str]=None,
+        rerank:Optional[bool]=None,
+        exact:Optional[bool]=None,
+        filters:Optional[Dict[str, Any]]=None,
+        collection:Optional[str]=None,
+        timings:Optional[Dict[str, float]]=None,
+    ) -> List[Dict[str, Any]]:
+    """
+    async retrieval: encoding runs on the bounded embed executor,
+    the vector search (and rerank) on the search executor, never on the event loop.
+    """
+    _, results = await _aretrieve_with_embedding(
+        question, top_k=top_k, score_threshold=score_threshold, mode=mode, rerank=rerank, exact=exact, filters=filters, collection=collection, timings=timings
+    )
+    return results
+
+async def _aretrieve_with_embedding(
+        question:str,
+        top_k:int=settings.TOP_K,
+        score_threshold:float=settings.SCORE_THRESHOLD,
+        mode:Optional[str]=None,
+        rerank:Optional[bool]=None,
+        exact:Optional[bool]=None,
+        filters:Optional[Dict[str, Any]]=None,
+        collection:Optional[str]=None,
+        timings:Optional[Dict[str, float]]=None,
+    ) -> Tuple[Any, List[Dict[str, Any]]]:
+    if not question or not question.strip():
+        return None, []
+    _, _, retriever = await run_in(SEARCH_EXECUTOR, ensure_components, collection)
+    t0 = time.perf_counter()
+    q_emb = await run_in(EMBED_EXECUTOR, retriever.embed_query, question)
+    _elapsed(timings, "embed_ms", t0)
+    results = await run_in(
+        SEARCH_EXECUTOR,
+        retriever.search,
+        q_emb,
+        top_k=top_k,
+        score_threshold=score_threshold,
+        query_text=question,
+        mode=mode,
+        rerank=rerank,
+        exact=exact,
+        filters=filters,
+        timings=timings,
+    )
+    return q_emb, results
+
+async def arun_rag_query(
+        question:str,
+        provider:str="hf",
+        top_k:int=settings.TOP_K,
+        score_threshold:float=settings.SCORE_THRESHOLD,
+        max_ctx_chars:int=settings.MAX_CTX_CHARS,
+        mode:Optional[str]=None,
+        rerank:Optional[bool]=None,
+        exact:Optional[bool]=None,
+        filters:Optional[Dict[str, Any]]=None,
+        collection:Optional[str]=None,
+        timings:Optional[Dict[str, float]]=None,
+    ) -> Tuple[str, List[Dict[str, Any]], str]:
+    """
+    async variant of run_rag_query, return (answer, retriever_results, used_provider)
+    """
+    q_emb, results = await _aretrieve_with_embedding(
+        question, top_k=top_k, score_threshold=score_threshold, mode=mode, rerank=rerank, exact=exact, filters=filters, collection=collection, timings=timings
+    )
+
+    if not results:
+        return settings.GUARD_SENTENCE, [], provider
+
+    _, vs, _ = await run_in(SEARCH_EXECUTOR, ensure_components, collection)
+    used = "grok" if provider == "grok" else "hf"
+    cached = _cached_answer(vs, used, max_ctx_chars, q_emb, results)
+    if cached is not None:
+        return cached, results, used
+
+    t0 = time.perf_counter()
+    async with provider_semaphore(used):
+        if used == "grok":
+            answer = await aRAG_Simple_Grok(
+                query=question,
+                results=results,
+                max_ctx_chars=max_ctx_chars
+            )
+        else:
+            answer = await aRAG_Simple_HF(
+                query=question,
+                results=results,
+                max_ctx_chars=max_ctx_chars
+            )
+    _elapsed(timings, "generate_ms", t0)
+
+    _store_answer(vs, used, max_ctx_chars, q_emb, results, answer)
+    return answer, results, used
+
+async def astream_rag_query(
+        question:str,
+        provider:str="hf",
+        top_k:int=settings.TOP_K,
+        score_threshold:float=settings.SCORE_THRESHOLD,
+        max_ctx_chars:int=settings.MAX_CTX_CHARS,
+        mode:Optional[str]=None,
+        rerank:Optional[bool]=None,
+        exact:Optional[bool]=None,
+        filters:Optional[Dict[str, Any]]=None,
+        collection:Optional[str]=None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    streaming variant of arun_rag_query, yields (event, payload) pairs:
+    one "citations" event first (with retrieval timings), then "token" events,
+    then "done" (with generate_ms).
+    """
+    timings: Dict[str, float] = {}
+    q_emb, results = await _aretrieve_with_embedding(
+        question, top_k=top_k, score_threshold=score_threshold, mode=mode, rerank=rerank, exact=exact, filters=filters, collection=collection, timings=timings
+    )
+    used = "grok" if provider == "grok" else "hf"
+    yield "citations", {"citations": citations_from_results(results), "used_provider": used, "timings": timings}
+
+    if not results:
+        yield "token", {"text": settings.GUARD_SENTENCE}
+        yield "done", {}
+        return
+
+    _, vs, _ = await run_in(SEARCH_EXECUTOR, ensure_components, collection)
+    cached = _cached_answer(vs, used, max_ctx_chars, q_emb, results)
+    if cached is not None:
+        yield "token", {"text": cached}
+        yield "done", {"cached": True}
+        return
+
+    parts: List[str] = []
+    t0 = time.perf_counter()
+    async with provider_semaphore(used):
+        if used == "grok":
+            stream = astream_RAG_Grok(query=question, results=results, max_ctx_chars=max_ctx_chars)
+        else:
+            stream = astream_RAG_HF(query=question, results=results, max_ctx_chars=max_ctx_chars)
+        async for text in stream:
+            if text:
+                parts.append(text)
+                yield "token", {"text": text}
+
+    _store_answer(vs, used, max_ctx_chars, q_emb, results, "".join(parts).strip())
+    yield "done", {"timings": {"generate_ms": (time.perf_counter() - t0) * 1000.0}}
+
+async def arun_rag_batch(
+        questions:List[str],
+        provider:str="hf",
+        top_k:int=settings.TOP_K,
+        score_threshold:float=settings.SCORE_THRESHOLD,
+        max_ctx_chars:int=settings.MAX_CTX_CHARS,
+        mode:Optional[str]=None,
+        rerank:Optional[bool]=None,
+        exact:Optional[bool]=None,
+        filters:Optional[Dict[str, Any]]=None,
+        collection:Optional[str]=None,
+    ) -> List[Dict[str, Any]]:
+    """
+    Answer many questions at once: one batched encode, batched store queries,
+    then LLM generation fanned out under the provider's concurrency limit.
+    returns one dict per question, in order: {answer, results, used_provider, error}
+    """
+    used = "grok" if provider == "grok" else "hf"
+    _, vs, retriever = await run_in(SEARCH_EXECUTOR, ensure_components, collection)
+
+    items: List[Dict[str, Any]] = [
+        {"answer": None, "results": [], "used_provider": used, "error": None} for _ in questions
+    ]
+    valid = [i for i, q in enumerate(questions) if q and q.strip()]
+    for i in set(range(len(questions))) - set(valid):
+        items[i]["error"] = "empty question"
+
+    try:
+        q_embs = await run_in(EMBED_EXECUTOR, retriever.embed_queries, [questions[i] for i in valid])
+        batch_results = await run_in(
+            SEARCH_EXECUTOR,
+            retriever.search_batch,
+            q_embs,
+            top_k=top_k,
+            score_threshold=score_threshold,
+            query_texts=[questions[i] for i in valid],
+            mode=mode,
+            rerank=rerank,
+            exact=exact,
+            filters=filters,
+        )
+    except Exception as e:
+        print(f"Batch retrieval failed: {e}")
+        for i in valid:
+            items[i]["error"] = f"retrieval failed: {e}"
+        return items
+
+    generate = aRAG_Simple_Grok if used == "grok" else aRAG_Simple_HF
+
+    async def _answer(i:int, q_emb, results:List[Dict[str, Any]]):
+        item = items[i]
+        item["results"] = results
+        if not results:
+            item["answer"] = settings.GUARD_SENTENCE
+            return
+        cached = _cached_answer(vs, used, max_ctx_chars, q_emb, results)
+        if cached is not None:
+            item["answer"] = cached
+            return
+        try:
+            async with provider_semaphore(used):
+                answer = await generate(query=questions[i], results=results, max_ctx_chars=max_ctx_chars)
+            item["answer"] = answer
+            _store_answer(vs, used, max_ctx_chars, q_emb, results, answer)
+        except Exception as e:
+            print(f"Batch item {i} failed: {e}")
+            item["error"] = str(e)
+
+    await asyncio.gather(*(
+        _answer(i, q_emb, results) for i, q_emb, results in zip(valid, q_embs, batch_results)
+    ))
+    return items
+
 def citations_from_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Transform retriever results into a list of citation dicts compatible with Citation model.
@@ -62,6 +348,7 @@ def citations_from_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]
             "source_file":m.get("source_name"),
             "page":m.get("page"),
             "similarity":float(r.get("similarity_score")),
+            "rerank_score":r.get("rerank_score"),
             "id":r.get("id"),
         })
-    return cites
\ No newline at end of file
+    return cites
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from rag.core.config import settings
+from rag.api.services.components import describe, ensure_components, init_timings, warm
+from rag.api.services.reindex import collect_retired
+
+
+class WarmupState:
+    """
+    Background startup: build the components and warm them (components.warm)
+    so the first real request doesn't pay for model load / cold caches.
+    Also reports which collection/model serves the default collection (a
+    model/index mismatch shows up here) and deletes collections retired by
+    an earlier reindex.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.error:Optional[str] = None
+        self.started_at:Optional[float] = None
+        self.finished_at:Optional[float] = None
+        self.timings:Dict[str, float] = {}
+        self.index:Dict[str, Any] = {}
+        self._thread:Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        t_start = time.perf_counter()
+        try:
+            components = ensure_components()
+            retriever = components[2]
+            self.index = describe(components)
+
+            t0 = time.perf_counter()
+            warm(components)
+            self.timings["warmup_ms"] = _ms_since(t0)
+
+            if settings.RERANK_ENABLED:
+                t0 = time.perf_counter()
+                retriever._get_reranker()
+                self.timings["reranker_ms"] = _ms_since(t0)
+
+            try:
+                collect_retired()
+            except Exception as e:
+                print(f"!! Collecting retired collections failed: {e}")
+
+            self.ready = True
+            print(f"Warm-up finished in {_ms_since(t_start):.0f} ms")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Warm-up failed: {e}")
+        finally:
+            self.timings["total_ms"] = _ms_since(t_start)
+            self.finished_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": {**init_timings(), **self.timings},
+            "index": self.index,
+        }
+
+
+def _ms_since(t0:float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 1)
+
+
+warmup = WarmupState()
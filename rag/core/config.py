@@ -19,6 +19,8 @@ class Settings(BaseSettings):
     # data loader configs 
     DATA_DIR:Path=PROJECT_ROOT / "data"
     MIN_CHARS:int=30
+    # PDF parser processes for load_data (1 = parse in-process)
+    LOADER_WORKERS:int=1
 
     #chunker func configs
     #chunking
@@ -36,16 +38,89 @@ class Settings(BaseSettings):
 
     #embedder class configs
     EMBEDDER_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # embedder runtime: "torch", "onnx" (ONNX Runtime) or "onnx-int8" (dynamic int8 quantization)
+    EMBEDDER_BACKEND:str="torch"
+    EMBEDDER_ONNX_DIR:Path=PROJECT_ROOT / "data" / "models" / "onnx"
+    EMBEDDER_ONNX_QUANT:str="avx2"
     NORMALIZE:bool=True
     BATCH_SIZE:int=16
+    # persistent chunk-embedding cache (keyed by model, normalize flag, text hash)
+    EMBED_CACHE_ENABLED:bool=True
+    EMBED_CACHE_DIR:Path=PROJECT_ROOT / "data" / "cache" / "embeddings"
+    EMBED_CACHE_MAX_MB:int=512
+    # one embedding sidecar process shared by all uvicorn workers (Unix socket)
+    EMBEDDING_SERVER_ENABLED:bool=False
+    EMBEDDING_SERVER_SOCKET:Path=PROJECT_ROOT / "data" / "run" / "embedder.sock"
+    EMBEDDING_SERVER_MAX_BATCH:int=64
+    EMBEDDING_SERVER_MAX_WAIT_MS:float=5.0
+    EMBEDDING_SERVER_START_TIMEOUT_S:float=180.0
 
     # Vector Store configs
+    # "chroma" (PersistentClient) or "native" (in-process mmap + IVF-flat, see native_store.py)
+    VECTOR_STORE_BACKEND:str="chroma"
+    NATIVE_VECTOR_DTYPE:str="float32"
+    NATIVE_IVF_MIN_ROWS:int=50000
+    NATIVE_IVF_NPROBE:int=16
+    NATIVE_COMPACT_RATIO:float=0.3
     COLLECTION_NAME:str = "pdf_documents"
     PERSIST_DIRECTORY_VS:Path = PROJECT_ROOT / "data" / "vector_store"
+    # multi-collection (per-tenant) serving: collections open on first use and the
+    # least recently used idle ones are closed beyond max-open or the memory budget
+    COLLECTIONS_MAX_OPEN:int=16
+    COLLECTIONS_MEMORY_BUDGET_MB:int=2048
+    # rough RAM per chunk on top of its vector (HNSW links, BM25 postings, metadata)
+    COLLECTION_BYTES_PER_CHUNK:int=2048
+    COLLECTION_NAME_PATTERN:str=r"[A-Za-z0-9][A-Za-z0-9_-]{1,61}[A-Za-z0-9]"
+    # PDFs of non-default collections live under <COLLECTIONS_DATA_DIR>/<collection>
+    COLLECTIONS_DATA_DIR:Path=PROJECT_ROOT / "data" / "collections"
+    # blue/green reindex (POST /v1/reindex): shadow collection checks before the alias swap
+    REINDEX_VALIDATION_SAMPLES:int=50
+    REINDEX_MIN_SELF_RECALL:float=0.9
+    REINDEX_MIN_COUNT_RATIO:float=0.5
+    # a replaced collection is kept this long for in-flight requests and other workers
+    REINDEX_GC_GRACE_S:float=300.0
+    # how often a worker re-reads the alias table to pick up swaps made by another worker
+    ALIAS_REFRESH_S:float=2.0
+    # upsert batch size (capped by the Chroma client's max batch size)
+    UPSERT_BATCH_SIZE:int=5000
+    # overlap embedding of batch N+1 with the upsert of batch N while indexing
+    UPSERT_IN_BACKGROUND:bool=True
+
+    # background indexing jobs
+    JOBS_DB_PATH:Path = PROJECT_ROOT / "data" / "jobs.sqlite3"
+    INDEX_JOB_WORKERS:int=1
+    # streaming indexer: chunks per embed+upsert micro-batch, manifest checkpoint interval
+    INDEX_EMBED_BATCH:int=256
+    MANIFEST_SAVE_INTERVAL_S:float=5.0
 
     # retriever configs
     TOP_K:int=3
     SCORE_THRESHOLD:float=0.35
+    # retrieval caches (query text -> embedding, query embedding -> results)
+    QUERY_CACHE_SIZE:int=2048
+    QUERY_CACHE_TTL_S:float=3600.0
+    RETRIEVAL_CACHE_SIZE:int=2048
+    RETRIEVAL_CACHE_TTL_S:float=600.0
+    # retrieval mode: "vector" (HNSW only) or "hybrid" (vector + BM25, fused with RRF)
+    RETRIEVAL_MODE:str="vector"
+    LEXICAL_INDEX_ENABLED:bool=True
+    LEXICAL_COMPACT_EVERY:int=50000
+    HYBRID_CANDIDATES:int=20
+    RRF_K:int=60
+    # brute-force search over an in-RAM matrix while the collection is at most this big (0 = never auto)
+    EXACT_SEARCH_MAX_CHUNKS:int=100000
+    # cross-encoder rerank stage (over-fetch, rescore, cut to top_k)
+    RERANK_ENABLED:bool=False
+    RERANK_MODEL_NAME:str="cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_OVERFETCH:int=4
+    RERANK_MAX_CANDIDATES:int=40
+    RERANK_MAX_SEQ_LENGTH:int=256
+    # torch intra-op threads for the whole process (embedder and reranker alike),
+    # applied once at startup by the API and the embedding server; None = torch default
+    TORCH_NUM_THREADS:int | None = None
+    # /v1/query/batch: max questions per request, embeddings per store query
+    BATCH_QUERY_MAX:int=10000
+    BATCH_QUERY_CHUNK:int=1024
 
     #GROK LLM configs
     GROK_API_KEY: str | None = os.getenv("GROK_API_KEY")
@@ -55,6 +130,12 @@ class Settings(BaseSettings):
 
     MAX_CTX_CHARS:int= 8000
 
+    # semantic answer cache (skip the LLM for near-duplicate questions)
+    ANSWER_CACHE_ENABLED:bool=False
+    ANSWER_CACHE_MAX_DISTANCE:float=0.05
+    ANSWER_CACHE_SIZE:int=1000
+    ANSWER_CACHE_MAX_NAMESPACES:int=16
+
     # HF Endpoint configs
     HF_TOKEN: str = os.getenv("HF_TOKEN")
     HF_ENDPOINT_URL: str = "https://u8hxw751s4q6eqhs.eu-west-1.aws.endpoints.huggingface.cloud"
@@ -64,6 +145,19 @@ class Settings(BaseSettings):
     GUARD_SENTENCE:str = "I don't know from the provided documents."
     TASK:str="text-generation"
 
+    # LLM client pool configs (shared clients, see rag/pipeline/LLM/registry.py)
+    LLM_POOL_MAXSIZE:int=32
+    LLM_KEEPALIVE_EXPIRY:float=60.0
+    LLM_REQUEST_TIMEOUT:float=120.0
+
+    # async query path: executors for blocking work + per-provider LLM limits
+    EMBED_EXECUTOR_WORKERS:int=2
+    SEARCH_EXECUTOR_WORKERS:int=8
+    GROK_MAX_CONCURRENCY:int=64
+    HF_MAX_CONCURRENCY:int=8
+    # load models and open the store in the background at startup (/ready flips when done)
+    WARMUP_ON_STARTUP:bool=True
+
     # api configs
     API_KEY:str| None = os.getenv("API_KEY")
 
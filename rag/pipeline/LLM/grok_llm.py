@@ -1,14 +1,29 @@
 from langchain_xai import ChatXAI
 from rag.core.config import settings
+from rag.pipeline.LLM.registry import llm_registry, make_httpx_clients
 
-def get_grok_llm() -> ChatXAI:
+def get_grok_llm(
+        model: str = settings.GROK_MODEL,
+        temperature: float = settings.GROK_TEMPERATURE,
+        max_tokens: int = settings.GROK_MAX_TOKENS,
+    ) -> ChatXAI:
+    """
+    return the shared ChatXAI client for (model, temperature, max_tokens).
+    """
     if not settings.GROK_API_KEY:
         raise RuntimeError(
             "GROK_API_KEY is not set. Add it to your environment or .env file."
         )
-    return ChatXAI(
-        model=settings.GROK_MODEL,
-        xai_api_key=settings.GROK_API_KEY,
-        temperature=settings.GROK_TEMPERATURE,
-        max_tokens=settings.GROK_MAX_TOKENS,
-    )
+
+    def _create() -> ChatXAI:
+        http_client, http_async_client = make_httpx_clients()
+        return ChatXAI(
+            model=model,
+            xai_api_key=settings.GROK_API_KEY,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+
+    return llm_registry.get_or_create(("grok", model, temperature, max_tokens), _create)
@@ -1,13 +1,24 @@
 from langchain_huggingface import HuggingFaceEndpoint
 from rag.core.config import settings
+from rag.pipeline.LLM.registry import llm_registry, configure_hf_http_backend
 
-def get_hf_llm():
-    llm_hf = HuggingFaceEndpoint(
-        endpoint_url=settings.HF_ENDPOINT_URL,
-        huggingfacehub_api_token=settings.HF_TOKEN,
-        task=settings.TASK,
-        max_new_tokens=settings.HF_MAX_TOKENS,
-        temperature=settings.HF_TEMPERATURE,
-        return_full_text=settings.HF_RETURN_FULL_TEXT,
-    )
-    return llm_hf
\ No newline at end of file
+def get_hf_llm(
+        max_new_tokens: int = settings.HF_MAX_TOKENS,
+        temperature: float = settings.HF_TEMPERATURE,
+    ) -> HuggingFaceEndpoint:
+    """
+    return the shared HF endpoint client for (endpoint, temperature, max_new_tokens).
+    """
+    configure_hf_http_backend()
+
+    def _create() -> HuggingFaceEndpoint:
+        return HuggingFaceEndpoint(
+            endpoint_url=settings.HF_ENDPOINT_URL,
+            huggingfacehub_api_token=settings.HF_TOKEN,
+            task=settings.TASK,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            return_full_text=settings.HF_RETURN_FULL_TEXT,
+        )
+
+    return llm_registry.get_or_create(("hf", settings.HF_ENDPOINT_URL, temperature, max_new_tokens), _create)
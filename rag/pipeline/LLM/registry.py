@@ -0,0 +1,99 @@
+from __future__ import annotations
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from rag.core.config import settings
+
+
+class LLMClientRegistry:
+    """
+    Process-wide registry of LLM clients.
+    Holds one client per (provider, model, temperature, max_tokens) key so the
+    underlying HTTP connection pool (and its keep-alive connections) is reused
+    across requests instead of paying a TLS handshake per query.
+
+    Clients stored here are shared between threads: callers must pass
+    per-request generation parameters at invoke time and never set attributes
+    on a client returned by `get_or_create`.
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple[Hashable, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Tuple[Hashable, ...], factory: Callable[[], Any]) -> Any:
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+llm_registry = LLMClientRegistry()
+
+
+def make_httpx_clients():
+    """
+    return (sync_client, async_client) httpx clients sharing the configured
+    connection pool size and keep-alive expiry.
+    """
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=settings.LLM_POOL_MAXSIZE,
+        max_keepalive_connections=settings.LLM_POOL_MAXSIZE,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(settings.LLM_REQUEST_TIMEOUT)
+    return (
+        httpx.Client(limits=limits, timeout=timeout),
+        httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
+
+_HF_BACKEND_CONFIGURED = False
+_HF_BACKEND_LOCK = threading.Lock()
+
+def configure_hf_http_backend():
+    """
+    huggingface_hub's InferenceClient (used by HuggingFaceEndpoint) takes its
+    requests.Session from a process-wide backend factory; size its pool once.
+    """
+    global _HF_BACKEND_CONFIGURED
+    if _HF_BACKEND_CONFIGURED:
+        return
+    with _HF_BACKEND_LOCK:
+        if _HF_BACKEND_CONFIGURED:
+            return
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from huggingface_hub import configure_http_backend
+        except ImportError:
+            # newer huggingface_hub releases manage their own pooled client
+            _HF_BACKEND_CONFIGURED = True
+            return
+
+        def _session_factory() -> "requests.Session":
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.LLM_POOL_MAXSIZE,
+                pool_maxsize=settings.LLM_POOL_MAXSIZE,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            return session
+
+        configure_http_backend(backend_factory=_session_factory)
+        _HF_BACKEND_CONFIGURED = True
@@ -0,0 +1,162 @@
+from __future__ import annotations
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from rag.core.config import settings
+from rag.utility.helpers import pid_alive
+
+
+class AliasTable:
+    """
+    Collection name as clients see it (the alias) -> physical collection
+    currently serving it, plus the index config it was built with
+    (embedder_model, chunk_size, chunk_overlap):
+        {"aliases": {alias: {"collection", "embedder_model", "chunk_size", "chunk_overlap", "swapped_at"}},
+         "building": {alias: {"collection": shadow, "pid": owner, "started_at"}},
+         "retired": [{"collection", "retired_at"}]}
+
+    One JSON file next to the vector store, replaced atomically (tmp file +
+    rename) under a file lock, so a swap is a single rename and every process
+    sees either the old or the new mapping. An alias without an entry is
+    served by the physical collection of the same name (pre-reindex layout).
+
+    Rebuilds of one alias are serialized across processes by `build_lock`,
+    and every write to it (indexing, deletes, the final catch-up and swap of
+    a rebuild) by `write_lock`; a "building" entry records its owner pid so
+    that only the shadow of a build whose process is gone is reclaimed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {"aliases": {}, "building": {}, "retired": []}
+        self._mtime: Optional[int] = None
+        self.reload_if_changed()
+
+    @classmethod
+    def for_store(cls, persist_directory: Path = settings.PERSIST_DIRECTORY_VS) -> "AliasTable":
+        return cls(Path(persist_directory) / "aliases.json")
+
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        """re-read the file if another process (or thread) replaced it; True if it changed"""
+        mtime = self._stat_mtime()
+        if mtime == self._mtime:
+            return False
+        data: Dict[str, Any] = {}
+        if mtime is not None:
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"!! Ignoring unreadable alias table {self.path}: {e}")
+                return False
+        with self._lock:
+            self._data = {
+                "aliases": dict(data.get("aliases") or {}),
+                "building": dict(data.get("building") or {}),
+                "retired": list(data.get("retired") or []),
+            }
+            self._mtime = mtime
+        return True
+
+    def resolve(self, alias: str) -> str:
+        """physical collection serving `alias`"""
+        entry = self._data["aliases"].get(alias)
+        return entry["collection"] if entry else alias
+
+    def info(self, alias: str) -> Dict[str, Any]:
+        return dict(self._data["aliases"].get(alias) or {})
+
+    def retired(self) -> List[Dict[str, Any]]:
+        return list(self._data["retired"])
+
+    def aliases(self) -> Dict[str, Dict[str, Any]]:
+        return {k: dict(v) for k, v in self._data["aliases"].items()}
+
+    # ------------------------------------------------------------------ writes
+
+    @contextmanager
+    def _editing(self) -> Iterator[Dict[str, Any]]:
+        """read-modify-write under an exclusive file lock (other workers may write too)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix(".lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._mtime = None
+                self.reload_if_changed()
+                data = {k: (dict(v) if isinstance(v, dict) else list(v)) for k, v in self._data.items()}
+                yield data
+                tmp = self.path.with_suffix(".json.tmp")
+                tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+                os.replace(tmp, self.path)
+                self._mtime = None
+                self.reload_if_changed()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _alias_flock(self, alias: str, kind: str) -> Iterator[None]:
+        """exclusive flock on <aliases>.<alias>.<kind>.lock; the kernel drops it if the holder dies"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(f"{self.path.stem}.{alias}.{kind}.lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def build_lock(self, alias: str):
+        """held for a whole rebuild of `alias`; a second rebuild (any worker, any thread) waits"""
+        return self._alias_flock(alias, "build")
+
+    def write_lock(self, alias: str):
+        """held while writing to the collection behind `alias`, so writes never overlap a swap"""
+        return self._alias_flock(alias, "write")
+
+    def begin_build(self, alias: str, shadow: str) -> Optional[str]:
+        """
+        record the shadow being built for `alias` by this process; returns the
+        leftover shadow of a build whose owner died. raises RuntimeError if
+        another live process is building `alias`.
+        """
+        with self._editing() as data:
+            stale = data["building"].get(alias)
+            if isinstance(stale, dict):
+                owner = stale.get("pid")
+                if owner != os.getpid() and pid_alive(owner):
+                    raise RuntimeError(f"{alias} is already being rebuilt by pid {owner} into {stale.get('collection')}")
+                stale = stale.get("collection")
+            # plain string: written before owners were recorded, reclaim it
+            data["building"][alias] = {"collection": shadow, "pid": os.getpid(), "started_at": time.time()}
+        return stale if stale != shadow else None
+
+    def end_build(self, alias: str):
+        with self._editing() as data:
+            data["building"].pop(alias, None)
+
+    def swap(self, alias: str, collection: str, **info: Any) -> str:
+        """point `alias` at `collection` (atomically); the previous one is retired. returns it"""
+        with self._editing() as data:
+            old = (data["aliases"].get(alias) or {}).get("collection", alias)
+            data["aliases"][alias] = {"collection": collection, **info, "swapped_at": time.time()}
+            data["building"].pop(alias, None)
+            if old != collection:
+                data["retired"].append({"collection": old, "retired_at": time.time()})
+        return old
+
+    def forget_retired(self, names: List[str]):
+        if not names:
+            return
+        with self._editing() as data:
+            data["retired"] = [r for r in data["retired"] if r.get("collection") not in set(names)]
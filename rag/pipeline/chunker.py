@@ -1,6 +1,6 @@
 import hashlib
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List
 
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -8,18 +8,18 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from rag.utility.helpers import get_chunk_id, normalize_text
 from rag.core.config import settings
 
-def chunk_document(
-        documents:List[Document],
+def iter_chunks(
+        documents:Iterable[Document],
         chunk_size:int=settings.CHUNK_SIZE,
         chunk_overlap:int=settings.CHUNK_OVERLAP,
         min_chunk_chars:int=settings.MIN_CHUNK_CHARS,
         *,
         encoding_name:str=settings.TIKTOKEN_ENCODING,
         id_prefix_len:int=settings.CHUNK_ID_PREFIX_LEN
-    ) -> List[Document]:
+    ) -> Iterator[Document]:
     """
-    split page-level documents into chunk-level documet with stable metadata.
-    expects each input Document to represent one page (PuPDFLoader behavior)
+    streaming form of chunk_document: consumes page-level documents one at a
+    time and yields chunk-level documents, holding only the current page.
     """
     separators=settings.CHUNK_SEPARATORS
     
@@ -36,8 +36,10 @@ def chunk_document(
         keep_separator=False,
     )
 
-    split_docs:List[Document] = []
-    seen_within_page = {}
+    # dedup is within a page; pages arrive contiguously so only the
+    # current page's signatures need to be kept
+    page_key = None
+    seen = set()
 
     for d in documents:
         meta = dict(d.metadata or {})
@@ -47,7 +49,9 @@ def chunk_document(
         parts = text_splitter.split_text(d.page_content or "")
         running = 0
 
-        seen = seen_within_page.setdefault((src_abs, page), set())
+        if (src_abs, page) != page_key:
+            page_key = (src_abs, page)
+            seen = set()
 
         for idx, raw in enumerate(parts):
             raw_stripped = (raw or "").strip()
@@ -76,10 +80,33 @@ def chunk_document(
             }
 
             running += len(raw_stripped)
-            split_docs.append(Document(page_content=norm, metadata=child_meta))
+            yield Document(page_content=norm, metadata=child_meta)
+
+def chunk_document(
+        documents:List[Document],
+        chunk_size:int=settings.CHUNK_SIZE,
+        chunk_overlap:int=settings.CHUNK_OVERLAP,
+        min_chunk_chars:int=settings.MIN_CHUNK_CHARS,
+        *,
+        encoding_name:str=settings.TIKTOKEN_ENCODING,
+        id_prefix_len:int=settings.CHUNK_ID_PREFIX_LEN
+    ) -> List[Document]:
+    """
+    split page-level documents into chunk-level documet with stable metadata.
+    expects each input Document to represent one page (PuPDFLoader behavior)
+    """
+    split_docs:List[Document] = list(iter_chunks(
+        documents,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        min_chunk_chars=min_chunk_chars,
+        encoding_name=encoding_name,
+        id_prefix_len=id_prefix_len,
+    ))
+    _, _, using_tok = get_chunk_id(encoding_name=encoding_name, id_prefix_len=id_prefix_len)
     
     print(
         f"Split {len(documents)} page-docs into {len(split_docs)} chunks "
         f"(tokenizer={'tiktoken' if using_tok else 'chars'})"
     )
-    return split_docs
\ No newline at end of file
+    return split_docs
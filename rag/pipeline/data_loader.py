@@ -1,70 +1,191 @@
 from __future__ import annotations
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Union, Optional
+from typing import Iterable, Iterator, List, Union, Optional, Tuple
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 
 from rag.utility.helpers import sha256_file
 from rag.core.config import settings
 
-def load_data(
-        data_dir: Union[str, Path, None] = None,
-        min_chars: Optional[int] = None,
-    ) -> List[Document]:
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
 
+def _get_pool(workers:int) -> ProcessPoolExecutor:
     """
-    Recursively load PDFs under `data_dir` and return page-level documents
-    enriched with stable file metadata (absolute path, source path, mtime, sha256)
+    process pool shared across load_data calls (worker start-up is paid once).
+    "spawn" so workers never inherit locks/threads of the API process.
+    """
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _POOL_WORKERS = workers
+        return _POOL
 
-    Args:
-        data_dir:Root directory to scan for PDFs
-        min_chars:Minimum non-whitespace charaters to keep a page
+def _reset_pool(pool:ProcessPoolExecutor):
+    """drop a broken pool so the next _get_pool starts a fresh one"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False)
+
+def _submit(pool:ProcessPoolExecutor, abs_path:Path, min_chars:int) -> Future:
+    try:
+        return pool.submit(_load_file, abs_path, min_chars)
+    except BrokenProcessPool as e:
+        fut = Future()
+        fut.set_exception(e)
+        return fut
+
+def _retry_alone(abs_path:Path, min_chars:int, workers:int) -> Tuple[List[Document], int, Optional[str]]:
+    """re-parse one file in a fresh pool after a worker crash; a second crash skips the file"""
+    pool = _get_pool(workers)
+    try:
+        return pool.submit(_load_file, abs_path, min_chars).result()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        return [], 0, "parser process crashed"
+
+def _load_file(abs_path:Path, min_chars:int) -> Tuple[List[Document], int, Optional[str]]:
+    """
+    parse one PDF into page-level documents with file metadata.
+    returns (documents, skipped_pages, error); runs in a worker process when
+    parallel loading is enabled, so it must stay a top-level function.
+    """
+    try:
+        loader = PyPDFLoader(str(abs_path))
+        documents = loader.load()
+    except Exception as e:
+        return [], 0, str(e)
+
+    file_hash = sha256_file(abs_path)
+    try:
+        mtime = abs_path.stat().st_mtime
+    except Exception:
+        mtime = None
+
+    skipped_pages = 0
+    for doc in documents:
+        content = (doc.page_content or "").strip()
+        if len(content) < min_chars:
+            skipped_pages += 1
+            continue
+        meta = dict(doc.metadata or {})
+        page = meta.get("page")
+        meta.update({
+            "source":str(abs_path),
+            "source_file":str(abs_path),
+            "source_name":abs_path.name,
+            "file_type":"pdf",
+            "file_sha256":file_hash,
+            "file_mtime":mtime,
+            "page":page if page is not None else None,
+        })
+        doc.metadata=meta
+    return documents, skipped_pages, None
+
+def _iter_parsed(abs_paths:List[Path], min_chars:int, workers:int):
+    """
+    yield _load_file results in file order. In parallel mode at most
+    2 * workers files are in flight, so parsed pages never pile up in memory
+    when the consumer (chunk/embed/upsert) is slower than the parsers.
     """
+    if workers <= 1 or len(abs_paths) <= 1:
+        for p in abs_paths:
+            yield _load_file(p, min_chars)
+        return
+
+    pool = _get_pool(workers)
+    window = deque()
+    paths = iter(abs_paths)
+    for p in paths:
+        window.append((p, _submit(pool, p, min_chars)))
+        if len(window) >= 2 * workers:
+            break
+    while window:
+        p, fut = window.popleft()
+        try:
+            result = fut.result()
+        except BrokenProcessPool:
+            # a worker died (segfault/OOM in the parser) and took every file in
+            # flight with it: re-run those one at a time, then carry on
+            _reset_pool(pool)
+            retry = [p] + [q for q, _ in window]
+            window.clear()
+            for q in retry:
+                yield _retry_alone(q, min_chars, workers)
+            pool = _get_pool(workers)
+            for q in paths:
+                window.append((q, _submit(pool, q, min_chars)))
+                if len(window) >= 2 * workers:
+                    break
+            continue
+        nxt = next(paths, None)
+        if nxt is not None:
+            window.append((nxt, _submit(pool, nxt, min_chars)))
+        yield result
 
+def iter_load_data(
+        data_dir: Union[str, Path, None] = None,
+        min_chars: Optional[int] = None,
+        files: Optional[Iterable[Union[str, Path]]] = None,
+        workers: Optional[int] = None,
+    ) -> Iterator[Tuple[Path, List[Document]]]:
+    """
+    Streaming form of load_data: yields (abs_path, page_documents) one file at a
+    time, in file order. Files that fail to parse are skipped (and not yielded).
+    """
     data_dir = Path(data_dir) if data_dir is not None else settings.DATA_DIR
     min_chars = int(min_chars) if min_chars is not None else settings.MIN_CHARS
+    workers = int(workers) if workers is not None else settings.LOADER_WORKERS
 
     data_dir = Path(data_dir)
-    files = list(data_dir.glob("**/*.pdf"))
+    files = [Path(f) for f in files] if files is not None else list(data_dir.glob("**/*.pdf"))
     print(f"Number of files {len(files)}")
-    all_documents: List[Document] = []
+    abs_paths = [f.resolve() for f in files]
     skipped_pages = 0
 
-    for file in files:
-        abs_path = file.resolve()
+    for abs_path, (documents, skipped, error) in zip(abs_paths, _iter_parsed(abs_paths, min_chars, workers)):
         print(f"Processing file: {abs_path}")
-
-        try:
-            loader = PyPDFLoader(str(abs_path))
-            documents = loader.load()
-        except Exception as e:
-            print(f"!! Skipping {abs_path} due to error: {e}")
+        if error is not None:
+            print(f"!! Skipping {abs_path} due to error: {error}")
             continue
+        skipped_pages += skipped
+        yield abs_path, documents
+    print(f"skipped (short/blank) so far: {skipped_pages}")
 
-        file_hash = sha256_file(abs_path)
-        try:
-            mtime = abs_path.stat().st_mtime
-        except Exception:
-            mtime = None
-
-        for doc in documents:
-            content = (doc.page_content or "").strip()
-            if len(content) < min_chars:
-                skipped_pages += 1
-                continue
-            meta = dict(doc.metadata or {})
-            page = meta.get("page")
-            meta.update({
-                "source":str(abs_path),
-                "source_file":str(abs_path),
-                "source_name":abs_path.name,
-                "file_type":"pdf",
-                "file_sha256":file_hash,
-                "file_mtime":mtime,
-                "page":page if page is not None else None,
-            })
-            doc.metadata=meta
+def load_data(
+        data_dir: Union[str, Path, None] = None,
+        min_chars: Optional[int] = None,
+        files: Optional[Iterable[Union[str, Path]]] = None,
+        workers: Optional[int] = None,
+    ) -> List[Document]:
+
+    """
+    Recursively load PDFs under `data_dir` and return page-level documents
+    enriched with stable file metadata (absolute path, source path, mtime, sha256)
+
+    Args:
+        data_dir:Root directory to scan for PDFs
+        min_chars:Minimum non-whitespace charaters to keep a page
+        files:Explicit PDF paths to load instead of scanning `data_dir`
+        workers:Parser processes (defaults to settings.LOADER_WORKERS; 1 = in-process).
+                Output order is the file order either way.
+    """
+    all_documents: List[Document] = []
+    for _, documents in iter_load_data(data_dir, min_chars=min_chars, files=files, workers=workers):
         all_documents.extend(documents)
-    print(f"skipped (short/blank) so far: {skipped_pages}")
     print(f"\nTotal documents loaded: {len(all_documents)}")
-    return all_documents
\ No newline at end of file
+    return all_documents
@@ -1,8 +1,11 @@
-from typing import List, Optional
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
 from rag.core.config import settings
+from rag.pipeline.embedding_cache import EmbeddingCache, text_key
 
 class Embedder:
     """
@@ -11,7 +14,10 @@ class Embedder:
         model_name (str): Name of the SentenceTransformer model to load.
         normalize (bool): Whether to normalize embeddings for cosine similarity.
         batch_size (int): Number of texts to embed in each batch.
+        backend (str): "torch", "onnx" (ONNX Runtime) or "onnx-int8" (dynamically quantized ONNX).
         model (Optional[SentenceTransformer]): The loaded embedding model instance.
+        cache (Optional[EmbeddingCache]): On-disk cache keyed by (model, normalize, text hash);
+            when set, only cache misses are encoded.
 
     Methods:
         generate_embeddings(texts: List[str]) -> np.ndarray:
@@ -26,34 +32,106 @@ class Embedder:
                  normalize:bool=settings.NORMALIZE,
                  batch_size:int=settings.BATCH_SIZE,
                  device:Optional[str]=None,
+                 cache_dir:Optional[Path]=None,
+                 backend:str=settings.EMBEDDER_BACKEND,
                 ):
         self.model_name=model_name
         self.normalize=normalize
         self.batch_size=batch_size
+        self.backend=(backend or "torch").lower()
+        if self.backend not in ("torch", "onnx", "onnx-int8"):
+            raise ValueError(f"unknown embedder backend: {backend}")
         self.model:Optional[SentenceTransformer]=None
+        self.cache:Optional[EmbeddingCache]=None
         self._initialize_model()
+        if cache_dir is not None:
+            self.cache = EmbeddingCache(
+                cache_dir=cache_dir,
+                model_name=self.cache_model_id,
+                normalize=self.normalize,
+                dim=self.model.get_sentence_embedding_dimension(),
+            )
     
+    @property
+    def cache_model_id(self) -> str:
+        """identity used by the embedding cache; int8 vectors drift, so they get their own namespace"""
+        if self.backend == "onnx-int8":
+            return f"{self.model_name}#int8-{settings.EMBEDDER_ONNX_QUANT}"
+        return self.model_name
+
     def _initialize_model(self):
-        print(f"Loading Embedding Model: {self.model_name}")
-        self.model=SentenceTransformer(self.model_name)
+        print(f"Loading Embedding Model: {self.model_name} (backend={self.backend})")
+        if self.backend == "torch":
+            self.model=SentenceTransformer(self.model_name)
+        else:
+            self.model=self._load_onnx(quantize=self.backend == "onnx-int8")
         dim = self.model.get_sentence_embedding_dimension()
         print(f"Model loaded. EMbedding dimension: {dim}")
+
+    def _load_onnx(self, quantize:bool) -> SentenceTransformer:
+        """
+        export the model to ONNX once (and quantize it to int8 if asked) under
+        EMBEDDER_ONNX_DIR, then load it with ONNX Runtime on CPU.
+        needs `sentence-transformers[onnx]`.
+        """
+        local = Path(settings.EMBEDDER_ONNX_DIR) / self.model_name.replace("/", "__")
+        if not (local / "onnx" / "model.onnx").exists():
+            print(f"Exporting {self.model_name} to ONNX at {local}")
+            exported = SentenceTransformer(self.model_name, backend="onnx", device="cpu")
+            exported.save_pretrained(str(local))
+        if not quantize:
+            return SentenceTransformer(str(local), backend="onnx", device="cpu")
+
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        quant = settings.EMBEDDER_ONNX_QUANT
+        file_name = f"onnx/model_qint8_{quant}.onnx"
+        if not (local / file_name).exists():
+            print(f"Quantizing ONNX model to int8 ({quant})")
+            fp32 = SentenceTransformer(str(local), backend="onnx", device="cpu")
+            export_dynamic_quantized_onnx_model(fp32, quant, str(local))
+        return SentenceTransformer(
+            str(local), backend="onnx", device="cpu", model_kwargs={"file_name": file_name}
+        )
     
-    def generate_embeddings(self, texts:List[str]) -> np.ndarray:
+    def generate_embeddings(self, texts:List[str], show_progress_bar:bool=True) -> np.ndarray:
         """Embedding funtion for external knowledge"""
         if self.model is None:
             raise ValueError("embeddding model is not initialized")
         if texts is None or len(texts) == 0:
             dim = self.model.get_sentence_embedding_dimension()
             return np.empty((0, dim), dtype=np.float32)
+        if self.cache is not None:
+            return self._generate_cached(texts, show_progress_bar)
         print(f"Generating embedding for {len(texts)} texts")
-        embs = self.model.encode(
+        embs = self._encode(texts, show_progress_bar)
+        print(f"Generated emebddings with shape {embs.shape}")
+        return embs
+
+    def _encode(self, texts:List[str], show_progress_bar:bool) -> np.ndarray:
+        return self.model.encode(
             texts, 
             batch_size=self.batch_size,
-            show_progress_bar=True,
+            show_progress_bar=show_progress_bar,
             normalize_embeddings=self.normalize,
             convert_to_numpy=True
         ).astype(np.float32, copy=False)
+
+    def _generate_cached(self, texts:List[str], show_progress_bar:bool) -> np.ndarray:
+        """look every text up in the cache and encode only the misses"""
+        keys = [text_key(t) for t in texts]
+        hit_vecs, hit_mask = self.cache.get_many(keys)
+        miss_idx = np.flatnonzero(~hit_mask)
+        print(f"Generating embedding for {len(texts)} texts ({len(texts) - miss_idx.size} cached)")
+
+        dim = self.model.get_sentence_embedding_dimension()
+        embs = np.empty((len(texts), dim), dtype=np.float32)
+        embs[hit_mask] = hit_vecs
+        if miss_idx.size:
+            miss_texts = [texts[i] for i in miss_idx]
+            miss_embs = self._encode(miss_texts, show_progress_bar)
+            embs[miss_idx] = miss_embs
+            self.cache.put_many([keys[i] for i in miss_idx], miss_embs)
         print(f"Generated emebddings with shape {embs.shape}")
         return embs
     
@@ -73,3 +151,54 @@ class Embedder:
         print(f"Generated 1 embedding with dim {emb.shape}")
         return emb
         
+
+    def generate_query_embeddings(self, queries:List[str]) -> np.ndarray:
+        """embedding function for many queries at once (one encode call, bypasses the chunk cache)"""
+        if self.model is None:
+            raise ValueError("Embedding model is not initialized")
+        if not queries:
+            dim = self.model.get_sentence_embedding_dimension()
+            return np.empty((0, dim), dtype=np.float32)
+        embs = self._encode([q or "" for q in queries], show_progress_bar=False)
+        print(f"Generated {embs.shape[0]} query embeddings")
+        return embs
+
+
+def check_backend_parity(
+        texts:List[str],
+        backend:str,
+        model_name:str=settings.EMBEDDER_MODEL_NAME,
+    ) -> Dict[str, float]:
+    """
+    encode `texts` with the torch backend and with `backend`, and report
+    cosine drift between the two plus encode time of each.
+    vectors are only interchangeable if dims match and min_cosine stays close to 1.
+    """
+    if not texts:
+        raise ValueError("parity check needs at least one text")
+    ref = Embedder(model_name=model_name, backend="torch")
+    cand = Embedder(model_name=model_name, backend=backend)
+
+    t0 = time.perf_counter()
+    a = ref._encode(texts, show_progress_bar=False)
+    ref_ms = (time.perf_counter() - t0) * 1000.0
+    t0 = time.perf_counter()
+    b = cand._encode(texts, show_progress_bar=False)
+    cand_ms = (time.perf_counter() - t0) * 1000.0
+
+    if a.shape != b.shape:
+        raise ValueError(f"embedding shape mismatch: torch {a.shape} vs {backend} {b.shape}")
+    an = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    bn = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    cos = np.sum(an * bn, axis=1)
+    report = {
+        "dim": float(a.shape[1]),
+        "mean_cosine": float(cos.mean()),
+        "min_cosine": float(cos.min()),
+        "max_drift": float(1.0 - cos.min()),
+        "max_norm_deviation": float(np.abs(np.linalg.norm(b, axis=1) - 1.0).max()) if ref.normalize else 0.0,
+        "torch_ms": ref_ms,
+        f"{backend}_ms": cand_ms,
+    }
+    print(f"Parity torch vs {backend}: {report}")
+    return report
@@ -0,0 +1,201 @@
+from __future__ import annotations
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from rag.core.config import settings
+
+
+def text_key(text: str) -> bytes:
+    """
+    content address of a chunk text (same sha256 the chunker uses for dedup),
+    hex so it never contains NUL bytes (numpy S-dtypes strip trailing NULs)
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest().encode("ascii")
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache.
+
+    One directory per (model name, normalize flag) holding three row-aligned
+    memory-mapped files:
+        vectors.f32  float32 (capacity, dim)
+        keys.bin     S64 hex sha256 of the text (empty = free row)
+        ticks.bin    int64 last-use counter, for LRU eviction
+        slot_gen.bin int64 generation of the last key change of each row
+    Because each row stores its own key, the index is rebuilt from keys.bin on
+    open and can never point at a vector that was overwritten.
+    Capacity comes from a size budget (max_mb); when full, the least recently
+    used 10% of rows are evicted.
+
+    Several processes (uvicorn workers, index jobs) may share the directory:
+    lookups and writes take an exclusive flock on cache.lock (a hit updates
+    ticks.bin), and generation.bin counts key changes. A process that sees a
+    new generation re-reads only the rows whose slot_gen is newer than the
+    generation it last synced to.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        model_name: str,
+        normalize: bool,
+        dim: int,
+        max_mb: int = settings.EMBED_CACHE_MAX_MB,
+    ):
+        slug = hashlib.sha256(f"{model_name}|{int(bool(normalize))}".encode("utf-8")).hexdigest()[:16]
+        self.dir = Path(cache_dir) / slug
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.dim = int(dim)
+        self.capacity = max(1, int(max_mb) * 1024 * 1024 // (self.dim * 4 + 64 + 8))
+        self._lock = threading.Lock()
+        self._lock_file = open(self.dir / "cache.lock", "a+")
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._open(model_name, normalize)
+        print(f"Embedding cache at {self.dir}: {len(self._index)}/{self.capacity} entries")
+
+    @contextmanager
+    def _file_lock(self, op: int) -> Iterator[None]:
+        fcntl.flock(self._lock_file, op)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open(self, model_name: str, normalize: bool):
+        """map the files, (re)creating them if the layout changed (exclusive file lock held)"""
+        meta = {"model_name": model_name, "normalize": bool(normalize), "dim": self.dim, "capacity": self.capacity}
+        meta_path = self.dir / "meta.json"
+        fresh = True
+        if meta_path.exists():
+            try:
+                fresh = json.loads(meta_path.read_text(encoding="utf-8")) != meta
+            except Exception:
+                fresh = True
+        self.vectors = self._map("vectors.f32", np.float32, (self.capacity, self.dim), fresh)
+        self.keys = self._map("keys.bin", "S64", (self.capacity,), fresh)
+        self.ticks = self._map("ticks.bin", np.int64, (self.capacity,), fresh)
+        self.slot_gen = self._map("slot_gen.bin", np.int64, (self.capacity,), fresh)
+        self.generation = self._map("generation.bin", np.int64, (1,), fresh)
+        if fresh:
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        self._index: Dict[bytes, int] = {}
+        self._free: Set[int] = set()
+        self._row_keys = np.zeros(self.capacity, dtype="S64")
+        self._tick = 0
+        self._seen = -1
+        self._sync()
+
+    def _map(self, name: str, dtype, shape: Tuple[int, ...], fresh: bool) -> np.memmap:
+        path = self.dir / name
+        if fresh or not path.exists():
+            # build a new zeroed file and swap it in: truncating in place would
+            # pull the pages from under a process that still maps the old one
+            tmp = self.dir / (name + ".tmp")
+            np.memmap(tmp, dtype=dtype, mode="w+", shape=shape).flush()
+            os.replace(tmp, path)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _sync(self):
+        """apply key changes made by other processes to index/free list (file lock held)"""
+        generation = int(self.generation[0])
+        if generation == self._seen:
+            return
+        if self._seen < 0:
+            keys = np.array(self.keys)
+            used = np.flatnonzero(keys != b"")
+            self._index = dict(zip(keys[used].tolist(), used.tolist()))
+            self._free = set(np.flatnonzero(keys == b"").tolist())
+            self._row_keys = keys
+            self._tick = max(self._tick, int(self.ticks.max()))
+        else:
+            rows = np.flatnonzero(self.slot_gen > self._seen)
+            new_keys = np.array(self.keys[rows])
+            for row, old, new in zip(rows.tolist(), self._row_keys[rows].tolist(), new_keys.tolist()):
+                if old and self._index.get(old) == row:
+                    del self._index[old]
+                if new:
+                    self._index[new] = row
+                    self._free.discard(row)
+                else:
+                    self._free.add(row)
+            self._row_keys[rows] = new_keys
+            if rows.size:
+                self._tick = max(self._tick, int(self.ticks[rows].max()))
+        self._seen = generation
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, keys: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        """return (vectors for hits, boolean hit mask aligned with `keys`)"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._sync()
+            rows = [self._index.get(k, -1) for k in keys]
+            mask = np.fromiter((r >= 0 for r in rows), dtype=bool, count=len(rows))
+            hit_rows = np.asarray([r for r in rows if r >= 0], dtype=np.int64)
+            if hit_rows.size:
+                self._tick += 1
+                self.ticks[hit_rows] = self._tick
+            vecs = np.array(self.vectors[hit_rows]) if hit_rows.size else np.empty((0, self.dim), dtype=np.float32)
+            self.hits += int(hit_rows.size)
+            self.misses += len(rows) - int(hit_rows.size)
+        return vecs, mask
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._sync()
+            self._tick += 1
+            changed: List[int] = []
+            for k, v in zip(keys, vectors):
+                row = self._index.get(k)
+                if row is None:
+                    if not self._free:
+                        changed.extend(self._evict())
+                    row = self._free.pop()
+                    self._index[k] = row
+                    changed.append(row)
+                self.vectors[row] = v
+                self.keys[row] = k
+                self._row_keys[row] = k
+                self.ticks[row] = self._tick
+            if changed:
+                generation = int(self.generation[0]) + 1
+                self.slot_gen[np.asarray(changed, dtype=np.int64)] = generation
+                self.generation[0] = generation
+                self._seen = generation
+
+    def _evict(self) -> List[int]:
+        n = max(1, self.capacity // 10)
+        used = np.flatnonzero(self.keys != b"")
+        if used.size == 0:
+            return []
+        n = min(n, used.size)
+        oldest = used[np.argpartition(self.ticks[used], n - 1)[:n]]
+        for row in oldest.tolist():
+            self._index.pop(bytes(self.keys[row]), None)
+            self.keys[row] = b""
+            self._row_keys[row] = b""
+            self._free.add(row)
+        return oldest.tolist()
+
+    def flush(self):
+        with self._lock:
+            self.vectors.flush()
+            self.keys.flush()
+            self.ticks.flush()
+            self.slot_gen.flush()
+            self.generation.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._index), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
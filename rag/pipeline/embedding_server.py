@@ -0,0 +1,413 @@
+"""
+Embedding sidecar: one process owns the Embedder and serves every uvicorn
+worker over a Unix socket, so N workers share one model in memory.
+Concurrent single-query encodes are coalesced into one encode call.
+
+run by the app (see ensure_embedding_server), or by hand:
+    python -m rag.pipeline.embedding_server --socket data/run/embedder.sock
+
+A server spawned by the app lives as long as some app process uses it: each
+one holds a shared flock on <socket>.clients for its lifetime, and the server
+exits once it can take that lock exclusively (whatever the process layout:
+single process, uvicorn workers, uvicorn as PID 1 in a container).
+"""
+from __future__ import annotations
+import argparse
+import fcntl
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rag.core.config import settings
+
+
+def _key_path(socket_path: Path) -> Path:
+    return socket_path.with_suffix(".key")
+
+
+def _read_or_create_authkey(socket_path: Path) -> bytes:
+    """shared secret for the socket, readable only by the app's user"""
+    key_path = _key_path(socket_path)
+    if not key_path.exists():
+        fd = os.open(str(key_path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+    return key_path.read_bytes()
+
+
+class _Request:
+    __slots__ = ("kind", "texts", "done", "result", "error")
+
+    def __init__(self, kind: str, texts: List[str]):
+        self.kind = kind
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+
+
+class EmbeddingServer:
+    """
+    Serves an Embedder on a Unix socket.
+    One thread per client connection; a single batcher thread owns the model.
+    Query requests arriving within `max_wait_ms` of each other are encoded
+    together (up to `max_batch` texts); document batches (indexing) go through
+    Embedder.generate_embeddings on their own so they still use the chunk cache.
+    """
+
+    def __init__(self, embedder, socket_path: Path, authkey: bytes,
+                 max_batch: int = settings.EMBEDDING_SERVER_MAX_BATCH,
+                 max_wait_ms: float = settings.EMBEDDING_SERVER_MAX_WAIT_MS):
+        self.embedder = embedder
+        self.socket_path = Path(socket_path)
+        self.authkey = authkey
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.embedder.model_name,
+            "normalize": self.embedder.normalize,
+            "batch_size": self.embedder.batch_size,
+            "backend": getattr(self.embedder, "backend", "torch"),
+            "dim": self.embedder.model.get_sentence_embedding_dimension(),
+            "pid": os.getpid(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        out = {"requests": self.requests, "batches": self.batches, "texts": self.texts}
+        if self.embedder.cache is not None:
+            out["chunk_embeddings"] = self.embedder.cache.stats()
+        return out
+
+    def serve_forever(self, clients_lock: Optional[Path] = None):
+        threading.Thread(target=self._batch_loop, name="embed-batcher", daemon=True).start()
+        if clients_lock:
+            threading.Thread(target=self._watch_clients, args=(Path(clients_lock),), daemon=True).start()
+        with Listener(str(self.socket_path), family="AF_UNIX", authkey=self.authkey) as listener:
+            os.chmod(self.socket_path, 0o600)
+            print(f"Embedding server listening on {self.socket_path} (pid {os.getpid()})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    print(f"Embedding server: rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _watch_clients(self, lock_path: Path):
+        """exit once no app process holds its shared lock on `lock_path` (they all exited)"""
+        with open(lock_path, "a+") as lock_file:
+            while True:
+                time.sleep(2.0)
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                print("Embedding server: no app process left, shutting down")
+                self._shutdown()
+
+    def _shutdown(self):
+        if self.embedder.cache is not None:
+            self.embedder.cache.flush()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        os._exit(0)
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self._dispatch(op, payload)))
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    try:
+                        conn.send(("err", str(e)))
+                    except (EOFError, OSError):
+                        return
+
+    def _dispatch(self, op: str, payload: Any) -> Any:
+        if op in ("queries", "documents"):
+            req = _Request(op, list(payload))
+            self._queue.put(req)
+            req.done.wait()
+            if req.error is not None:
+                raise RuntimeError(req.error)
+            return req.result
+        if op == "info":
+            return self.info()
+        if op == "stats":
+            return self.stats()
+        if op == "flush":
+            if self.embedder.cache is not None:
+                self.embedder.cache.flush()
+            return None
+        raise ValueError(f"unknown op: {op}")
+
+    def _batch_loop(self):
+        while True:
+            first = self._queue.get()
+            if first.kind == "documents":
+                self._run_documents(first)
+                continue
+            batch = [first]
+            deferred: List[_Request] = []
+            n = len(first.texts)
+            deadline = time.monotonic() + self.max_wait
+            while n < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    req = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if req.kind == "documents":
+                    deferred.append(req)
+                    break
+                batch.append(req)
+                n += len(req.texts)
+            self._run_queries(batch)
+            for req in deferred:
+                self._run_documents(req)
+
+    def _run_queries(self, batch: List[_Request]):
+        texts = [t for req in batch for t in req.texts]
+        try:
+            embs = self.embedder.generate_query_embeddings(texts)
+            offset = 0
+            for req in batch:
+                req.result = embs[offset:offset + len(req.texts)]
+                offset += len(req.texts)
+        except Exception as e:
+            for req in batch:
+                req.error = str(e)
+        self.requests += len(batch)
+        self.batches += 1
+        self.texts += len(texts)
+        for req in batch:
+            req.done.set()
+
+    def _run_documents(self, req: _Request):
+        try:
+            req.result = self.embedder.generate_embeddings(req.texts, show_progress_bar=False)
+        except Exception as e:
+            req.error = str(e)
+        self.requests += 1
+        self.batches += 1
+        self.texts += len(req.texts)
+        req.done.set()
+
+
+class _RemoteModel:
+    """the slice of the SentenceTransformer API callers use on Embedder.model"""
+
+    def __init__(self, dim: int):
+        self._dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+
+class RemoteEmbedder:
+    """
+    Drop-in client for Embedder backed by the embedding server.
+    One connection per calling thread; a dropped connection is retried once,
+    and if the server is gone it is respawned (see _start_if_needed).
+    """
+
+    def __init__(self, socket_path: Path = settings.EMBEDDING_SERVER_SOCKET):
+        self.socket_path = Path(socket_path)
+        self.authkey = _key_path(self.socket_path).read_bytes()
+        self._local = threading.local()
+        # the server owns the chunk cache
+        self.cache = None
+        info = self._call("info")
+        self.model_name: str = info["model_name"]
+        self.normalize: bool = info["normalize"]
+        self.batch_size: int = info["batch_size"]
+        self.backend: str = info["backend"]
+        self.model = _RemoteModel(int(info["dim"]))
+        print(f"Connected to embedding server pid {info['pid']} ({self.model_name}, dim {info['dim']})")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(str(self.socket_path), family="AF_UNIX", authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, op: str, payload: Any = None) -> Any:
+        for attempt in range(3):
+            try:
+                conn = self._conn()
+                conn.send((op, payload))
+                status, value = conn.recv()
+            except (EOFError, OSError):
+                self._drop()
+                if attempt == 2:
+                    raise
+                if attempt == 1:
+                    # the server died (crash, OOM kill): start a new one
+                    _start_if_needed(self.socket_path, settings.EMBEDDING_SERVER_START_TIMEOUT_S)
+                    self.authkey = _key_path(self.socket_path).read_bytes()
+                continue
+            if status == "err":
+                raise RuntimeError(f"embedding server: {value}")
+            return value
+
+    def _empty(self) -> np.ndarray:
+        return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    def generate_embeddings(self, texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
+        if not texts:
+            return self._empty()
+        return self._call("documents", list(texts))
+
+    def generate_embedding(self, query: str) -> np.ndarray:
+        if query is None or query.strip() == "":
+            return np.zeros((self.model.get_sentence_embedding_dimension(),), dtype=np.float32)
+        return self._call("queries", [query])[0]
+
+    def generate_query_embeddings(self, queries: List[str]) -> np.ndarray:
+        if not queries:
+            return self._empty()
+        return self._call("queries", [q or "" for q in queries])
+
+    def flush(self):
+        self._call("flush")
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call("stats")
+
+
+def _alive(socket_path: Path) -> bool:
+    if not socket_path.exists() or not _key_path(socket_path).exists():
+        return False
+    try:
+        conn = Client(str(socket_path), family="AF_UNIX", authkey=_key_path(socket_path).read_bytes())
+    except (OSError, EOFError, AuthenticationError):
+        return False
+    try:
+        conn.send(("info", None))
+        return conn.recv()[0] == "ok"
+    except (OSError, EOFError):
+        return False
+    finally:
+        conn.close()
+
+
+def ensure_embedding_server(
+        socket_path: Path = settings.EMBEDDING_SERVER_SOCKET,
+        timeout_s: float = settings.EMBEDDING_SERVER_START_TIMEOUT_S,
+    ) -> RemoteEmbedder:
+    """connect to the embedding server, spawning it first if nobody has"""
+    socket_path = Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    _hold_clients_lock(socket_path)
+    _start_if_needed(socket_path, timeout_s)
+    return RemoteEmbedder(socket_path)
+
+
+_CLIENTS_LOCK_FILE = None
+
+def _hold_clients_lock(socket_path: Path):
+    """shared lock kept by this process for as long as it lives; the server exits once nobody holds it"""
+    global _CLIENTS_LOCK_FILE
+    if _CLIENTS_LOCK_FILE is None:
+        lock_file = open(socket_path.with_suffix(".clients"), "a+")
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        _CLIENTS_LOCK_FILE = lock_file
+
+
+def _start_if_needed(socket_path: Path, timeout_s: float):
+    """
+    spawn the server unless one answers. a file lock makes sure only one worker
+    (or thread) spawns it; the others wait on the lock and then find it running.
+    """
+    with open(socket_path.with_suffix(".lock"), "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not _alive(socket_path):
+                _spawn(socket_path, timeout_s)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _spawn(socket_path: Path, timeout_s: float):
+    # stale socket from a crashed server
+    try:
+        socket_path.unlink()
+    except FileNotFoundError:
+        pass
+    _read_or_create_authkey(socket_path)
+    print(f"Starting embedding server on {socket_path}")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "rag.pipeline.embedding_server",
+         "--socket", str(socket_path), "--clients-lock", str(socket_path.with_suffix(".clients"))],
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"embedding server exited with code {proc.returncode}")
+        if _alive(socket_path):
+            return
+        time.sleep(0.25)
+    proc.kill()
+    raise RuntimeError(f"embedding server did not start within {timeout_s:.0f}s")
+
+
+def main(argv: Optional[List[str]] = None):
+    from rag.pipeline.embedder import Embedder
+    from rag.utility.helpers import set_torch_threads
+
+    parser = argparse.ArgumentParser(description="shared embedding server")
+    parser.add_argument("--socket", default=str(settings.EMBEDDING_SERVER_SOCKET))
+    parser.add_argument("--clients-lock", default=None, help="exit once no process holds a shared lock on this file")
+    args = parser.parse_args(argv)
+
+    socket_path = Path(args.socket)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    set_torch_threads(settings.TORCH_NUM_THREADS)
+    embedder = Embedder(
+        model_name=settings.EMBEDDER_MODEL_NAME,
+        normalize=settings.NORMALIZE,
+        batch_size=settings.BATCH_SIZE,
+        cache_dir=settings.EMBED_CACHE_DIR if settings.EMBED_CACHE_ENABLED else None,
+    )
+    server = EmbeddingServer(embedder, socket_path, authkey=_read_or_create_authkey(socket_path))
+    server.serve_forever(clients_lock=args.clients_lock)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.pipeline.filters import matches, where_key
+
+
+class ExactIndex:
+    """
+    Exact (brute-force) cosine search over the whole collection, held in RAM
+    as one contiguous float32 matrix of unit vectors plus the chunk texts and
+    metadata, so a query is a single matmul + `argpartition` with no store
+    round trip. Meant for collections up to ~100k chunks, where this beats
+    HNSW on latency and has no recall loss; it is also the ground truth for
+    measuring ANN recall.
+
+    Kept in sync as a VectorStore listener (on_upsert / on_delete). Deletes
+    swap the last row into the freed slot so the matrix stays dense.
+    Writes from other processes are not seen: `generation` is the store's
+    cross-process write generation (see WriteGeneration) the index reflects,
+    advanced by this process's own writes; when the store's is ahead the
+    Retriever stops serving from it and calls `reload_from_collection`.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        # where clause -> row bitmap, valid until the next write
+        self._masks: Dict[str, np.ndarray] = {}
+        self.generation: Optional[int] = None
+        # writes seen while a reload is in progress, replayed onto the new copy
+        self._replay: Optional[List[Tuple[str, tuple]]] = None
+        self._replay_generation: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------ writes
+
+    def _ensure_capacity(self, n: int, dim: int):
+        cap = self.matrix.shape[0]
+        if self.matrix.shape[1] != dim:
+            if self.ids:
+                raise ValueError(f"embedding dim {dim} does not match index dim {self.matrix.shape[1]}")
+            cap = 0
+        if n > cap:
+            grown = np.empty((max(n, 2 * cap, 1024), dim), dtype=np.float32)
+            if self.ids:
+                grown[: len(self.ids)] = self.matrix[: len(self.ids)]
+            self.matrix = grown
+
+    def on_upsert(self, ids: Sequence[str], documents: Sequence[str],
+                  metadatas: Optional[Sequence[Dict[str, Any]]] = None, embeddings=None):
+        if embeddings is None:
+            return
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        metadatas = metadatas if metadatas is not None else [{}] * len(ids)
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(("on_upsert", (ids, documents, metadatas, vecs)))
+            self._masks.clear()
+            self._ensure_capacity(len(self.ids) + len(ids), vecs.shape[1])
+            for vec_id, doc, meta, vec in zip(ids, documents, metadatas, vecs):
+                row = self._row_of.get(vec_id)
+                if row is None:
+                    row = len(self.ids)
+                    self.ids.append(vec_id)
+                    self.documents.append(doc)
+                    self.metadatas.append(meta or {})
+                    self._row_of[vec_id] = row
+                else:
+                    self.documents[row] = doc
+                    self.metadatas[row] = meta or {}
+                self.matrix[row] = vec
+
+    def on_delete(self, ids: Sequence[str]):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(("on_delete", (list(ids),)))
+            self._masks.clear()
+            for vec_id in ids:
+                row = self._row_of.pop(vec_id, None)
+                if row is None:
+                    continue
+                last = len(self.ids) - 1
+                if row != last:
+                    moved = self.ids[last]
+                    self.matrix[row] = self.matrix[last]
+                    self.ids[row] = moved
+                    self.documents[row] = self.documents[last]
+                    self.metadatas[row] = self.metadatas[last]
+                    self._row_of[moved] = row
+                self.ids.pop()
+                self.documents.pop()
+                self.metadatas.pop()
+
+    def on_generation(self, generation: int):
+        """a write of this process moved the store to `generation`: still current if nothing else wrote"""
+        with self._lock:
+            if self.generation == generation - 1:
+                self.generation = generation
+            if self._replay is not None and self._replay_generation == generation - 1:
+                self._replay_generation = generation
+
+    def load_from_collection(self, collection, page_size: int = 5000, generation: Optional[int] = None):
+        """(re)load every vector, text and metadata from the store; `generation` is the store's, read before"""
+        with self._lock:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+            self.ids, self.documents, self.metadatas, self._row_of = [], [], [], {}
+            self.generation = generation
+            offset = 0
+            while True:
+                batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+                ids = batch.get("ids") or []
+                if not ids:
+                    break
+                self.on_upsert(ids, batch.get("documents") or [""] * len(ids), batch.get("metadatas"), batch.get("embeddings"))
+                offset += len(ids)
+            print(f"Exact index loaded: {len(self.ids)} vectors")
+
+    def reload_from_collection(self, collection, generation, page_size: int = 5000):
+        """
+        load a fresh copy off to the side and swap it in; queries keep using the
+        old one meanwhile. Writes this process makes during the load are
+        recorded and replayed onto the copy (both are idempotent), so none are
+        lost. `generation` is the store's WriteGeneration.
+        """
+        with self._lock:
+            self._replay = []
+            self._replay_generation = generation.value
+        try:
+            fresh = ExactIndex()
+            fresh.load_from_collection(collection, page_size=page_size)
+            with self._lock:
+                for event, args in self._replay:
+                    getattr(fresh, event)(*args)
+                self.matrix = fresh.matrix
+                self.ids, self.documents, self.metadatas = fresh.ids, fresh.documents, fresh.metadatas
+                self._row_of = fresh._row_of
+                self._masks.clear()
+                self.generation = self._replay_generation
+        finally:
+            with self._lock:
+                self._replay = None
+
+    # ------------------------------------------------------------------ reads
+
+    def _filter_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """bitmap of rows matching `where`, computed once per filter between writes"""
+        key = where_key(where)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter((matches(m, where) for m in self.metadatas), dtype=bool, count=len(self.metadatas))
+            if len(self._masks) >= 64:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def query(self, query_embeddings, n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, List[List[Any]]]:
+        """same result shape as a Chroma collection query (ids/documents/metadatas/distances)"""
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        out: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            n = len(self.ids)
+            mask = self._filter_mask(where) if where else None
+            k = min(n_results, n if mask is None else int(mask.sum()))
+            if k <= 0:
+                for key in out:
+                    out[key] = [[] for _ in range(q.shape[0])]
+                return out
+            sims = q @ self.matrix[:n].T
+            if mask is not None:
+                sims[:, ~mask] = -np.inf
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            for qi in range(q.shape[0]):
+                rows = top[qi][np.argsort(-sims[qi, top[qi]])]
+                out["ids"].append([self.ids[r] for r in rows])
+                out["documents"].append([self.documents[r] for r in rows])
+                out["metadatas"].append([self.metadatas[r] for r in rows])
+                out["distances"].append((1.0 - sims[qi, rows]).tolist())
+        return out
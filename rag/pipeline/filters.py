@@ -0,0 +1,96 @@
+from __future__ import annotations
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+# metadata fields the filters map to (set by the loader/chunker and VectorStore.add_documents)
+FILTER_FIELDS = ("source_name", "file_sha256", "page_from", "page_to", "uploaded_after", "uploaded_before")
+
+
+def _as_list(value: Union[str, Sequence[str], None]) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [v for v in value if v]
+
+
+def _epoch(value: Union[datetime, float, int]) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+def build_where(
+        source_name: Union[str, Sequence[str], None] = None,
+        file_sha256: Union[str, Sequence[str], None] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+        uploaded_after: Union[datetime, float, None] = None,
+        uploaded_before: Union[datetime, float, None] = None,
+    ) -> Optional[Dict[str, Any]]:
+    """
+    turn retrieval filters into a Chroma `where` clause (None = no filter).
+    page range is inclusive; upload dates compare against the chunk's
+    `ingested_at` (epoch seconds, set when it was upserted).
+    """
+    clauses: List[Dict[str, Any]] = []
+    for field, values in (("source_name", _as_list(source_name)), ("file_sha256", _as_list(file_sha256))):
+        if len(values) == 1:
+            clauses.append({field: values[0]})
+        elif values:
+            clauses.append({field: {"$in": values}})
+    if page_from is not None:
+        clauses.append({"page": {"$gte": int(page_from)}})
+    if page_to is not None:
+        clauses.append({"page": {"$lte": int(page_to)}})
+    if uploaded_after is not None:
+        clauses.append({"ingested_at": {"$gte": _epoch(uploaded_after)}})
+    if uploaded_before is not None:
+        clauses.append({"ingested_at": {"$lte": _epoch(uploaded_before)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def where_key(where: Optional[Dict[str, Any]]) -> Optional[str]:
+    """canonical form of a where clause, for cache keys"""
+    return json.dumps(where, sort_keys=True, separators=(",", ":")) if where else None
+
+
+WHERE_OPS = {
+    "$eq": lambda v, x: v == x,
+    "$ne": lambda v, x: v != x,
+    "$gt": lambda v, x: v > x,
+    "$gte": lambda v, x: v >= x,
+    "$lt": lambda v, x: v < x,
+    "$lte": lambda v, x: v <= x,
+    "$in": lambda v, x: v in x,
+    "$nin": lambda v, x: v not in x,
+}
+
+
+def matches(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """evaluate a Chroma `where` clause against one metadata dict (for in-process indexes)"""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches(meta, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(meta, sub) for sub in cond):
+                return False
+        else:
+            value = meta.get(key)
+            if not isinstance(cond, dict):
+                cond = {"$eq": cond}
+            for op, bound in cond.items():
+                if value is None:
+                    if op not in ("$ne", "$nin"):
+                        return False
+                    continue
+                try:
+                    if not WHERE_OPS[op](value, bound):
+                        return False
+                except TypeError:
+                    return False
+    return True
@@ -0,0 +1,51 @@
+from __future__ import annotations
+import fcntl
+import os
+from pathlib import Path
+
+import numpy as np
+
+from rag.core.config import settings
+
+
+class WriteGeneration:
+    """
+    Cross-process write counter of one collection: a single int64 in a small
+    memory-mapped file, bumped (under an flock) after every write by any
+    process. Reading it is a plain memory load, so readers holding a copy of
+    the collection in RAM (exact index, BM25 delta) can compare it on every
+    query to find out whether another process wrote since they last synced.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < 8:
+                os.ftruncate(self._fd, 8)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._value = np.memmap(self.path, dtype=np.int64, mode="r+", shape=(1,))
+
+    @classmethod
+    def for_collection(
+        cls,
+        collection_name: str = settings.COLLECTION_NAME,
+        persist_directory: Path = settings.PERSIST_DIRECTORY_VS,
+    ) -> "WriteGeneration":
+        return cls(Path(persist_directory) / "generations" / f"{collection_name}.gen")
+
+    @property
+    def value(self) -> int:
+        return int(self._value[0])
+
+    def bump(self) -> int:
+        """record one write; returns the new generation"""
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._value[0] += 1
+            return int(self._value[0])
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
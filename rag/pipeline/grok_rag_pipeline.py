@@ -1,35 +1,74 @@
+from typing import Any, AsyncIterator, Dict, List
+
 from rag.pipeline.LLM.grok_llm import get_grok_llm
 from rag.core.config import settings
 
 from langchain_core.messages import SystemMessage, HumanMessage
 
-def RAG_Simple_Grok(query, 
-                    retriever, 
-                    top_k=settings.TOP_K, 
-                    score_threshold=settings.SCORE_THRESHOLD, 
-                    max_ctx_chars=settings.MAX_CTX_CHARS):
-    # llm calling
-    llm = get_grok_llm()
-
-    # 1) retrieve
-    results = retriever.retrieve(query, top_k=top_k, score_threshold=score_threshold)
-    if not results:
-        return "I don't know from the provided documents."
+GUARD = "I don't know from the provided documents."
 
-    # 2) build context (cap to avoid truncation)
+def _build_messages(query:str, results:List[Dict[str, Any]], max_ctx_chars:int):
+    # 1) build context (cap to avoid truncation)
     context = "\n\n".join(doc["content"] for doc in results)
     context = context[:max_ctx_chars]
     print(f"retrieved Context >>>>>>>>>>>>>> {context}")
 
-    # 3) chat messages (system + user)
+    # 2) chat messages (system + user)
     system_msg = (
         "You are a careful medical assistant. Use ONLY the provided context. "
         'If the answer is not in the context, reply exactly: "I don\'t know from the provided documents."'
     )
     user_msg = f"Context:\n{context}\n\nQuestion:\n{query}\n\nAnswer:"
     print(f"\n prompt >>>>>>>>>>>>>>>>\n {user_msg} ")
+    return [SystemMessage(content=system_msg), HumanMessage(content=user_msg)]
 
-    # 4) invoke Grok
-    resp = llm.invoke([SystemMessage(content=system_msg), HumanMessage(content=user_msg)])
+def _to_text(resp) -> str:
     text = getattr(resp, "content", resp)
-    return (text or "").strip() or "I don't know from the provided documents."
+    return (text or "").strip() or GUARD
+
+def RAG_Simple_Grok(query:str,
+                    results:List[Dict[str, Any]],
+                    max_ctx_chars=settings.MAX_CTX_CHARS):
+    """
+    generate an answer from already-retrieved results (see Retriever.retrieve),
+    so the LLM sees exactly the chunks that are returned as citations.
+    """
+    if not results:
+        return GUARD
+
+    # llm calling
+    llm = get_grok_llm()
+    messages = _build_messages(query, results, max_ctx_chars)
+
+    # 3) invoke Grok
+    return _to_text(llm.invoke(messages))
+
+async def aRAG_Simple_Grok(query:str,
+                           results:List[Dict[str, Any]],
+                           max_ctx_chars=settings.MAX_CTX_CHARS):
+    """async variant of RAG_Simple_Grok (non-blocking `ainvoke`)"""
+    if not results:
+        return GUARD
+
+    llm = get_grok_llm()
+    messages = _build_messages(query, results, max_ctx_chars)
+    return _to_text(await llm.ainvoke(messages))
+
+async def astream_RAG_Grok(query:str,
+                           results:List[Dict[str, Any]],
+                           max_ctx_chars=settings.MAX_CTX_CHARS) -> AsyncIterator[str]:
+    """streaming variant of RAG_Simple_Grok, yields text deltas as Grok produces them"""
+    if not results:
+        yield GUARD
+        return
+
+    llm = get_grok_llm()
+    messages = _build_messages(query, results, max_ctx_chars)
+    produced = False
+    async for chunk in llm.astream(messages):
+        text = getattr(chunk, "content", chunk) or ""
+        if text:
+            produced = True
+            yield text
+    if not produced:
+        yield GUARD
@@ -1,9 +1,8 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from rag.utility.helpers import format_context
 from rag.core.config import settings
 from rag.pipeline.LLM.hf_endpoit import get_hf_llm
-from rag.pipeline.retriever import Retriever
 
 PRIMARY_PROMPT = """You are a careful medical assistant.
 Answer the QUESTION using ONLY the CONTEXT. If something is not in the CONTEXT, do not invent it.
@@ -32,38 +31,28 @@ QUESTION:
 ANSWER:
 """
 
-def RAG_Simple_HF(
+def _prepare(
     query: str,
-    retriever: Retriever,
-    llm: Any | None = None,
-    top_k: int = settings.TOP_K,
-    score_threshold: Optional[float] = settings.SCORE_THRESHOLD,
-    max_ctx_chars: int = settings.MAX_CTX_CHARS,
-    stop: Optional[List[str]] = None,
-    max_new_tokens: int = settings.HF_MAX_TOKENS,
-    temperature: float = settings.HF_TEMPERATURE,
-) -> str:
-    # HF llm initialization
-    llm = get_hf_llm()
-    # 1) retrieve
-    if hasattr(retriever, "retrieve"):
-        results = retriever.retrieve(query, top_k=top_k, score_threshold=score_threshold)
-        results = [r if isinstance(r, dict) else {"content": str(r)} for r in (results or []) if r]
-    elif hasattr(retriever, "get_relevant_documents"):
-        docs = retriever.get_relevant_documents(query) or []
-        processed = []
-        for d in docs:
-            score = None
-            if isinstance(getattr(d, "metadata", None), dict):
-                score = d.metadata.get("score") or d.metadata.get("similarity")
-            if score_threshold is None or score is None or float(score) >= float(score_threshold):
-                processed.append({"content": d.page_content, "metadata": getattr(d, "metadata", {})})
-        results = processed[:top_k]
-    else:
-        raise TypeError("Retriever must implement .retrieve(...) or .get_relevant_documents(...).")
+    results: List[Dict[str, Any]],
+    max_ctx_chars: int,
+    stop: Optional[List[str]],
+    max_new_tokens: int,
+    temperature: float,
+) -> Tuple[Optional[Tuple[str, str]], Dict[str, Any]]:
+    """
+    return ((primary_prompt, backup_prompt) or None if nothing retrieved, gen_kwargs)
+    """
+    # 1) normalize retrieved results
+    results = [r if isinstance(r, dict) else {"content": str(r)} for r in (results or []) if r]
+
+    # the client is shared across requests: pass generation params per call
+    # instead of setting them on the object
+    gen_kwargs: Dict[str, Any] = {"max_new_tokens": max_new_tokens, "temperature": temperature}
+    if stop:
+        gen_kwargs["stop"] = stop
 
     if not results:
-        return settings.GUARD_SENTENCE
+        return None, gen_kwargs
 
     context = format_context(results, max_ctx_chars)
     print("retrieved Context >>>>>>>>>>>>>>", context[:600], "...\n")
@@ -73,24 +62,123 @@ def RAG_Simple_HF(
     p2 = BACKUP_PROMPT.format(context=context, question=query)
     print(f"PROMPT 1 >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> {p1}")
     print(f"PROMPT 2 >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> {p2}")
+    return (p1, p2), gen_kwargs
+
+def _is_guarded(ans: str) -> bool:
+    return not ans or ans.strip().lower() in {"i don't know.", settings.GUARD_SENTENCE.lower()}
+
+def _to_text(out: Any) -> str:
+    if hasattr(out, "content"):
+        out = out.content
+    return (out or "").strip()
+
+def RAG_Simple_HF(
+    query: str,
+    results: List[Dict[str, Any]],
+    llm: Any | None = None,
+    max_ctx_chars: int = settings.MAX_CTX_CHARS,
+    stop: Optional[List[str]] = None,
+    max_new_tokens: int = settings.HF_MAX_TOKENS,
+    temperature: float = settings.HF_TEMPERATURE,
+) -> str:
+    """
+    generate an answer from already-retrieved results (see Retriever.retrieve),
+    so the LLM sees exactly the chunks that are returned as citations.
+    """
+    prompts, gen_kwargs = _prepare(query, results, max_ctx_chars, stop, max_new_tokens, temperature)
+    if prompts is None:
+        return settings.GUARD_SENTENCE
 
-    if hasattr(llm, "max_new_tokens"): llm.max_new_tokens = max_new_tokens
-    if hasattr(llm, "temperature"): llm.temperature = temperature
-    if hasattr(llm, "return_full_text"): llm.return_full_text = False
-    if stop and hasattr(llm, "stop"): llm.stop = stop
+    # HF llm initialization
+    llm = llm or get_hf_llm(max_new_tokens=max_new_tokens, temperature=temperature)
 
     def _invoke(prompt: str) -> str:
         try:
-            out = llm.invoke(prompt)
+            out = llm.invoke(prompt, **gen_kwargs)
         except TypeError:
             out = llm(prompt)
-        if hasattr(out, "content"):
-            out = out.content
-        return (out or "").strip()
+        return _to_text(out)
 
-    # 4) try primary, then backup if empty/guarded
+    # 3) try primary, then backup if empty/guarded
+    p1, p2 = prompts
     ans = _invoke(p1)
-    if not ans or ans.strip().lower() in {"i don't know.", settings.GUARD_SENTENCE.lower()}:
+    if _is_guarded(ans):
         ans = _invoke(p2)
 
     return ans or settings.GUARD_SENTENCE
+
+async def aRAG_Simple_HF(
+    query: str,
+    results: List[Dict[str, Any]],
+    llm: Any | None = None,
+    max_ctx_chars: int = settings.MAX_CTX_CHARS,
+    stop: Optional[List[str]] = None,
+    max_new_tokens: int = settings.HF_MAX_TOKENS,
+    temperature: float = settings.HF_TEMPERATURE,
+) -> str:
+    """async variant of RAG_Simple_HF (non-blocking `ainvoke`)"""
+    prompts, gen_kwargs = _prepare(query, results, max_ctx_chars, stop, max_new_tokens, temperature)
+    if prompts is None:
+        return settings.GUARD_SENTENCE
+
+    llm = llm or get_hf_llm(max_new_tokens=max_new_tokens, temperature=temperature)
+
+    p1, p2 = prompts
+    ans = _to_text(await llm.ainvoke(p1, **gen_kwargs))
+    if _is_guarded(ans):
+        ans = _to_text(await llm.ainvoke(p2, **gen_kwargs))
+
+    return ans or settings.GUARD_SENTENCE
+
+async def astream_RAG_HF(
+    query: str,
+    results: List[Dict[str, Any]],
+    llm: Any | None = None,
+    max_ctx_chars: int = settings.MAX_CTX_CHARS,
+    stop: Optional[List[str]] = None,
+    max_new_tokens: int = settings.HF_MAX_TOKENS,
+    temperature: float = settings.HF_TEMPERATURE,
+) -> AsyncIterator[str]:
+    """
+    streaming variant of RAG_Simple_HF, yields text deltas.
+    The primary stream is held back only while its text is still a prefix of a
+    guard answer; if it ends empty/guarded we stream the backup prompt instead.
+    """
+    prompts, gen_kwargs = _prepare(query, results, max_ctx_chars, stop, max_new_tokens, temperature)
+    if prompts is None:
+        yield settings.GUARD_SENTENCE
+        return
+
+    llm = llm or get_hf_llm(max_new_tokens=max_new_tokens, temperature=temperature)
+    guards = ("i don't know.", settings.GUARD_SENTENCE.lower())
+
+    p1, p2 = prompts
+    buffer = ""
+    released = False
+    async for chunk in llm.astream(p1, **gen_kwargs):
+        text = getattr(chunk, "content", chunk) or ""
+        if released:
+            yield text
+            continue
+        buffer += text
+        head = buffer.lstrip().lower()
+        if head and not any(g.startswith(head) for g in guards):
+            released = True
+            yield buffer.lstrip()
+
+    if released:
+        return
+    if not _is_guarded(buffer.strip()):
+        # finished while still looking like the start of a guard, but it isn't one
+        yield buffer.strip()
+        return
+
+    # primary was empty/guarded -> backup prompt
+    produced = False
+    async for chunk in llm.astream(p2, **gen_kwargs):
+        text = getattr(chunk, "content", chunk) or ""
+        if text:
+            produced = True
+            yield text
+    if not produced:
+        yield settings.GUARD_SENTENCE
@@ -0,0 +1,453 @@
+from __future__ import annotations
+import fcntl
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from rag.core.config import settings
+
+# keeps drug names, gene symbols (BRCA1, TP53) and ICD codes (E11.9, I10) whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-_/][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+class BM25Index:
+    """
+    In-process BM25 index over the chunk texts stored in the vector store.
+
+    On disk (one directory per collection) the index is a compact,
+    array-backed inverted index loaded with mmap:
+        vocab.json          term -> term id
+        offsets.npy         int64 (n_terms + 1), postings of term t are [offsets[t], offsets[t+1])
+        post_docs.npy       int32 doc numbers, sorted within each term
+        post_tf.npy         uint16 term frequencies
+        doc_len.npy         int32 tokens per doc
+        doc_ids.npy         vector ids (bytes), doc number -> id
+        sorted_ids.npy      the same ids sorted, with their doc numbers in
+        sorted_docs.npy     int32, so an id is found by binary search
+        delta.log           writes since the base was written, one JSON line each
+    Writes from every process are appended to delta.log under a file lock
+    (<dir>.lock) and applied from there, so all processes hold the same delta
+    (new postings + tombstones). Before each search a stat of delta.log and
+    vocab.json shows whether another process appended (log size) or compacted
+    (a new vocab.json), and only the new lines, or the new base, are read.
+    `compact()` merges base + delta into a fresh base segment with an empty
+    log, either explicitly (`flush`) or once the delta holds (or the
+    tombstones reach) LEXICAL_COMPACT_EVERY docs.
+
+    Query cost is proportional to the postings of the query terms only:
+    gather the live postings (so df ignores deleted docs), score with
+    vectorized BM25, `bincount` per doc and `argpartition` for the top hits.
+    """
+
+    def __init__(self, directory: Path, k1: float = 1.2, b: float = 0.75):
+        self.dir = Path(directory)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._lock_path = self.dir.with_name(self.dir.name + ".lock")
+        self._reset()
+        with self._lock:
+            self._refresh()
+        if self.n_docs:
+            print(f"Lexical index loaded: {self._live_docs} docs, {len(self.vocab)} terms")
+
+    @classmethod
+    def for_collection(
+        cls,
+        collection_name: str = settings.COLLECTION_NAME,
+        persist_directory: Path = settings.PERSIST_DIRECTORY_VS,
+    ) -> "BM25Index":
+        return cls(Path(persist_directory) / "lexical" / collection_name)
+
+    # ------------------------------------------------------------------ state
+
+    def _reset(self):
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.empty(0, dtype=np.int32)
+        self.post_tf = np.empty(0, dtype=np.uint16)
+        self.base_doc_len = np.empty(0, dtype=np.int32)
+        self.base_doc_ids = np.empty(0, dtype="S1")
+        self.sorted_ids = np.empty(0, dtype="S1")
+        self.sorted_docs = np.empty(0, dtype=np.int32)
+        self.base_deleted = np.empty(0, dtype=bool)
+        # delta segment
+        self.delta_postings: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        self.delta_doc_len: List[int] = []
+        self.delta_doc_ids: List[str] = []
+        self.delta_deleted: set = set()
+        self._delta_len_arr: Optional[np.ndarray] = None
+        self._delta_docs: Dict[str, int] = {}
+        self._live_docs = 0
+        self._live_len = 0
+        # which base segment is loaded, and how far its delta.log has been applied
+        self._base_key: Optional[Tuple[int, int]] = None
+        self._log_pos = 0
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.base_doc_ids) + len(self.delta_doc_ids)
+
+    def __len__(self) -> int:
+        return self._live_docs
+
+    @property
+    def _log_path(self) -> Path:
+        return self.dir / "delta.log"
+
+    def _stat_base(self) -> Optional[Tuple[int, int]]:
+        # vocab.json is only ever replaced, never modified: (inode, mtime) names the base
+        try:
+            st = os.stat(self.dir / "vocab.json")
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self, op: int) -> Iterator[None]:
+        self._lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, "a+") as lock_file:
+            fcntl.flock(lock_file, op)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        """the base segment, mmapped (file lock held)"""
+        self._base_key = self._stat_base()
+        self._log_pos = 0
+        if not (self.dir / "sorted_ids.npy").exists():
+            return
+        try:
+            self.vocab = json.loads((self.dir / "vocab.json").read_text(encoding="utf-8"))
+            self.offsets = np.load(self.dir / "offsets.npy", mmap_mode="r")
+            self.post_docs = np.load(self.dir / "post_docs.npy", mmap_mode="r")
+            self.post_tf = np.load(self.dir / "post_tf.npy", mmap_mode="r")
+            self.base_doc_len = np.load(self.dir / "doc_len.npy", mmap_mode="r")
+            self.base_doc_ids = np.load(self.dir / "doc_ids.npy", mmap_mode="r")
+            self.sorted_ids = np.load(self.dir / "sorted_ids.npy", mmap_mode="r")
+            self.sorted_docs = np.load(self.dir / "sorted_docs.npy", mmap_mode="r")
+        except Exception as e:
+            print(f"!! Unreadable lexical index at {self.dir}, starting empty: {e}")
+            base_key = self._base_key
+            self._reset()
+            self._base_key = base_key
+            return
+        # a fresh base has no tombstones: deletes since are in the log
+        self.base_deleted = np.zeros(len(self.base_doc_ids), dtype=bool)
+        self._live_docs = len(self.base_doc_ids)
+        self._live_len = int(np.asarray(self.base_doc_len, dtype=np.int64).sum())
+
+    def _refresh(self):
+        """catch up with what any process appended to delta.log, or compacted, since the last call"""
+        try:
+            size = os.stat(self._log_path).st_size
+        except FileNotFoundError:
+            size = 0
+        if size == self._log_pos and self._stat_base() == self._base_key:
+            return
+        with self._file_lock(fcntl.LOCK_SH):
+            self._read_log()
+
+    def _read_log(self):
+        """apply the unread part of delta.log (file lock held)"""
+        if self._stat_base() != self._base_key:
+            # compacted (or rebuilt) by someone: new base, new log
+            self._reset()
+            self._load()
+        try:
+            with open(self._log_path, "rb") as f:
+                f.seek(self._log_pos)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            rec = json.loads(line)
+            if "u" in rec:
+                self._apply_upsert(rec["u"], rec["t"], rec["n"])
+            else:
+                for vec_id in rec["d"]:
+                    self._apply_delete(vec_id)
+        self._log_pos += end
+
+    def _append(self, records: List[Dict[str, Any]]):
+        """log writes for every process, then apply them (with whatever others logged first)"""
+        with self._file_lock(fcntl.LOCK_EX):
+            self._read_log()
+            self.dir.mkdir(parents=True, exist_ok=True)
+            with open(self._log_path, "ab") as f:
+                f.write(b"".join(json.dumps(r, separators=(",", ":")).encode("utf-8") + b"\n" for r in records))
+            self._read_log()
+
+    def _base_doc(self, vec_id: str) -> Optional[int]:
+        if not len(self.sorted_ids):
+            return None
+        key = vec_id.encode("utf-8")
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < len(self.sorted_ids) and self.sorted_ids[i] == key:
+            doc = int(self.sorted_docs[i])
+            return None if self.base_deleted[doc] else doc
+        return None
+
+    def _find(self, vec_id: str) -> Optional[int]:
+        doc = self._delta_docs.get(vec_id)
+        return doc if doc is not None else self._base_doc(vec_id)
+
+    def _is_deleted(self, doc: int) -> bool:
+        if doc < len(self.base_deleted):
+            return bool(self.base_deleted[doc])
+        return doc in self.delta_deleted
+
+    def _doc_len(self, doc: int) -> int:
+        if doc < len(self.base_doc_len):
+            return int(self.base_doc_len[doc])
+        return self.delta_doc_len[doc - len(self.base_doc_len)]
+
+    def _delta_lengths(self) -> np.ndarray:
+        if self._delta_len_arr is None or self._delta_len_arr.size != len(self.delta_doc_len):
+            self._delta_len_arr = np.asarray(self.delta_doc_len, dtype=np.float32)
+        return self._delta_len_arr
+
+    def _tombstone(self, doc: int):
+        if self._is_deleted(doc):
+            return
+        if doc < len(self.base_deleted):
+            self.base_deleted[doc] = True
+        else:
+            self.delta_deleted.add(doc)
+        self._live_docs -= 1
+        self._live_len -= self._doc_len(doc)
+
+    def _apply_upsert(self, vec_id: str, counts: Dict[str, int], length: int):
+        old = self._find(vec_id)
+        if old is not None:
+            self._tombstone(old)
+        doc = self.n_docs
+        for term, tf in counts.items():
+            tid = self.vocab.get(term)
+            if tid is None:
+                tid = len(self.vocab)
+                self.vocab[term] = tid
+            self.delta_postings[tid].append((doc, min(tf, 65535)))
+        self.delta_doc_ids.append(vec_id)
+        self.delta_doc_len.append(length)
+        self._delta_docs[vec_id] = doc
+        self._live_docs += 1
+        self._live_len += length
+
+    def _apply_delete(self, vec_id: str):
+        doc = self._find(vec_id)
+        if doc is not None:
+            self._tombstone(doc)
+            self._delta_docs.pop(vec_id, None)
+
+    # ----------------------------------------------------------------- writes
+
+    @staticmethod
+    def _upsert_record(vec_id: str, text: str) -> Dict[str, Any]:
+        tokens = tokenize(text)
+        counts: Dict[str, int] = defaultdict(int)
+        for t in tokens:
+            counts[t] += 1
+        return {"u": vec_id, "t": counts, "n": len(tokens)}
+
+    def _needs_compaction(self) -> bool:
+        return max(len(self.delta_doc_ids), self.n_docs - self._live_docs) >= settings.LEXICAL_COMPACT_EVERY
+
+    def on_upsert(self, ids: List[str], documents: List[str], metadatas: Any = None, embeddings: Any = None):
+        records = [self._upsert_record(vec_id, text) for vec_id, text in zip(ids, documents)]
+        with self._lock:
+            self._append(records)
+            if self._needs_compaction():
+                self.compact(only_if_needed=True)
+
+    def on_delete(self, ids: List[str]):
+        with self._lock:
+            self._append([{"d": list(ids)}])
+            if self._needs_compaction():
+                self.compact(only_if_needed=True)
+
+    def compact(self, only_if_needed: bool = False):
+        """merge base + delta into a new base segment (dropping tombstones) and persist it"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._read_log()
+            if only_if_needed and not self._needs_compaction():
+                # another process compacted first
+                return
+            self._compact_locked()
+
+    def _compact_locked(self):
+        n_base = len(self.base_doc_ids)
+        deleted = np.zeros(self.n_docs, dtype=bool)
+        deleted[:n_base] = self.base_deleted
+        for d in self.delta_deleted:
+            deleted[d] = True
+        doc_len = np.concatenate([
+            np.asarray(self.base_doc_len, dtype=np.int32),
+            np.asarray(self.delta_doc_len, dtype=np.int32),
+        ])
+        doc_ids = np.concatenate([
+            np.asarray(self.base_doc_ids),
+            np.asarray([d.encode("utf-8") for d in self.delta_doc_ids], dtype=bytes),
+        ]) if self.delta_doc_ids else np.asarray(self.base_doc_ids)
+        remap = np.cumsum(~deleted, dtype=np.int64) - 1
+
+        # base postings as (term, doc, tf) columns
+        counts = np.diff(np.asarray(self.offsets))
+        terms = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        docs = np.asarray(self.post_docs, dtype=np.int64)
+        tfs = np.asarray(self.post_tf, dtype=np.uint16)
+        if self.delta_postings:
+            d_terms, d_docs, d_tfs = [], [], []
+            for tid, plist in self.delta_postings.items():
+                d_terms.extend([tid] * len(plist))
+                d_docs.extend(p[0] for p in plist)
+                d_tfs.extend(p[1] for p in plist)
+            terms = np.concatenate([terms, np.asarray(d_terms, dtype=np.int64)])
+            docs = np.concatenate([docs, np.asarray(d_docs, dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.asarray(d_tfs, dtype=np.uint16)])
+
+        keep = ~deleted[docs] if docs.size else np.empty(0, dtype=bool)
+        terms, docs, tfs = terms[keep], remap[docs[keep]], tfs[keep]
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        offsets = np.searchsorted(terms, np.arange(len(self.vocab) + 1), side="left").astype(np.int64)
+
+        live = ~deleted
+        self._write(
+            offsets=offsets,
+            post_docs=docs.astype(np.int32),
+            post_tf=tfs,
+            doc_len=doc_len[live],
+            doc_ids=doc_ids[live],
+        )
+        self._reset()
+        self._load()
+
+    def _write(self, offsets, post_docs, post_tf, doc_len, doc_ids: np.ndarray):
+        tmp = self.dir.with_name(self.dir.name + ".tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        (tmp / "vocab.json").write_text(json.dumps(self.vocab, separators=(",", ":")), encoding="utf-8")
+        np.save(tmp / "offsets.npy", offsets)
+        np.save(tmp / "post_docs.npy", post_docs)
+        np.save(tmp / "post_tf.npy", post_tf)
+        np.save(tmp / "doc_len.npy", doc_len)
+        np.save(tmp / "doc_ids.npy", doc_ids)
+        order = np.argsort(doc_ids, kind="stable")
+        np.save(tmp / "sorted_ids.npy", doc_ids[order])
+        np.save(tmp / "sorted_docs.npy", order.astype(np.int32))
+        (tmp / "delta.log").touch()
+        # swap directories; readers hold mmaps of the old files, which stay valid
+        old = self.dir.with_name(self.dir.name + ".old")
+        if old.exists():
+            shutil.rmtree(old)
+        if self.dir.exists():
+            os.replace(self.dir, old)
+        os.replace(tmp, self.dir)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def flush(self):
+        with self._lock:
+            self._refresh()
+            if self.delta_doc_ids or self.delta_deleted or (self.base_deleted.size and self.base_deleted.any()):
+                self.compact()
+
+    def rebuild_from_collection(self, collection, page_size: int = 5000):
+        """(re)build from the chunk texts already stored in a Chroma collection"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            # everything logged so far is in the collection too
+            self._reset()
+            offset = 0
+            while True:
+                batch = collection.get(include=["documents"], limit=page_size, offset=offset)
+                ids = batch.get("ids") or []
+                if not ids:
+                    break
+                for vec_id, text in zip(ids, batch.get("documents") or [""] * len(ids)):
+                    rec = self._upsert_record(vec_id, text)
+                    self._apply_upsert(rec["u"], rec["t"], rec["n"])
+                offset += len(ids)
+            self._compact_locked()
+            print(f"Lexical index rebuilt from collection: {self._live_docs} docs")
+
+    # ------------------------------------------------------------------ reads
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """return [(vector_id, bm25_score)] best first"""
+        terms = {t for t in tokenize(query)}
+        with self._lock:
+            self._refresh()
+            if not terms or self._live_docs == 0:
+                return []
+            n = self._live_docs
+            avgdl = max(1e-9, self._live_len / n)
+            n_base = len(self.base_doc_ids)
+            dead_delta = np.fromiter(self.delta_deleted, dtype=np.int64) if self.delta_deleted else None
+
+            docs_parts, score_parts = [], []
+            for term in terms:
+                tid = self.vocab.get(term)
+                if tid is None:
+                    continue
+                # base postings only reference base docs, delta postings delta docs:
+                # each side indexes its own doc-length array directly
+                if tid + 1 < len(self.offsets):
+                    lo, hi = int(self.offsets[tid]), int(self.offsets[tid + 1])
+                    t_docs = np.asarray(self.post_docs[lo:hi], dtype=np.int64)
+                    t_tf = np.asarray(self.post_tf[lo:hi], dtype=np.float32)
+                    live = ~self.base_deleted[t_docs]
+                    t_docs, t_tf = t_docs[live], t_tf[live]
+                    t_dl = np.asarray(self.base_doc_len[t_docs], dtype=np.float32)
+                else:
+                    t_docs = np.empty(0, dtype=np.int64)
+                    t_tf = np.empty(0, dtype=np.float32)
+                    t_dl = np.empty(0, dtype=np.float32)
+                delta = self.delta_postings.get(tid)
+                if delta:
+                    d = np.asarray(delta, dtype=np.int64)
+                    if dead_delta is not None:
+                        d = d[~np.isin(d[:, 0], dead_delta)]
+                    t_docs = np.concatenate([t_docs, d[:, 0]])
+                    t_tf = np.concatenate([t_tf, d[:, 1].astype(np.float32)])
+                    t_dl = np.concatenate([t_dl, self._delta_lengths()[d[:, 0] - n_base]])
+                if t_docs.size == 0:
+                    continue
+                df = t_docs.size
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                score = idf * t_tf * (self.k1 + 1.0) / (t_tf + self.k1 * (1.0 - self.b + self.b * t_dl / avgdl))
+                docs_parts.append(t_docs)
+                score_parts.append(score)
+
+            if not docs_parts:
+                return []
+            docs = np.concatenate(docs_parts)
+            scores = np.concatenate(score_parts)
+            uniq, inv = np.unique(docs, return_inverse=True)
+            totals = np.bincount(inv, weights=scores)
+
+            k = min(top_k, uniq.size)
+            top = np.argpartition(-totals, k - 1)[:k]
+            top = top[np.argsort(-totals[top])]
+            out = []
+            for i in top:
+                doc = int(uniq[i])
+                vec_id = self.base_doc_ids[doc].decode("utf-8") if doc < n_base else self.delta_doc_ids[doc - n_base]
+                out.append((vec_id, float(totals[i])))
+            return out
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from rag.utility.helpers import sha256_file
+from rag.core.config import settings
+
+
+class IndexManifest:
+    """
+    Per-file record of what is indexed in one collection:
+        {abs_path: {"sha256", "mtime", "size", "ids": [vector ids], "indexed_at"}}
+
+    Persisted as JSON next to the vector store so `build_index` can skip
+    unchanged PDFs, re-embed only new/modified ones and purge the vector ids
+    of modified or removed files.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.loaded_from_disk = False
+        self._load()
+
+    @classmethod
+    def for_collection(
+        cls,
+        collection_name: str = settings.COLLECTION_NAME,
+        persist_directory: Path = settings.PERSIST_DIRECTORY_VS,
+    ) -> "IndexManifest":
+        return cls(Path(persist_directory) / "manifests" / f"{collection_name}.json")
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.entries = dict(data.get("entries") or {})
+            self.loaded_from_disk = True
+        except Exception as e:
+            print(f"!! Ignoring unreadable manifest {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        """atomic write (tmp file + rename) so a crash never leaves a torn manifest"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"entries": self.entries}, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(path)
+
+    def set(self, path: str, sha256: str, mtime: Optional[float], size: Optional[int], ids: List[str]):
+        self.entries[path] = {
+            "sha256": sha256,
+            "mtime": mtime,
+            "size": size,
+            "ids": list(ids),
+            "indexed_at": time.time(),
+        }
+
+    def remove(self, path: str) -> List[str]:
+        """drop a file and return its vector ids"""
+        entry = self.entries.pop(path, None) or {}
+        return list(entry.get("ids") or [])
+
+    def bootstrap_from_collection(self, collection, page_size: int = 5000):
+        """
+        Derive entries from chunk metadata already stored in the collection
+        (file_sha256 / file_mtime are recorded by load_data).
+        Used once when an existing index has no manifest yet.
+        """
+        offset = 0
+        while True:
+            batch = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            ids = batch.get("ids") or []
+            if not ids:
+                break
+            for vec_id, meta in zip(ids, batch.get("metadatas") or [{}] * len(ids)):
+                meta = meta or {}
+                src = meta.get("source_file") or meta.get("source")
+                if not src:
+                    continue
+                entry = self.entries.setdefault(src, {
+                    "sha256": meta.get("file_sha256"),
+                    "mtime": meta.get("file_mtime"),
+                    "size": None,
+                    "ids": [],
+                    "indexed_at": None,
+                })
+                entry["ids"].append(vec_id)
+            offset += len(ids)
+        print(f"Bootstrapped manifest from collection: {len(self.entries)} files, {offset} vectors")
+
+    def plan(self, files: Iterable[Path]) -> Tuple[List[Path], List[Path]]:
+        """
+        Split files into (to_index, unchanged).
+        Cheap stat() check first; hash only when mtime/size moved.
+        """
+        to_index: List[Path] = []
+        unchanged: List[Path] = []
+        for f in files:
+            abs_path = Path(f).resolve()
+            key = str(abs_path)
+            entry = self.entries.get(key)
+            try:
+                st = abs_path.stat()
+            except OSError:
+                continue
+            if entry is None:
+                to_index.append(abs_path)
+                continue
+            if entry.get("mtime") == st.st_mtime and entry.get("size") == st.st_size:
+                unchanged.append(abs_path)
+                continue
+            try:
+                sha = sha256_file(abs_path)
+            except OSError:
+                continue
+            if sha == entry.get("sha256"):
+                # touched but same content: refresh the stat fingerprint only
+                entry["mtime"] = st.st_mtime
+                entry["size"] = st.st_size
+                unchanged.append(abs_path)
+            else:
+                to_index.append(abs_path)
+        return to_index, unchanged
+
+    def missing_under(self, root: Path, present: Iterable[Path]) -> List[str]:
+        """manifest entries under `root` whose file no longer exists in `present`"""
+        root_abs = str(Path(root).resolve())
+        present_set = {str(Path(p).resolve()) for p in present}
+        return [
+            p for p in self.entries
+            if (p == root_abs or p.startswith(root_abs + os.sep)) and p not in present_set
+        ]
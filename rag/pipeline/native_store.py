@@ -0,0 +1,849 @@
+"""
+In-process vector index: memory-mapped vectors, IVF-flat search and a
+columnar metadata store, exposed through the subset of the Chroma collection
+API the rest of the code uses (upsert/get/query/delete/count), so
+NativeVectorStore is a drop-in for the Chroma-backed VectorStore.
+
+migrate an existing Chroma collection:
+    python -m rag.pipeline.native_store --migrate [--collection NAME]
+"""
+from __future__ import annotations
+import argparse
+import fcntl
+import json
+import math
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.core.config import settings
+from rag.pipeline.filters import WHERE_OPS, where_key
+
+_SCAN_BLOCK = 65536
+
+
+class _Column:
+    """
+    one metadata field over all rows. Numeric fields (page, chunk ids, lengths)
+    are plain int64/float64 arrays; anything else is dictionary-encoded
+    (codes[row] indexes `values`), which keeps per-file strings like
+    source_file / file_sha256 down to 4 bytes a row. `present` marks rows
+    that have the field.
+    """
+
+    def __init__(self, capacity: int):
+        self.kind: Optional[str] = None  # "int" | "float" | "dict"
+        self.present = np.zeros(capacity, dtype=bool)
+        self.data = np.zeros(0, dtype=np.int64)
+        self.values: List[Any] = []
+        # keyed by (type, value) so 1, True and "1" stay distinct
+        self._lookup: Dict[Tuple[str, Any], int] = {}
+
+    @staticmethod
+    def _kind_of(value: Any) -> str:
+        if isinstance(value, bool):
+            return "dict"
+        if isinstance(value, int):
+            return "int"
+        if isinstance(value, float):
+            return "float"
+        return "dict"
+
+    def grow(self, capacity: int):
+        if capacity > self.present.shape[0]:
+            present = np.zeros(capacity, dtype=bool)
+            present[: self.present.shape[0]] = self.present
+            self.present = present
+        if self.kind is not None and capacity > self.data.shape[0]:
+            data = np.zeros(capacity, dtype=self.data.dtype)
+            data[: self.data.shape[0]] = self.data
+            self.data = data
+
+    def _convert(self, kind: str):
+        """widen the column: int -> float, or numeric -> dictionary-encoded"""
+        cap = self.present.shape[0]
+        if self.kind is None:
+            dtype = {"int": np.int64, "float": np.float64, "dict": np.int32}[kind]
+            self.data = np.zeros(cap, dtype=dtype)
+        elif kind == "float":
+            self.data = self.data.astype(np.float64)
+        else:
+            old, rows = self.data, np.flatnonzero(self.present)
+            self.data = np.zeros(cap, dtype=np.int32)
+            self.kind = "dict"
+            for row in rows.tolist():
+                self.set(row, old[row].item())
+        self.kind = kind
+
+    def set(self, row: int, value: Any):
+        kind = self._kind_of(value)
+        if self.kind is None:
+            self._convert(kind)
+        elif kind != self.kind and self.kind != "dict" and not (self.kind == "float" and kind == "int"):
+            self._convert("float" if {self.kind, kind} == {"int", "float"} else "dict")
+        self.present[row] = True
+        if self.kind == "dict":
+            key = (type(value).__name__, value)
+            code = self._lookup.get(key)
+            if code is None:
+                code = len(self.values)
+                self.values.append(value)
+                self._lookup[key] = code
+            self.data[row] = code
+        else:
+            self.data[row] = value
+
+    def get(self, row: int) -> Any:
+        if not self.present[row]:
+            return None
+        if self.kind == "dict":
+            return self.values[self.data[row]]
+        return self.data[row].item()
+
+    def mask(self, n: int, op: str, bound: Any) -> np.ndarray:
+        """bool mask over rows [0, n) where `<value> op bound` holds (rows without the field excluded)"""
+        present = self.present[:n]
+        data = self.data[:n]
+        fn = WHERE_OPS[op]
+        if self.kind == "dict":
+            good = [c for c, v in enumerate(self.values) if _safe(fn, v, bound)]
+            hit = np.isin(data, np.asarray(good, dtype=np.int32)) if good else np.zeros(n, dtype=bool)
+            return present & hit
+        if op in ("$in", "$nin"):
+            nums = [b for b in bound if self._kind_of(b) in ("int", "float")]
+            hit = np.isin(data, np.asarray(nums)) if nums else np.zeros(n, dtype=bool)
+            return present & (hit if op == "$in" else ~hit)
+        if self._kind_of(bound) not in ("int", "float"):
+            # a number never equals a string
+            return present.copy() if op == "$ne" else np.zeros(n, dtype=bool)
+        return present & fn(data, bound)
+
+
+def _safe(fn, value, bound) -> bool:
+    try:
+        return bool(fn(value, bound))
+    except TypeError:
+        # e.g. comparing a str column value with an int bound
+        return False
+
+
+class _IVF:
+    """
+    IVF-flat over unit vectors: spherical k-means centroids, every row
+    assigned to its nearest centroid; a query scans the rows of the
+    `nprobe` closest lists only.
+    Vectors are packed list by list into one contiguous array, so a probe is
+    a sequential slice instead of a random gather from the mmap. Rows added
+    after packing sit in a small unpacked tail until the next repack.
+    """
+
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray, trained_rows: int):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assign = assign
+        self.trained_rows = trained_rows
+        self._packed: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._packed_upto = 0
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, rows: np.ndarray, n_total: int, iters: int = 8, seed: int = 0) -> "_IVF":
+        nlist = int(min(65536, max(16, 2 * math.sqrt(rows.size))))
+        rng = np.random.default_rng(seed)
+        sample = rows if rows.size <= 32 * nlist else rng.choice(rows, 32 * nlist, replace=False)
+        x = np.asarray(vectors[np.sort(sample)], dtype=np.float32)
+        nlist = min(nlist, x.shape[0])
+        centroids = x[rng.choice(x.shape[0], nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = _argmax_blocks(x, centroids)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(x[order], starts[nonempty], axis=0)
+            # re-seed empty lists from random points
+            if not nonempty.all():
+                sums[~nonempty] = x[rng.choice(x.shape[0], int((~nonempty).sum()), replace=False)]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        ivf = cls(centroids, np.full(n_total, -1, dtype=np.int32), trained_rows=int(rows.size))
+        ivf.add(vectors, rows)
+        return ivf
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        if rows.size == 0:
+            return
+        if rows.max() >= self.assign.shape[0]:
+            assign = np.full(max(int(rows.max()) + 1, 2 * self.assign.shape[0]), -1, dtype=np.int32)
+            assign[: self.assign.shape[0]] = self.assign
+            self.assign = assign
+        for start in range(0, rows.size, _SCAN_BLOCK):
+            block = rows[start:start + _SCAN_BLOCK]
+            self.assign[block] = _argmax_blocks(np.asarray(vectors[block], dtype=np.float32), self.centroids)
+        if rows.min() < self._packed_upto:
+            # re-assigned packed rows: repack on the next query
+            self._packed = None
+
+    def _pack(self, vectors: np.ndarray, n: int):
+        assign = self.assign[:n]
+        order = np.argsort(assign, kind="stable")
+        order = order[assign[order] >= 0]
+        bounds = np.searchsorted(assign[order], np.arange(self.centroids.shape[0] + 1))
+        packed = np.empty((order.size, vectors.shape[1]), dtype=vectors.dtype)
+        for start in range(0, order.size, _SCAN_BLOCK):
+            block = order[start:start + _SCAN_BLOCK]
+            # gather in row order (sequential mmap reads), scatter to list order
+            sorted_idx = np.argsort(block)
+            packed[start + sorted_idx] = vectors[block[sorted_idx]]
+        self._packed = (packed, order.astype(np.int64), bounds)
+        self._packed_upto = n
+
+    def search(self, q: np.ndarray, vectors: np.ndarray, valid: np.ndarray, k: int, nprobe: int):
+        n = valid.shape[0]
+        packed = self._packed
+        if packed is None or n - self._packed_upto > max(10000, self._packed_upto // 10):
+            self._pack(vectors, n)
+            packed = self._packed
+        vecs, rows_of, bounds = packed
+        nprobe = min(nprobe, self.centroids.shape[0])
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+
+        rows_parts, sims_parts = [], []
+        for c in probes.tolist():
+            lo, hi = bounds[c], bounds[c + 1]
+            if hi > lo:
+                rows_parts.append(rows_of[lo:hi])
+                sims_parts.append(np.asarray(vecs[lo:hi], dtype=np.float32) @ q)
+        upto = self._packed_upto
+        if n > upto:
+            tail = np.arange(upto, n)
+            tail = tail[np.isin(self.assign[upto:n], probes)]
+            if tail.size:
+                rows_parts.append(tail)
+                sims_parts.append(np.asarray(vectors[tail], dtype=np.float32) @ q)
+        if not rows_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(rows_parts)
+        sims = np.concatenate(sims_parts)
+        keep = valid[rows]
+        rows, sims = rows[keep], sims[keep]
+        if rows.size == 0:
+            return rows, sims
+        kk = min(k, sims.size)
+        idx = np.argpartition(-sims, kk - 1)[:kk]
+        idx = idx[np.argsort(-sims[idx])]
+        return rows[idx], sims[idx]
+
+
+def _argmax_blocks(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(x.shape[0], dtype=np.int32)
+    for start in range(0, x.shape[0], 8192):
+        out[start:start + 8192] = np.argmax(x[start:start + 8192] @ centroids.T, axis=1)
+    return out
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class NativeCollection:
+    """
+    Chroma-compatible collection stored in one directory:
+        info.json       dim, vector dtype, collection metadata
+        vectors.bin     unit-normalized rows (float32 or float16), memory-mapped
+        documents.bin   utf-8 chunk texts, addressed by (offset, length)
+        log.jsonl       append-only row log: {"id", "off", "len", "meta"} per row,
+                        {"del": [rows]} for deletes; row number = add order
+        ivf.npz         IVF centroids + row assignments (rebuilt by build_index)
+    Upserts append (an existing id tombstones its old row), so writes are
+    crash-safe without rewriting the files; `compact()` drops dead rows.
+    Metadata lives in memory as dictionary-encoded columns, so `where`
+    filters become vectorized bitmaps.
+
+    Several processes can open the same directory: writers hold an flock on
+    <dir>.lock, and every read first stats log.jsonl (plus info.json and
+    ivf.npz, which are only ever replaced) and applies just the log lines
+    appended since, or reloads after another process compacted.
+    """
+
+    def __init__(self, directory: Path, metadata: Optional[Dict[str, Any]] = None,
+                 dtype: str = settings.NATIVE_VECTOR_DTYPE):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.metadata: Dict[str, Any] = {"hnsw:space": "cosine", **(metadata or {})}
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._lock = threading.RLock()
+        self._lock_path = self.dir.with_name(self.dir.name + ".lock")
+        self._flock_held = False
+        self._reset()
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._load()
+
+    def _reset(self):
+        self.ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._doc_off = np.zeros(0, dtype=np.int64)
+        self._doc_len = np.zeros(0, dtype=np.int64)
+        self._columns: Dict[str, _Column] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._docs: Optional[np.ndarray] = None
+        self._docs_size = 0
+        self._ivf: Optional[_IVF] = None
+        self._n = 0
+        self._live = 0
+        # where clause -> row bitmap, valid until the next write
+        self._masks: Dict[str, np.ndarray] = {}
+        # how far log.jsonl has been applied, and which info.json / ivf.npz are loaded
+        self._log_pos = 0
+        self._base_key: Optional[Tuple[int, int]] = None
+        self._ivf_key: Optional[Tuple[int, int]] = None
+
+    # ------------------------------------------------------------------ state
+
+    def _ensure_capacity(self, n: int):
+        cap = self._alive.shape[0]
+        if n <= cap:
+            return
+        cap = max(n, 2 * cap, 1024)
+        for name in ("_alive", "_doc_off", "_doc_len"):
+            old = getattr(self, name)
+            new = np.zeros(cap, dtype=old.dtype)
+            new[: old.shape[0]] = old
+            setattr(self, name, new)
+        for col in self._columns.values():
+            col.grow(cap)
+
+    def _column(self, key: str) -> _Column:
+        col = self._columns.get(key)
+        if col is None:
+            col = _Column(self._alive.shape[0])
+            self._columns[key] = col
+        return col
+
+    def _append_row(self, vec_id: str, off: int, length: int, meta: Optional[Dict[str, Any]]):
+        self._masks.clear()
+        row = self._n
+        self._ensure_capacity(row + 1)
+        old = self._row_of.get(vec_id)
+        if old is not None:
+            self._alive[old] = False
+            self._live -= 1
+        self.ids.append(vec_id)
+        self._row_of[vec_id] = row
+        self._alive[row] = True
+        self._doc_off[row] = off
+        self._doc_len[row] = length
+        for key, value in (meta or {}).items():
+            if value is not None:
+                self._column(key).set(row, value)
+        self._n += 1
+        self._live += 1
+        return row
+
+    def _row_bytes(self) -> int:
+        return int(self.dim) * self.dtype.itemsize
+
+    def _remap(self):
+        """(re)map the data files after they grew"""
+        vec_path = self.dir / "vectors.bin"
+        if self._n and self.dim:
+            self._vectors = np.memmap(vec_path, dtype=self.dtype, mode="r", shape=(self._n, self.dim))
+        else:
+            self._vectors = None
+        doc_path = self.dir / "documents.bin"
+        self._docs = np.memmap(doc_path, dtype=np.uint8, mode="r") if self._docs_size else None
+
+    @contextmanager
+    def _file_lock(self, op: int):
+        """flock on <dir>.lock (LOCK_EX to write); reentrant, call with self._lock held"""
+        if self._flock_held:
+            yield
+            return
+        with open(self._lock_path, "a+") as lock_file:
+            fcntl.flock(lock_file, op)
+            self._flock_held = True
+            try:
+                yield
+            finally:
+                self._flock_held = False
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stat_key(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.dir / name)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _load(self):
+        """read info.json, log.jsonl and ivf.npz (file lock held)"""
+        self._base_key = self._stat_key("info.json")
+        info_path = self.dir / "info.json"
+        if info_path.exists():
+            info = json.loads(info_path.read_text(encoding="utf-8"))
+            self.dim = info.get("dim")
+            self.dtype = np.dtype(info.get("dtype", self.dtype.name))
+            self.metadata = {**info.get("metadata", {}), **self.metadata}
+        self._read_log()
+        self._remap()
+        self._load_ivf()
+        print(f"Native collection loaded from {self.dir}: {self._live} vectors")
+
+    def _read_log(self):
+        """apply the complete log lines appended since the last read (file lock held)"""
+        try:
+            with open(self.dir / "log.jsonl", "rb") as f:
+                f.seek(self._log_pos)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        first = self._n
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "del" in entry:
+                self._mark_deleted(entry["del"])
+            else:
+                self._append_row(entry["id"], entry["off"], entry["len"], entry.get("meta"))
+        self._log_pos += end
+        if self._n > first:
+            ends = self._doc_off[first:self._n] + self._doc_len[first:self._n]
+            self._docs_size = max(self._docs_size, int(ends.max()))
+            self._remap()
+            if self._ivf is not None:
+                self._ivf.add(self._vectors, np.arange(first, self._n))
+
+    def _load_ivf(self):
+        self._ivf_key = self._stat_key("ivf.npz")
+        if self._ivf_key is None or self._vectors is None:
+            return
+        with np.load(self.dir / "ivf.npz") as z:
+            assign = z["assign"]
+            self._ivf = _IVF(z["centroids"], np.full(self._alive.shape[0], -1, dtype=np.int32),
+                             trained_rows=int(z["trained_rows"]))
+        known = min(assign.shape[0], self._n)
+        self._ivf.assign[:known] = assign[:known]
+        self._ivf.add(self._vectors, np.arange(known, self._n))
+
+    def _catch_up(self):
+        """apply what other processes wrote since the last call (file lock held)"""
+        if self._stat_key("info.json") != self._base_key:
+            # compacted (or first written) by another process
+            self._reset()
+            self._load()
+            return
+        self._read_log()
+        if self._stat_key("ivf.npz") != self._ivf_key:
+            self._load_ivf()
+
+    def _refresh(self):
+        """cheap check before a read: a few stats when no other process wrote"""
+        try:
+            size = os.stat(self.dir / "log.jsonl").st_size
+        except FileNotFoundError:
+            size = 0
+        if (size == self._log_pos and self._stat_key("info.json") == self._base_key
+                and self._stat_key("ivf.npz") == self._ivf_key):
+            return
+        with self._file_lock(fcntl.LOCK_SH):
+            self._catch_up()
+
+    @staticmethod
+    def _truncate(path: Path, size: int):
+        if path.exists() and path.stat().st_size > size:
+            os.truncate(path, size)
+
+    def _truncate_to_log(self):
+        """cut the files back to what the log records (LOCK_EX held: no append in flight)"""
+        self._truncate(self.dir / "vectors.bin", self._n * self._row_bytes() if self.dim else 0)
+        self._truncate(self.dir / "documents.bin", self._docs_size)
+        self._truncate(self.dir / "log.jsonl", self._log_pos)
+
+    def _write_info(self):
+        tmp = self.dir / "info.json.tmp"
+        tmp.write_text(json.dumps({"dim": self.dim, "dtype": self.dtype.name, "metadata": self.metadata}), encoding="utf-8")
+        os.replace(tmp, self.dir / "info.json")
+        self._base_key = self._stat_key("info.json")
+
+    def _mark_deleted(self, rows: Iterable[int]):
+        self._masks.clear()
+        for row in rows:
+            if row < self._n and self._alive[row]:
+                self._alive[row] = False
+                self._live -= 1
+                vec_id = self.ids[row]
+                if self._row_of.get(vec_id) == row:
+                    del self._row_of[vec_id]
+
+    # ------------------------------------------------------------------ writes
+
+    def upsert(self, ids: Sequence[str], embeddings, metadatas: Optional[Sequence[Dict]] = None,
+               documents: Optional[Sequence[str]] = None):
+        ids = list(ids)
+        if not ids:
+            return
+        vecs = _unit_rows(embeddings)
+        if vecs.shape[0] != len(ids):
+            raise ValueError("Number of ids must match number of embeddings")
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [""] * len(ids)
+
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            if self.dim is None:
+                self.dim = int(vecs.shape[1])
+                self._write_info()
+            elif vecs.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {vecs.shape[1]} does not match collection dim {self.dim}")
+
+            encoded = [(d or "").encode("utf-8") for d in documents]
+            entries = []
+            off = self._docs_size
+            for vec_id, doc, meta in zip(ids, encoded, metadatas):
+                entries.append({"id": vec_id, "off": off, "len": len(doc), "meta": meta or {}})
+                off += len(doc)
+
+            # drop bytes (or a torn log line) from a writer that crashed mid-upsert
+            self._truncate_to_log()
+            # data first, log last: the log is what makes rows exist
+            with open(self.dir / "vectors.bin", "ab") as f:
+                f.write(vecs.astype(self.dtype, copy=False).tobytes())
+            with open(self.dir / "documents.bin", "ab") as f:
+                f.write(b"".join(encoded))
+            with open(self.dir / "log.jsonl", "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+            self._read_log()
+
+    add = upsert
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            rows = set()
+            if ids is not None:
+                rows.update(self._row_of[i] for i in ids if i in self._row_of)
+            if where:
+                rows.update(np.flatnonzero(self._where_mask(where)).tolist())
+            if not rows:
+                return
+            rows = sorted(rows)
+            self._truncate(self.dir / "log.jsonl", self._log_pos)
+            with open(self.dir / "log.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps({"del": rows}) + "\n")
+            self._read_log()
+
+    def build_index(self, force: bool = False):
+        """(re)train the IVF lists once the collection is large enough (or has doubled since)"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            if self._vectors is None or self._live < settings.NATIVE_IVF_MIN_ROWS:
+                return
+            if not force and self._ivf is not None and self._live < 2 * self._ivf.trained_rows:
+                return
+            rows = np.flatnonzero(self._alive[: self._n])
+            print(f"Training IVF index over {rows.size} vectors")
+            self._ivf = _IVF.train(self._vectors, rows, self._alive.shape[0])
+            self._save_ivf()
+
+    def _save_ivf(self):
+        if self._ivf is None:
+            return
+        tmp = self.dir / "ivf.tmp.npz"
+        np.savez(tmp, centroids=self._ivf.centroids, assign=self._ivf.assign[: self._n],
+                 trained_rows=np.asarray(self._ivf.trained_rows))
+        os.replace(tmp, self.dir / "ivf.npz")
+        self._ivf_key = self._stat_key("ivf.npz")
+
+    def compact(self):
+        """rewrite live rows only; readers keep their mmaps of the old files"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            rows = np.flatnonzero(self._alive[: self._n])
+            tmp = self.dir.with_name(self.dir.name + ".tmp")
+            if tmp.exists():
+                shutil.rmtree(tmp)
+            tmp.mkdir(parents=True)
+            docs = self._docs
+            off = 0
+            with open(tmp / "vectors.bin", "wb") as vf, open(tmp / "documents.bin", "wb") as df, \
+                    open(tmp / "log.jsonl", "w", encoding="utf-8") as lf:
+                for start in range(0, rows.size, _SCAN_BLOCK):
+                    block = rows[start:start + _SCAN_BLOCK]
+                    vf.write(np.asarray(self._vectors[block]).tobytes())
+                    for row in block.tolist():
+                        length = int(self._doc_len[row])
+                        o = int(self._doc_off[row])
+                        df.write(bytes(docs[o:o + length]) if length else b"")
+                        entry = {"id": self.ids[row], "off": off, "len": length, "meta": self._row_meta(row)}
+                        lf.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+                        off += length
+            ivf = self._ivf
+            if ivf is not None:
+                np.savez(tmp / "ivf.npz", centroids=ivf.centroids, assign=ivf.assign[rows],
+                         trained_rows=np.asarray(ivf.trained_rows))
+            if self.dim is not None:
+                (tmp / "info.json").write_text(
+                    json.dumps({"dim": self.dim, "dtype": self.dtype.name, "metadata": self.metadata}), encoding="utf-8"
+                )
+            old = self.dir.with_name(self.dir.name + ".old")
+            if old.exists():
+                shutil.rmtree(old)
+            os.replace(self.dir, old)
+            os.replace(tmp, self.dir)
+            shutil.rmtree(old, ignore_errors=True)
+            self._reset()
+            self._load()
+
+    def flush(self):
+        """end of an indexing run: drop dead rows if they pile up, (re)train IVF, persist assignments"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            dead = self._n - self._live
+            if dead and dead >= settings.NATIVE_COMPACT_RATIO * max(self._n, 1):
+                self.compact()
+            self.build_index()
+            self._save_ivf()
+
+    # ------------------------------------------------------------------ reads
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._live
+
+    def _row_meta(self, row: int) -> Dict[str, Any]:
+        meta = {}
+        for key, col in self._columns.items():
+            if col.present[row]:
+                meta[key] = col.get(row)
+        return meta
+
+    def _row_doc(self, row: int, docs: Optional[np.ndarray]) -> str:
+        length = int(self._doc_len[row])
+        if not length or docs is None:
+            return ""
+        off = int(self._doc_off[row])
+        return bytes(docs[off:off + length]).decode("utf-8")
+
+    def _filter_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """cached bitmap of live rows matching `where` (read-only; rebuilt after writes)"""
+        key = where_key(where)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._where_mask(where)
+            if len(self._masks) >= 64:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Chroma `where` filter -> bool mask over rows [0, n) (live rows only)"""
+        n = self._n
+        mask = self._alive[:n].copy()
+        for key, cond in where.items():
+            if key == "$and":
+                for sub in cond:
+                    mask &= self._where_mask(sub)
+            elif key == "$or":
+                any_mask = np.zeros(n, dtype=bool)
+                for sub in cond:
+                    any_mask |= self._where_mask(sub)
+                mask &= any_mask
+            else:
+                col = self._columns.get(key)
+                if not isinstance(cond, dict):
+                    cond = {"$eq": cond}
+                for op, bound in cond.items():
+                    if op not in WHERE_OPS:
+                        raise ValueError(f"unsupported where operator: {op}")
+                    if col is None:
+                        # missing field: only negative operators can match
+                        if op not in ("$ne", "$nin"):
+                            mask[:] = False
+                        continue
+                    col_mask = col.mask(n, op, bound)
+                    if op in ("$ne", "$nin"):
+                        col_mask |= ~col.present[:n]
+                    mask &= col_mask
+        return mask
+
+    def _result_rows(self, rows: Sequence[int], include: Sequence[str], docs) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            out["documents"] = [self._row_doc(r, docs) for r in rows]
+        if "metadatas" in include:
+            out["metadatas"] = [self._row_meta(r) for r in rows]
+        if "embeddings" in include:
+            idx = np.asarray(rows, dtype=np.int64)
+            out["embeddings"] = (
+                np.asarray(self._vectors[idx], dtype=np.float32) if idx.size
+                else np.empty((0, self.dim or 0), dtype=np.float32)
+            )
+        return out
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("metadatas", "documents"), limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self._row_of[i] for i in ids if i in self._row_of]
+                if where:
+                    mask = self._filter_mask(where)
+                    rows = [r for r in rows if mask[r]]
+            else:
+                mask = self._filter_mask(where) if where else self._alive[: self._n]
+                rows = np.flatnonzero(mask).tolist()
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            return self._result_rows(rows, include, self._docs)
+
+    def query(self, query_embeddings, n_results: int = 10,
+              include: Sequence[str] = ("metadatas", "documents", "distances"),
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        queries = _unit_rows(query_embeddings)
+        with self._lock:
+            self._refresh()
+            n = self._n
+            vectors, docs, ivf = self._vectors, self._docs, self._ivf
+            valid = self._filter_mask(where) if where else self._alive[:n].copy()
+        out: Dict[str, List[Any]] = {"ids": [], "distances": []}
+        for key in ("documents", "metadatas", "embeddings"):
+            if key in include:
+                out[key] = []
+        if vectors is None or n_results <= 0:
+            for key in out:
+                out[key] = [[] for _ in range(queries.shape[0])]
+            return out
+
+        n_valid = int(valid.sum())
+        # IVF unless a selective filter leaves few enough rows to scan exactly
+        use_ivf = ivf is not None and n_valid > settings.NATIVE_IVF_MIN_ROWS
+        if use_ivf:
+            top = [self._ivf_top(ivf, q, vectors, valid, n_results, n_valid) for q in queries]
+        else:
+            top = self._exact_top(queries, vectors, valid, n_results)
+
+        for rows, sims in top:
+            res = self._result_rows(rows.tolist(), include, docs)
+            out["ids"].append(res["ids"])
+            out["distances"].append((1.0 - sims).tolist())
+            for key in ("documents", "metadatas", "embeddings"):
+                if key in out:
+                    out[key].append(res[key])
+        return out
+
+    @staticmethod
+    def _ivf_top(ivf: _IVF, q: np.ndarray, vectors: np.ndarray, valid: np.ndarray, k: int, n_valid: int):
+        """probe the closest lists, doubling nprobe while a `where` filter leaves fewer than k hits"""
+        want = min(k, n_valid)
+        nprobe = settings.NATIVE_IVF_NPROBE
+        while True:
+            rows, sims = ivf.search(q, vectors, valid, k, nprobe)
+            if rows.size >= want or nprobe >= ivf.centroids.shape[0]:
+                return rows, sims
+            nprobe *= 2
+
+    @staticmethod
+    def _exact_top(queries: np.ndarray, vectors: np.ndarray, valid: np.ndarray, k: int):
+        """blocked brute-force scan: one matmul per block for all queries"""
+        m = queries.shape[0]
+        candidates = np.flatnonzero(valid)
+        if candidates.size <= _SCAN_BLOCK:
+            # few valid rows (small collection or selective filter): gather just those
+            if candidates.size == 0:
+                return [(candidates, np.empty(0, dtype=np.float32)) for _ in range(m)]
+            sims = (np.asarray(vectors[candidates], dtype=np.float32) @ queries.T).T
+            kk = min(k, candidates.size)
+            results = []
+            for qi in range(m):
+                idx = np.argpartition(-sims[qi], kk - 1)[:kk]
+                idx = idx[np.argsort(-sims[qi][idx])]
+                results.append((candidates[idx], sims[qi][idx]))
+            return results
+        best_rows = np.empty((m, 0), dtype=np.int64)
+        best_sims = np.empty((m, 0), dtype=np.float32)
+        for start in range(0, valid.shape[0], _SCAN_BLOCK):
+            block_valid = valid[start:start + _SCAN_BLOCK]
+            if not block_valid.any():
+                continue
+            sims = np.asarray(vectors[start:start + block_valid.shape[0]], dtype=np.float32) @ queries.T
+            sims[~block_valid] = -np.inf
+            sims = sims.T
+            kk = min(k, sims.shape[1])
+            idx = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+            best_rows = np.concatenate([best_rows, idx + start], axis=1)
+            best_sims = np.concatenate([best_sims, np.take_along_axis(sims, idx, axis=1)], axis=1)
+        results = []
+        for qi in range(m):
+            sims = best_sims[qi]
+            keep = np.isfinite(sims)
+            rows, sims = best_rows[qi][keep], sims[keep]
+            order = np.argsort(-sims)[:k]
+            results.append((rows[order], sims[order]))
+        return results
+
+
+def migrate_from_chroma(
+        collection_name: str = settings.COLLECTION_NAME,
+        persist_directory: Path = settings.PERSIST_DIRECTORY_VS,
+        page_size: int = 5000,
+    ) -> int:
+    """
+    copy every vector, text and metadata of a Chroma collection into the
+    native store of the same name. Ids are kept, so the index manifest and
+    lexical index of the collection stay valid. returns the number copied.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(persist_directory))
+    source = client.get_collection(name=collection_name)
+    target = NativeCollection(
+        Path(persist_directory) / "native" / collection_name,
+        metadata={k: v for k, v in (source.metadata or {}).items() if k != "hnsw:space"},
+    )
+    total = source.count()
+    copied = 0
+    while True:
+        batch = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=copied)
+        ids = batch.get("ids") or []
+        if not ids:
+            break
+        target.upsert(ids, np.asarray(batch["embeddings"], dtype=np.float32),
+                      batch.get("metadatas"), batch.get("documents"))
+        copied += len(ids)
+        print(f"Migrated {copied}/{total} vectors")
+    target.flush()
+    print(f"✅ Migrated {copied} vectors from Chroma collection '{collection_name}' to {target.dir}")
+    return copied
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="native vector store tools")
+    parser.add_argument("--migrate", action="store_true", help="copy a Chroma collection into the native store")
+    parser.add_argument("--collection", default=settings.COLLECTION_NAME)
+    parser.add_argument("--persist-directory", default=str(settings.PERSIST_DIRECTORY_VS))
+    args = parser.parse_args(argv)
+    if args.migrate:
+        migrate_from_chroma(args.collection, Path(args.persist_directory))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+from rag.core.config import settings
+
+
+class Reranker:
+    """
+    Cross-encoder reranking stage: scores every (query, chunk) pair in one
+    batched forward pass and keeps the best `top_k`.
+    Attributes:
+        model_name (str): CrossEncoder model to load.
+        max_length (int): max tokens per (query, chunk) pair; longer pairs are truncated.
+    """
+
+    def __init__(
+        self,
+        model_name: str = settings.RERANK_MODEL_NAME,
+        max_length: int = settings.RERANK_MAX_SEQ_LENGTH,
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.max_length = max_length
+        print(f"Loading Reranker Model: {model_name}")
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def rerank(self, query: str, hits: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        if not hits:
+            return []
+        pairs = [(query, h.get("content") or "") for h in hits]
+        scores = np.asarray(
+            self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False, convert_to_numpy=True),
+            dtype=np.float32,
+        ).ravel()
+        order = np.argsort(-scores)[:top_k]
+        out = []
+        for rank, i in enumerate(order.tolist(), start=1):
+            hit = dict(hits[i])
+            hit["rerank_score"] = float(scores[i])
+            hit["rank"] = rank
+            out.append(hit)
+        return out
@@ -1,18 +1,65 @@
-from typing import List, Dict, Any
+import hashlib
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 
 from rag.core.config import settings
+from rag.utility.cache import LRUCache
 
-from rag.pipeline.vector_store import VectorStore
+from rag.pipeline.vector_store import BaseVectorStore
 from rag.pipeline.embedder import Embedder
+from rag.pipeline.lexical_index import BM25Index
+from rag.pipeline.reranker import Reranker
+from rag.pipeline.exact_index import ExactIndex
+from rag.pipeline.filters import build_where, where_key
 
 class Retriever:
     """Handles query-based retrieval from the vector store"""
 
-    def __init__(self, vector_store: VectorStore, embedding_manager: Embedder):
+    def __init__(
+            self,
+            vector_store: BaseVectorStore,
+            embedding_manager: Embedder,
+            lexical_index: Optional[BM25Index] = None,
+        ):
         self.vector_store = vector_store
         self.embedding_manager = embedding_manager
+        # BM25 over the same chunks, used by mode="hybrid"
+        self.lexical_index = lexical_index
+        # cross-encoder, loaded on first rerank request
+        self.reranker: Optional[Reranker] = None
+        self._reranker_lock = threading.Lock()
+        # in-RAM brute-force index, loaded on first use (see _use_exact)
+        self.exact_index: Optional[ExactIndex] = None
+        self._exact_lock = threading.Lock()
+        self._exact_reloading = False
+        self._count_cache = (None, 0)
         md = getattr(self.vector_store.collection, "metadata", None) or {}
         self.metric = str(md.get("hnsw:space", "cosine")).lower()
+        # level 1: normalized query text -> embedding
+        self.query_cache = LRUCache(settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TTL_S)
+        # level 2: (embedding key, top_k, score_threshold) -> results,
+        # dropped whenever the vector store version moves
+        self.results_cache = LRUCache(settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_TTL_S)
+        self._results_version = getattr(self.vector_store, "version", 0)
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+    @staticmethod
+    def _embedding_key(q_emb) -> str:
+        return hashlib.sha1(np.asarray(q_emb, dtype=np.float32).tobytes()).hexdigest()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "query_embeddings": self.query_cache.stats(),
+            "retrieval_results": self.results_cache.stats(),
+        }
 
     def _to_similarity(self, distance: float) -> float:
         if self.metric == "cosine":
@@ -23,71 +70,430 @@ class Retriever:
             return -float(distance) 
         return -float(distance)
 
+    def embed_query(self, query: str):
+        """encode the query text (CPU-bound; run it in an executor from async code)"""
+        key = self._query_key(query)
+        q_emb = self.query_cache.get(key)
+        if q_emb is not None:
+            return q_emb
+        q_emb = self.embedding_manager.generate_embedding(query)
+        if hasattr(q_emb, "tolist"):
+            q_emb = q_emb.tolist()
+        self.query_cache.set(key, q_emb)
+        return q_emb
+
     def retrieve(
             self, 
             query: str, 
             top_k: int = settings.TOP_K, 
-            score_threshold: float = settings.SCORE_THRESHOLD
+            score_threshold: float = settings.SCORE_THRESHOLD,
+            mode: Optional[str] = None,
+            rerank: Optional[bool] = None,
+            exact: Optional[bool] = None,
+            filters: Optional[Dict[str, Any]] = None,
         ) -> List[Dict[str, Any]]:
-        
+        """
+        filters: restrict the search to chunks matching
+        source_name / file_sha256 (str or list), page_from / page_to (inclusive)
+        and uploaded_after / uploaded_before (datetime or epoch seconds);
+        applied inside the vector search, not after it.
+        """
         print(f"Retrieving documents for query: '{query}'")
         print(f"Top K: {top_k}, Score threshold: {score_threshold}")
 
         if not query or not query.strip():
             return []
 
-        q_emb = self.embedding_manager.generate_embedding(query)
-        if hasattr(q_emb, "tolist"):
-            q_emb = q_emb.tolist()
+        q_emb = self.embed_query(query)
+        return self.search(q_emb, top_k=top_k, score_threshold=score_threshold, query_text=query, mode=mode, rerank=rerank, exact=exact, filters=filters)
+
+    def _get_reranker(self) -> Reranker:
+        if self.reranker is None:
+            with self._reranker_lock:
+                if self.reranker is None:
+                    self.reranker = Reranker()
+        return self.reranker
+
+    def _use_exact(self, exact: Optional[bool]) -> bool:
+        """
+        exact=True forces brute-force search, False forces the store's ANN index,
+        None picks exact while the collection (as the store counts it, other
+        processes' writes included) has at most EXACT_SEARCH_MAX_CHUNKS chunks.
+        Either way the ANN index serves while the exact index is out of sync (see _exact_in_sync).
+        """
+        if exact is None:
+            limit = settings.EXACT_SEARCH_MAX_CHUNKS
+            if limit <= 0 or self._collection_count() > limit:
+                return False
+        elif not exact:
+            return False
+        self._get_exact_index()
+        return self._exact_in_sync()
+
+    def _exact_in_sync(self) -> bool:
+        """
+        whether the in-RAM exact index still mirrors the store. Writes made by
+        other processes (uvicorn workers, an indexing sidecar) never reach this
+        process's listener, so the generation the index reflects is compared with
+        the store's cross-process write generation (which also moves when a file
+        is replaced by as many chunks); if it is behind, the index is reloaded
+        in the background.
+        """
+        if self.exact_index.generation == self.vector_store.generation.value:
+            return True
+        with self._exact_lock:
+            if self._exact_reloading:
+                return False
+            self._exact_reloading = True
+
+        def _reload():
+            try:
+                self.exact_index.reload_from_collection(self.vector_store.collection, self.vector_store.generation)
+            except Exception as e:
+                print(f"!! Exact index reload failed: {e}")
+            finally:
+                self._exact_reloading = False
+
+        print("Exact index out of sync with the store, reloading; using ANN meanwhile")
+        threading.Thread(target=_reload, name="exact-index-reload", daemon=True).start()
+        return False
+
+    def _collection_count(self) -> int:
+        """collection size, re-read only when the store's cross-process generation moves"""
+        generation = self.vector_store.generation.value
+        cached_generation, count = self._count_cache
+        if cached_generation != generation:
+            count = self.vector_store.collection.count()
+            self._count_cache = (generation, count)
+        return count
+
+    def _get_exact_index(self) -> ExactIndex:
+        if self.exact_index is None:
+            with self._exact_lock:
+                if self.exact_index is None:
+                    # a retriever rebuilt by reload_components reuses the store's index
+                    index = self.vector_store.find_listener(ExactIndex)
+                    if index is None:
+                        index = ExactIndex()
+                        # subscribe first so writes during the load aren't missed
+                        self.vector_store.subscribe(index)
+                        index.load_from_collection(self.vector_store.collection, generation=self.vector_store.generation.value)
+                    self.exact_index = index
+        return self.exact_index
+
+    def _query_store(
+            self,
+            q_embs: List[Any],
+            n_results: int,
+            exact: bool,
+            where: Optional[Dict[str, Any]] = None,
+        ) -> Dict[str, Any]:
+        """
+        Chroma-shaped query result from the exact index or the store's ANN index;
+        `where` is pushed down into the index (Chroma metadata pre-filter,
+        bitmap in the native/exact indexes)
+        """
+        if exact:
+            return self._get_exact_index().query(q_embs, n_results=n_results, where=where)
+        kwargs = {"where": where} if where else {}
+        return self.vector_store.collection.query(
+            query_embeddings=q_embs,
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"],
+            **kwargs,
+        )
+
+    def measure_recall(self, queries: List[str], top_k: int = settings.TOP_K) -> Dict[str, float]:
+        """recall@top_k of the store's ANN index against exact search (ids only, no threshold)"""
+        q_embs = self.embed_queries(queries)
+        if not q_embs:
+            return {"queries": 0, "recall": 1.0}
+        ann = self._query_store(q_embs, top_k, exact=False)
+        index = self._get_exact_index()
+        if index.generation != self.vector_store.generation.value:
+            # ground truth must be current: reload in the foreground
+            index.reload_from_collection(self.vector_store.collection, self.vector_store.generation)
+        truth = self._query_store(q_embs, top_k, exact=True)
+        recalls = []
+        for got, want in zip(ann.get("ids") or [], truth.get("ids") or []):
+            if want:
+                recalls.append(len(set(got) & set(want)) / len(want))
+        recall = float(np.mean(recalls)) if recalls else 1.0
+        print(f"ANN recall@{top_k} over {len(recalls)} queries: {recall:.4f}")
+        return {"queries": len(recalls), "recall": recall}
+
+    def _resolve_mode(self, mode: Optional[str], query_text: Optional[str]) -> str:
+        mode = (mode or settings.RETRIEVAL_MODE).lower()
+        if mode == "hybrid" and (self.lexical_index is None or not query_text):
+            return "vector"
+        return mode
+
+    def search(
+            self,
+            q_emb,
+            top_k: int = settings.TOP_K,
+            score_threshold: float = settings.SCORE_THRESHOLD,
+            query_text: Optional[str] = None,
+            mode: Optional[str] = None,
+            rerank: Optional[bool] = None,
+            timings: Optional[Dict[str, float]] = None,
+            exact: Optional[bool] = None,
+            filters: Optional[Dict[str, Any]] = None,
+        ) -> List[Dict[str, Any]]:
+        """
+        search for an already-encoded query.
+        mode: "vector" (default, settings.RETRIEVAL_MODE) or "hybrid", which
+        also needs the raw `query_text` for the lexical side.
+        rerank: over-fetch top_k * RERANK_OVERFETCH candidates (capped by
+        RERANK_MAX_CANDIDATES), rescore them with the cross-encoder and cut to
+        top_k (default settings.RERANK_ENABLED; needs `query_text`).
+        timings: optional dict filled with per-stage milliseconds.
+        exact: brute-force search instead of the ANN index (default: automatic
+        by collection size, see _use_exact).
+        filters: metadata filters, see retrieve.
+        """
+        mode = self._resolve_mode(mode, query_text)
+        rerank = bool(settings.RERANK_ENABLED if rerank is None else rerank) and bool(query_text)
+        version = getattr(self.vector_store, "version", 0)
+        if version != self._results_version:
+            self.results_cache.clear()
+            self._results_version = version
+        try:
+            exact = self._use_exact(exact)
+        except Exception as e:
+            print(f"Exact index unavailable, using ANN: {e}")
+            exact = False
+        where = build_where(**filters) if filters else None
+        cache_key = (self._embedding_key(q_emb), top_k, score_threshold, version, exact, where_key(where))
+        if mode == "hybrid" or rerank:
+            cache_key += (mode, rerank, self._query_key(query_text))
+        cached = self.results_cache.get(cache_key)
+        if cached is not None:
+            if timings is not None:
+                timings["retrieval_cache_hit"] = 1.0
+            return list(cached)
 
+        n_fetch = top_k
+        if rerank:
+            n_fetch = max(top_k, min(top_k * settings.RERANK_OVERFETCH, settings.RERANK_MAX_CANDIDATES))
         try:
-            results = self.vector_store.collection.query(
-                query_embeddings=[q_emb],
-                n_results=top_k,
-                include=["documents", "metadatas", "distances"] 
-            )
-
-            docs_batches = results.get("documents") or []
-            if not docs_batches or not docs_batches[0]:
-                print("No documents found")
-                return []
-
-            documents = docs_batches[0]
-            metadatas = (results.get("metadatas") or [[]])[0] or [{}] * len(documents)
-            distances = (results.get("distances") or [[]])[0] or [float("inf")] * len(documents)
-            
-            ids       = (results.get("ids") or [[]])[0] or [None] * len(documents)
-
-            retrieved_docs: List[Dict[str, Any]] = []
-            for i, (doc_id, document, metadata, distance) in enumerate(zip(ids, documents, metadatas, distances)):
-                sim = self._to_similarity(distance)
-                if sim >= score_threshold:
-                    retrieved_docs.append({
-                        "id": doc_id,
-                        "content": document,
-                        "metadata": metadata or {},
-                        "similarity_score": sim,
-                        "distance": distance,
-                        "rank": i + 1
-                    })
-
-            
-            retrieved_docs.sort(key=lambda r: (-r["similarity_score"], r["rank"]))
+            t0 = time.perf_counter()
+            if mode == "hybrid":
+                results = self._hybrid_search(q_emb, query_text, top_k=n_fetch, score_threshold=score_threshold, exact=exact, where=where)
+            else:
+                results = self._search(q_emb, top_k=n_fetch, score_threshold=score_threshold, exact=exact, where=where)
+            if timings is not None:
+                timings["search_ms"] = (time.perf_counter() - t0) * 1000.0
+                timings["exact_search"] = float(exact)
+            if rerank:
+                t0 = time.perf_counter()
+                results = self._get_reranker().rerank(query_text, results, top_k)
+                if timings is not None:
+                    timings["rerank_ms"] = (time.perf_counter() - t0) * 1000.0
+                    timings["rerank_candidates"] = float(n_fetch)
+        except Exception as e:
+            print(f"Error during retrieval: {e}")
+            return []
+        # only cache if no write happened while we were searching
+        if getattr(self.vector_store, "version", 0) == version:
+            self.results_cache.set(cache_key, results)
+        return list(results)
+
+    def _search(
+            self,
+            q_emb,
+            top_k: int = settings.TOP_K,
+            score_threshold: float = settings.SCORE_THRESHOLD,
+            exact: bool = False,
+            where: Optional[Dict[str, Any]] = None,
+        ) -> List[Dict[str, Any]]:
+        results = self._query_store([q_emb], top_k, exact, where)
+        unique = self._to_results(results, 0, score_threshold)
+        print(f"Retrieved {len(unique)} documents (after filtering & dedup)")
+        return unique
+
+    def _hybrid_search(
+            self,
+            q_emb,
+            query_text: str,
+            top_k: int = settings.TOP_K,
+            score_threshold: float = settings.SCORE_THRESHOLD,
+            exact: bool = False,
+            where: Optional[Dict[str, Any]] = None,
+        ) -> List[Dict[str, Any]]:
+        """
+        Fuse the vector ranking and the BM25 ranking with reciprocal rank fusion.
+        Vector candidates still honour `score_threshold`; lexical candidates are
+        kept on their lexical match (exact drug names / gene symbols / ICD codes
+        are exactly what the embedding misses), with their cosine similarity
+        computed from the stored embedding for reporting.
+        """
+        n_cand = max(top_k, settings.HYBRID_CANDIDATES)
+        vec_hits = self._search(q_emb, top_k=n_cand, score_threshold=score_threshold, exact=exact, where=where)
+        lex_hits = self.lexical_index.search(query_text, top_k=n_cand)
+
+        fused: Dict[str, float] = defaultdict(float)
+        for rank, r in enumerate(vec_hits):
+            fused[r["id"]] += 1.0 / (settings.RRF_K + rank + 1)
+        lex_scores: Dict[str, float] = {}
+        for rank, (vec_id, score) in enumerate(lex_hits):
+            fused[vec_id] += 1.0 / (settings.RRF_K + rank + 1)
+            lex_scores[vec_id] = score
+
+        by_id = {r["id"]: r for r in vec_hits}
+        missing = [vec_id for vec_id, _ in lex_hits if vec_id not in by_id]
+        if missing:
+            # BM25 doesn't know the filter: lexical-only hits are re-checked against it here
+            by_id.update(self._fetch_hits(missing, q_emb, where))
+
+        ranked = sorted((i for i in fused if i in by_id), key=lambda i: -fused[i])[:top_k]
+        out = []
+        for rank, vec_id in enumerate(ranked, start=1):
+            hit = dict(by_id[vec_id])
+            hit["rank"] = rank
+            hit["rrf_score"] = fused[vec_id]
+            hit["lexical_score"] = lex_scores.get(vec_id)
+            out.append(hit)
+        print(f"Hybrid retrieval: {len(vec_hits)} vector + {len(lex_hits)} lexical -> {len(out)} fused")
+        return out
+
+    def _fetch_hits(self, ids: List[str], q_emb, where: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """load stored chunks by id (and `where`) and score them against the query embedding"""
+        kwargs = {"where": where} if where else {}
+        got = self.vector_store.collection.get(ids=ids, include=["documents", "metadatas", "embeddings"], **kwargs)
+        q = np.asarray(q_emb, dtype=np.float32)
+        qn = float(np.linalg.norm(q)) or 1.0
+        hits: Dict[str, Dict[str, Any]] = {}
+        embs = got.get("embeddings")
+        if embs is None:
+            embs = [None] * len(got.get("ids") or [])
+        for vec_id, doc, meta, emb in zip(got.get("ids") or [], got.get("documents") or [], got.get("metadatas") or [], embs):
+            sim = 0.0
+            if emb is not None:
+                e = np.asarray(emb, dtype=np.float32)
+                sim = float(e @ q) / ((float(np.linalg.norm(e)) or 1.0) * qn)
+            hits[vec_id] = {
+                "id": vec_id,
+                "content": doc,
+                "metadata": meta or {},
+                "similarity_score": sim,
+                "distance": 1.0 - sim,
+                "rank": None,
+            }
+        return hits
+
+    def _to_results(self, results: Dict[str, Any], qi: int, score_threshold: float) -> List[Dict[str, Any]]:
+        """turn the `qi`-th query of a Chroma query response into filtered, deduped hits"""
+        docs_batches = results.get("documents") or []
+        if len(docs_batches) <= qi or not docs_batches[qi]:
+            return []
+
+        documents = docs_batches[qi]
+        metadatas = (results.get("metadatas") or [[]] * len(docs_batches))[qi] or [{}] * len(documents)
+        distances = (results.get("distances") or [[]] * len(docs_batches))[qi] or [float("inf")] * len(documents)
+        
+        ids       = (results.get("ids") or [[]] * len(docs_batches))[qi] or [None] * len(documents)
+
+        retrieved_docs: List[Dict[str, Any]] = []
+        for i, (doc_id, document, metadata, distance) in enumerate(zip(ids, documents, metadatas, distances)):
+            sim = self._to_similarity(distance)
+            if sim >= score_threshold:
+                retrieved_docs.append({
+                    "id": doc_id,
+                    "content": document,
+                    "metadata": metadata or {},
+                    "similarity_score": sim,
+                    "distance": distance,
+                    "rank": i + 1
+                })
 
         
-            seen = set()
-            unique = []
-            for r in retrieved_docs:
-                m = r.get("metadata") or {}
-                sig = (r["content"], m.get("page"), m.get("source_file") or m.get("source"))
-                if sig in seen:
-                    continue
-                seen.add(sig)
-                unique.append(r)
-
-            print(f"Retrieved {len(unique)} documents (after filtering & dedup)")
-            return unique
+        retrieved_docs.sort(key=lambda r: (-r["similarity_score"], r["rank"]))
 
+        
+        seen = set()
+        unique = []
+        for r in retrieved_docs:
+            m = r.get("metadata") or {}
+            sig = (r["content"], m.get("page"), m.get("source_file") or m.get("source"))
+            if sig in seen:
+                continue
+            seen.add(sig)
+            unique.append(r)
+        return unique
+
+    def embed_queries(self, queries: List[str]) -> List[Any]:
+        """
+        batch form of embed_query: cached queries are served from the query
+        cache, all the others are encoded in a single model.encode call
+        """
+        out: List[Any] = [None] * len(queries)
+        keys = [self._query_key(q) for q in queries]
+        misses: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                out[i] = cached
+            else:
+                misses.setdefault(key, []).append(i)
+        if misses:
+            miss_keys = list(misses)
+            embs = self.embedding_manager.generate_query_embeddings([queries[misses[k][0]] for k in miss_keys])
+            for key, emb in zip(miss_keys, embs):
+                emb = emb.tolist()
+                self.query_cache.set(key, emb)
+                for i in misses[key]:
+                    out[i] = emb
+        return out
+
+    def search_batch(
+            self,
+            q_embs: List[Any],
+            top_k: int = settings.TOP_K,
+            score_threshold: float = settings.SCORE_THRESHOLD,
+            query_texts: Optional[List[str]] = None,
+            mode: Optional[str] = None,
+            rerank: Optional[bool] = None,
+            exact: Optional[bool] = None,
+            filters: Optional[Dict[str, Any]] = None,
+        ) -> List[List[Dict[str, Any]]]:
+        """
+        batch form of search: results-cache misses go to the store as one
+        query with many embeddings (split into BATCH_QUERY_CHUNK-sized calls).
+        Hybrid mode and reranking work per question, so they fall back to
+        `search` per item.
+        """
+        rerank = bool(settings.RERANK_ENABLED if rerank is None else rerank)
+        if query_texts is not None and (rerank or self._resolve_mode(mode, "x") == "hybrid"):
+            return [
+                self.search(e, top_k=top_k, score_threshold=score_threshold, query_text=q, mode=mode, rerank=rerank, exact=exact, filters=filters)
+                for e, q in zip(q_embs, query_texts)
+            ]
+        version = getattr(self.vector_store, "version", 0)
+        try:
+            exact = self._use_exact(exact)
         except Exception as e:
-            print(f"Error during retrieval: {e}")
-            return []
\ No newline at end of file
+            print(f"Exact index unavailable, using ANN: {e}")
+            exact = False
+        where = build_where(**filters) if filters else None
+        wkey = where_key(where)
+        out: List[List[Dict[str, Any]]] = [[] for _ in q_embs]
+        cache_keys = [(self._embedding_key(e), top_k, score_threshold, version, exact, wkey) for e in q_embs]
+        pending: List[int] = []
+        for i, key in enumerate(cache_keys):
+            cached = self.results_cache.get(key)
+            if cached is not None:
+                out[i] = list(cached)
+            else:
+                pending.append(i)
+
+        step = max(1, settings.BATCH_QUERY_CHUNK)
+        for start in range(0, len(pending), step):
+            idx = pending[start:start + step]
+            results = self._query_store([q_embs[i] for i in idx], top_k, exact, where)
+            for qi, i in enumerate(idx):
+                hits = self._to_results(results, qi, score_threshold)
+                out[i] = hits
+                if getattr(self.vector_store, "version", 0) == version:
+                    self.results_cache.set(cache_keys[i], hits)
+        return out
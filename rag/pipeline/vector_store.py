@@ -1,13 +1,27 @@
+import json
 import os
-from typing import List, Any, Optional, Dict
-import chromadb
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Any, Optional, Dict
 import numpy as np
 from pathlib import Path
 
 from rag.utility.helpers import make_vector_id
+from rag.pipeline.generation import WriteGeneration
 from rag.core.config import settings
 
-class VectorStore:
+class BaseVectorStore:
+    """
+    Backend-independent part of the vector store: id/metadata normalization,
+    batched upserts, deletes, the write version and secondary-index listeners.
+    Backends implement `_initialize_store`, which sets `self.collection` to an
+    object with the Chroma collection API subset used here and by the
+    Retriever: upsert/get/query/delete/count and a `metadata` dict.
+    """
+    backend = "base"
+
     def __init__(
         self,
         collection_name:str=settings.COLLECTION_NAME,
@@ -17,34 +31,86 @@ class VectorStore:
         self.collection_name = collection_name
         self.persist_directory = persist_directory
         self.embedder_model_name = embedder_model_name
-        self.client: Optional[chromadb.Client] = None
-        self.collection = None
+        self.client: Any = None
+        self.collection: Any = None
+        self._accepts_ndarray = True
+        # bumped on every write; readers (e.g. Retriever caches) compare it to
+        # detect that cached results may be stale
+        self.version = 0
+        self._version_lock = threading.Lock()
+        # the same counter across processes (see WriteGeneration)
+        self.generation = WriteGeneration.for_collection(collection_name, persist_directory)
+        # secondary indexes kept in sync with writes (see subscribe)
+        self._listeners: List[Any] = []
         self._initialize_store()
 
     def _initialize_store(self):
-        os.makedirs(self.persist_directory, exist_ok=True)
-        self.client = chromadb.PersistentClient(path=self.persist_directory)
+        raise NotImplementedError
 
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={
-                "description": "documents for medical RAG project",
-                "hnsw:space": "cosine",                 
-                "embedder_model": self.embedder_model_name 
-            },
-        )
-        print(f"Vector Store initialized. Collection: {self.collection_name}")
+    def subscribe(self, listener: Any):
+        """
+        Register a secondary index to be kept in sync with this store.
+        `listener` implements on_upsert(ids, documents, metadatas, embeddings)
+        and on_delete(ids); both are called after the write succeeded.
+        Listeners tracking the cross-process generation may also implement
+        on_generation(generation), called after each write of this process.
+        """
+        self._listeners.append(listener)
+
+    def find_listener(self, kind: type) -> Optional[Any]:
+        """the first subscribed listener of type `kind`, if any"""
+        for listener in self._listeners:
+            if isinstance(listener, kind):
+                return listener
+        return None
+
+    def flush(self):
+        """persist secondary indexes (called at the end of an indexing run)"""
+        for listener in self._listeners:
+            if hasattr(listener, "flush"):
+                try:
+                    listener.flush()
+                except Exception as e:
+                    print(f"!! {type(listener).__name__}.flush failed: {e}")
+
+    def _notify(self, event: str, *args):
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception as e:
+                print(f"!! {type(listener).__name__}.{event} failed: {e}")
+
+    def _bump_version(self):
+        with self._version_lock:
+            self.version += 1
+            generation = self.generation.bump()
+        for listener in self._listeners:
+            if hasattr(listener, "on_generation"):
+                try:
+                    listener.on_generation(generation)
+                except Exception as e:
+                    print(f"!! {type(listener).__name__}.on_generation failed: {e}")
+
+    def max_batch_size(self) -> int:
+        """upsert batch size: settings.UPSERT_BATCH_SIZE capped by the client's limit"""
+        limit = None
+        getter = getattr(self.client, "get_max_batch_size", None)
         try:
-            print(f"Existing items in collection: {self.collection.count()}")
+            limit = getter() if callable(getter) else getattr(self.client, "max_batch_size", None)
         except Exception:
-            pass
-
+            limit = None
+        size = settings.UPSERT_BATCH_SIZE
+        if limit:
+            size = min(size, int(limit))
+        return max(1, size)
 
     def add_documents(self, documents: List[Any], embeddings: np.ndarray):
         """
         Add or update vectors in the collection with deterministic IDs.
         - documents: List[langchain.schema.Document]
         - embeddings: np.ndarray of shape (N, D)
+        Sent in batches of `max_batch_size()`; embeddings go to Chroma as
+        float32 array slices rather than per-row Python float lists.
         """
         if documents is None or len(documents) == 0:
             print("No documents to add. Skipping.")
@@ -53,13 +119,15 @@ class VectorStore:
             raise ValueError("Number of documents must match number of embeddings")
 
         print(f"Upserting {len(documents)} chunks to vector store...")
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
 
         ids: List[str] = []
         metadatas: List[Dict] = []
         documents_text: List[str] = []
-        embeddings_list: List[List[float]] = []
+        # upload time, for the uploaded_after/uploaded_before retrieval filters
+        ingested_at = int(time.time())
 
-        for i, (doc, emb) in enumerate(zip(documents, embeddings)):
+        for i, doc in enumerate(documents):
             meta = dict(getattr(doc, "metadata", {}) or {})
 
             # Normalize/alias a few helpful fields
@@ -70,47 +138,86 @@ class VectorStore:
 
             meta["doc_index"] = i
             meta["content_length"] = len(getattr(doc, "page_content", "") or "")
+            meta["ingested_at"] = ingested_at
 
             vec_id = make_vector_id(meta)
             ids.append(vec_id)
             metadatas.append(meta)
             documents_text.append(getattr(doc, "page_content", "") or "")
-            embeddings_list.append(emb.tolist() if hasattr(emb, "tolist") else list(emb))
 
         # Sanity: ensure IDs are unique in this batch
         if len(ids) != len(set(ids)):
             raise ValueError("Deterministic ID collision detected. Check loader/splitter metadata (file_sha256/page/chunk_id).")
 
+        batch_size = self.max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self._upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+                documents=documents_text[start:end],
+            )
+
+        self._bump_version()
+        print(f"✅ Upserted {len(documents)} chunks.")
+        try:
+            print(f"Total items in collection: {self.collection.count()}")
+        except Exception:
+            pass
+
+    def _upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict], documents: List[str]):
         payload = dict(
             ids=ids,
-            embeddings=embeddings_list,
+            embeddings=embeddings if self._accepts_ndarray else embeddings.tolist(),
             metadatas=metadatas,
-            documents=documents_text,
+            documents=documents,
         )
 
         # Prefer upsert if available
         if hasattr(self.collection, "upsert"):
-            self.collection.upsert(**payload)
+            try:
+                self.collection.upsert(**payload)
+            except (TypeError, ValueError):
+                if not isinstance(payload["embeddings"], np.ndarray):
+                    raise
+                # older Chroma only validates list-of-lists embeddings
+                self._accepts_ndarray = False
+                payload["embeddings"] = payload["embeddings"].tolist()
+                self.collection.upsert(**payload)
         else:
             # Fallback for older Chroma: delete then add
             try:
                 self.collection.delete(ids=ids)
             except Exception:
                 pass
+            if isinstance(payload["embeddings"], np.ndarray):
+                payload["embeddings"] = payload["embeddings"].tolist()
             self.collection.add(**payload)
+        self._notify("on_upsert", ids, documents, metadatas, embeddings)
 
-        print(f"✅ Upserted {len(documents)} chunks.")
-        try:
-            print(f"Total items in collection: {self.collection.count()}")
-        except Exception:
-            pass
+    def delete_ids(self, ids: List[str], batch_size: int = 5000):
+        """Delete vectors by id (e.g. stale chunks of a modified/removed file)."""
+        ids = list(ids or [])
+        for start in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[start:start + batch_size])
+        if ids:
+            self._bump_version()
+            self._notify("on_delete", ids)
+            print(f"Deleted {len(ids)} stale vectors")
 
     def delete_by_source(self, source_path: str):
         """Delete all items from a specific absolute source path."""
         source_abs = str(Path(source_path).resolve())
         try:
             # Chroma filtering API varies by version; adapt as needed:
+            ids = []
+            if self._listeners:
+                ids = self.collection.get(where={"source_file": source_abs}, include=[]).get("ids") or []
             self.collection.delete(where={"source_file": source_abs})
+            self._bump_version()
+            if ids:
+                self._notify("on_delete", ids)
             print(f"Deleted items where source_file == {source_abs}")
         except Exception as e:
             print(f"Delete by source failed: {e}")
@@ -120,3 +227,175 @@ class VectorStore:
             print("Collection count:", self.collection.count())
         except Exception as e:
             print("Stats error:", e)
+
+
+class VectorStore(BaseVectorStore):
+    """Chroma PersistentClient backend"""
+    backend = "chroma"
+
+    def _initialize_store(self):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        self.client = _chroma_client(self.persist_directory)
+
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={
+                "description": "documents for medical RAG project",
+                "hnsw:space": "cosine",                 
+                "embedder_model": self.embedder_model_name 
+            },
+        )
+        print(f"Vector Store initialized. Collection: {self.collection_name}")
+        try:
+            print(f"Existing items in collection: {self.collection.count()}")
+        except Exception:
+            pass
+
+
+class NativeVectorStore(BaseVectorStore):
+    """
+    In-process backend: memory-mapped vectors + IVF-flat index + columnar
+    metadata (see rag.pipeline.native_store), stored under
+    <persist_directory>/native/<collection_name>.
+    """
+    backend = "native"
+
+    def _initialize_store(self):
+        from rag.pipeline.native_store import NativeCollection
+
+        self.collection = NativeCollection(
+            Path(self.persist_directory) / "native" / self.collection_name,
+            metadata={
+                "description": "documents for medical RAG project",
+                "embedder_model": self.embedder_model_name,
+            },
+        )
+        print(f"Vector Store initialized (native). Collection: {self.collection_name}")
+        print(f"Existing items in collection: {self.collection.count()}")
+
+    def flush(self):
+        """compact / train the IVF index, then persist secondary indexes"""
+        self.collection.flush()
+        super().flush()
+
+
+def _chroma_client(persist_directory: Path):
+    """
+    PersistentClient for `persist_directory`. With a collections memory budget,
+    Chroma unloads the HNSW segments of least recently used collections itself.
+    (every client on one path in a process must pass the same settings)
+    """
+    import chromadb
+    from chromadb.config import Settings as ChromaSettings
+
+    kwargs: Dict[str, Any] = {}
+    if settings.COLLECTIONS_MEMORY_BUDGET_MB > 0:
+        kwargs["settings"] = ChromaSettings(
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=settings.COLLECTIONS_MEMORY_BUDGET_MB * 1024 * 1024,
+        )
+    return chromadb.PersistentClient(path=str(persist_directory), **kwargs)
+
+
+def collection_exists(
+        collection_name:str,
+        persist_directory:Path=settings.PERSIST_DIRECTORY_VS,
+        backend:Optional[str]=None,
+    ) -> bool:
+    """whether `collection_name` was ever created in the store (without creating it)"""
+    backend = (backend or settings.VECTOR_STORE_BACKEND).lower()
+    if backend == "native":
+        return (Path(persist_directory) / "native" / collection_name).is_dir()
+    if not Path(persist_directory).is_dir():
+        return False
+    # chromadb < 0.6 returns Collection objects, later versions plain names
+    names = {getattr(c, "name", c) for c in _chroma_client(persist_directory).list_collections()}
+    return collection_name in names
+
+
+def stored_embedder_model(
+        collection_name:str,
+        persist_directory:Path=settings.PERSIST_DIRECTORY_VS,
+        backend:Optional[str]=None,
+    ) -> Optional[str]:
+    """`embedder_model` recorded in an existing collection's metadata (None if absent), without opening it for writes"""
+    backend = (backend or settings.VECTOR_STORE_BACKEND).lower()
+    if backend == "native":
+        info = Path(persist_directory) / "native" / collection_name / "info.json"
+        if not info.exists():
+            return None
+        return (json.loads(info.read_text(encoding="utf-8")).get("metadata") or {}).get("embedder_model")
+    if not collection_exists(collection_name, persist_directory, backend):
+        return None
+    collection = _chroma_client(persist_directory).get_collection(collection_name)
+    return (collection.metadata or {}).get("embedder_model")
+
+
+def drop_collection(
+        collection_name:str,
+        persist_directory:Path=settings.PERSIST_DIRECTORY_VS,
+        backend:Optional[str]=None,
+    ):
+    """delete a collection and its vectors from the store (no-op if it doesn't exist)"""
+    backend = (backend or settings.VECTOR_STORE_BACKEND).lower()
+    if backend == "native":
+        shutil.rmtree(Path(persist_directory) / "native" / collection_name, ignore_errors=True)
+        return
+    if collection_exists(collection_name, persist_directory, backend):
+        _chroma_client(persist_directory).delete_collection(collection_name)
+
+
+def create_vector_store(
+        collection_name:str=settings.COLLECTION_NAME,
+        persist_directory:Path=settings.PERSIST_DIRECTORY_VS,
+        embedder_model_name:Optional[str]=settings.EMBEDDER_MODEL_NAME,
+        backend:Optional[str]=None,
+    ) -> BaseVectorStore:
+    """vector store for settings.VECTOR_STORE_BACKEND (or `backend`): chroma or native"""
+    backend = (backend or settings.VECTOR_STORE_BACKEND).lower()
+    stores = {"chroma": VectorStore, "native": NativeVectorStore}
+    if backend not in stores:
+        raise ValueError(f"unknown vector store backend: {backend}")
+    return stores[backend](
+        collection_name=collection_name,
+        persist_directory=persist_directory,
+        embedder_model_name=embedder_model_name,
+    )
+
+
+class BackgroundUpserter:
+    """
+    Single-thread writer that overlaps the upsert of batch N with whatever the
+    caller does next (typically embedding batch N+1).
+    At most one batch is in flight: `submit` waits for the previous upsert,
+    so memory stays bounded and upsert errors surface on the next call.
+    """
+
+    def __init__(self, vector_store: BaseVectorStore, on_upserted: Optional[Callable[[int], None]] = None):
+        self.vector_store = vector_store
+        self.on_upserted = on_upserted
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upsert")
+        self._inflight: Optional[Future] = None
+
+    def _write(self, documents: List[Any], embeddings: np.ndarray):
+        self.vector_store.add_documents(documents, embeddings)
+        self.completed += len(documents)
+        if self.on_upserted is not None:
+            self.on_upserted(len(documents))
+
+    def submit(self, documents: List[Any], embeddings: np.ndarray):
+        self.wait()
+        self._inflight = self._executor.submit(self._write, documents, embeddings)
+
+    def wait(self):
+        """block until the in-flight batch (if any) is written; re-raises its error"""
+        if self._inflight is not None:
+            fut, self._inflight = self._inflight, None
+            fut.result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+from rag.core.config import settings
+from rag.api.services.components import registry
+from rag.api.services.indexing import build_index_for_files, delete_source
+from rag.api.services.reindex import drop_physical
+from rag.pipeline.manifest import IndexManifest
+
+# delete -> re-upload round trip on a scratch collection: the re-uploaded PDF
+# must be re-embedded, not planned as "unchanged" from a stale manifest entry
+# usage: python -m rag.test.delete_reupload_dev [path/to/file.pdf]
+
+COLLECTION = "delete_roundtrip_dev"
+
+pdf = Path(sys.argv[1]) if len(sys.argv) > 1 else next(settings.DATA_DIR.glob("**/*.pdf"))
+pdf = pdf.resolve()
+manifest_path = IndexManifest.for_collection(COLLECTION, settings.PERSIST_DIRECTORY_VS).path
+
+try:
+    added, total = build_index_for_files([pdf], collection=COLLECTION)
+    assert added > 0, "first upload indexed nothing"
+    print(f"✅ indexed {pdf.name}: {added} vectors")
+
+    delete_source(pdf, collection=COLLECTION)
+    assert str(pdf) not in IndexManifest(manifest_path).entries, "manifest entry survived the delete"
+    print("✅ delete removed the manifest entry")
+
+    readded, total_after = build_index_for_files([pdf], collection=COLLECTION)
+    assert readded == added and total_after == total, f"re-upload added {readded} of {added} vectors"
+    print(f"✅ re-upload re-embedded {readded} vectors")
+finally:
+    registry.close_all()
+    drop_physical(COLLECTION)
@@ -0,0 +1,25 @@
+import sys
+
+from rag.pipeline.embedder import check_backend_parity
+
+# compare an ONNX backend against torch before switching EMBEDDER_BACKEND
+# usage: python -m rag.test.embedder_parity_dev [onnx|onnx-int8]
+
+backend = sys.argv[1] if len(sys.argv) > 1 else "onnx-int8"
+
+texts = [
+    "What is an anti-aging intervention?",
+    "Caloric restriction extends lifespan in several model organisms.",
+    "Metformin is a first-line medication for type 2 diabetes.",
+    "Senolytic drugs selectively clear senescent cells.",
+    "Regular aerobic exercise improves cardiovascular health.",
+    "Rapamycin inhibits the mTOR pathway.",
+    "Sleep deprivation impairs memory consolidation.",
+    "Chronic inflammation is associated with many age-related diseases.",
+]
+
+report = check_backend_parity(texts, backend=backend)
+if report["min_cosine"] < 0.99:
+    print(f"⚠️  {backend} drifts from torch (min cosine {report['min_cosine']:.4f}); reindex after switching")
+else:
+    print(f"✅ {backend} vectors are compatible with the torch index")
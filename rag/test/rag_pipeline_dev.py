@@ -114,9 +114,9 @@ for h in hits:
     print(f"{h['similarity_score']:.3f} | page {m.get('page')} | {m.get('source_name')}")
 
 # 7) GROK LLM output generation
-# answer = RAG_Simple_Grok("What is an anti-aging intervention?", retriever)
+# answer = RAG_Simple_Grok(query, hits)
 # print("\nFinal Answer:\n", answer)
 
 # # 7) HF Endpoint output generation
-answer = RAG_Simple_HF(query, retriever=retriever)
+answer = RAG_Simple_HF(query, results=hits)
 print(f"\n FINAL ANSWER {answer}")
@@ -1,4 +1,5 @@
 import hashlib
+import os
 from pathlib import Path
 from typing import Iterable, Tuple, List, Dict, Any
 from langchain_core.documents import Document
@@ -100,4 +101,33 @@ def format_context(results: List[Dict[str, Any]], max_ctx_chars: int) -> str:
             continue
         parts.append(f"[{i}] {text}")
     ctx = "\n\n".join(parts)
-    return ctx[:max_ctx_chars]
\ No newline at end of file
+    return ctx[:max_ctx_chars]
+
+
+def pid_alive(pid) -> bool:
+    """whether process `pid` still exists on this host (owner checks for cross-process state)"""
+    try:
+        pid = int(pid)
+    except (TypeError, ValueError):
+        return False
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, owned by another user
+        return True
+    return True
+
+
+def set_torch_threads(num_threads) -> None:
+    """
+    set torch's intra-op thread count. It is process-wide (embedder and
+    reranker share it), so it is applied once at process startup
+    """
+    if not num_threads:
+        return
+    import torch
+    torch.set_num_threads(int(num_threads))